@@ -0,0 +1,31 @@
+"""Resumo das sessões de chat
+
+Revision ID: 41c9e0d3b8a7
+Revises: 6aa5924b5bc2
+Create Date: 2026-10-17 11:20:43.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '41c9e0d3b8a7'
+down_revision: Union[str, None] = '6aa5924b5bc2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Contexto acumulado do chat: resumo das conversas antigas e até onde ele vai
+    op.add_column('sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('sessions', sa.Column('summarized_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sessions', 'summarized_until')
+    op.drop_column('sessions', 'summary')
@@ -0,0 +1,49 @@
+"""Tabela budget_jobs
+
+Revision ID: 6aa5924b5bc2
+Revises: d2fc7a80904c
+Create Date: 2026-10-17 10:02:11.540913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6aa5924b5bc2'
+down_revision: Union[str, None] = 'd2fc7a80904c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fila persistente dos orçamentos gerados em segundo plano
+    op.create_table(
+        'budget_jobs',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=False),
+        sa.Column('output_format', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('artifact_path', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_budget_jobs_id', 'budget_jobs', ['id'])
+    op.create_index('ix_budget_jobs_user_id', 'budget_jobs', ['user_id'])
+    op.create_index('ix_budget_jobs_status', 'budget_jobs', ['status'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_budget_jobs_status', table_name='budget_jobs')
+    op.drop_index('ix_budget_jobs_user_id', table_name='budget_jobs')
+    op.drop_index('ix_budget_jobs_id', table_name='budget_jobs')
+    op.drop_table('budget_jobs')
@@ -0,0 +1,29 @@
+"""Status do título da sessão
+
+Revision ID: 9b27f4e1c6d5
+Revises: 41c9e0d3b8a7
+Create Date: 2026-10-17 11:58:06.402517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b27f4e1c6d5'
+down_revision: Union[str, None] = '41c9e0d3b8a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Sessões existentes já têm o título definitivo
+    op.add_column('sessions', sa.Column('title_status', sa.String(), nullable=False, server_default='final'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sessions', 'title_status')
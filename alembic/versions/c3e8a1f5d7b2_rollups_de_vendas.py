@@ -0,0 +1,61 @@
+"""Rollups de vendas
+
+Revision ID: c3e8a1f5d7b2
+Revises: 9b27f4e1c6d5
+Create Date: 2026-10-17 14:21:37.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a1f5d7b2'
+down_revision: Union[str, None] = '9b27f4e1c6d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Agregados diários das vendas aprovadas, usados pela análise de tendências
+    op.create_table(
+        'sales_rollup_days',
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('approved_count', sa.Integer(), nullable=False),
+        sa.Column('total_value', sa.Float(), nullable=False),
+    )
+    op.create_table(
+        'sales_rollup_items',
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('kind', sa.String(), primary_key=True),
+        sa.Column('name', sa.Text(), primary_key=True),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'sales_rollup_users',
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('user_name', sa.Text(), nullable=True),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    state = op.create_table(
+        'sales_rollup_state',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('watermark', sa.DateTime(), nullable=True),
+        sa.Column('last_sync_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_full_sync_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    # Sem watermark o primeiro sync carrega todo o histórico
+    op.bulk_insert(state, [{'id': 1}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sales_rollup_state')
+    op.drop_table('sales_rollup_users')
+    op.drop_table('sales_rollup_items')
+    op.drop_table('sales_rollup_days')
@@ -0,0 +1,32 @@
+"""Índices compostos para o histórico do chat
+
+Revision ID: d2fc7a80904c
+Revises: 7ae593497572
+Create Date: 2026-10-17 09:12:40.118274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2fc7a80904c'
+down_revision: Union[str, None] = '7ae593497572'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Paginação das sessões do usuário por (created_at, id)
+    op.create_index('ix_sessions_user_id_created_at', 'sessions', ['user_id', 'created_at'])
+    # Busca em lote das conversas das sessões, já na ordem de exibição
+    op.create_index('ix_conversations_session_id_created_at', 'conversations', ['session_id', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conversations_session_id_created_at', table_name='conversations')
+    op.drop_index('ix_sessions_user_id_created_at', table_name='sessions')
@@ -0,0 +1,28 @@
+"""Cache nos jobs de orçamento
+
+Revision ID: e5b1c9a4f2d8
+Revises: c3e8a1f5d7b2
+Create Date: 2026-10-17 16:20:41.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b1c9a4f2d8'
+down_revision: Union[str, None] = 'c3e8a1f5d7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('budget_jobs', sa.Column('use_cache', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('budget_jobs', 'use_cache')
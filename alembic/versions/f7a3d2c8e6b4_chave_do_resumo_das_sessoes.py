@@ -0,0 +1,29 @@
+"""Chave do resumo das sessões
+
+Revision ID: f7a3d2c8e6b4
+Revises: e5b1c9a4f2d8
+Create Date: 2026-10-17 16:48:12.530974
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a3d2c8e6b4'
+down_revision: Union[str, None] = 'e5b1c9a4f2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Desempate de `summarized_until`: id da última conversa incorporada ao resumo
+    op.add_column('sessions', sa.Column('summarized_until_id', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sessions', 'summarized_until_id')
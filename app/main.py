@@ -1,4 +1,7 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -6,20 +9,53 @@ import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 from routers import chat, analysis_router, pdf_router, customer_router
+import database
+import telemetry
+from services import budget_store, job_service, render_service, sales_rollup_service
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A verificação dos bancos roda em segundo plano para não atrasar o startup
+    connection_check = asyncio.create_task(database.check_connections())
+    job_service.start()
+    render_service.start()
+    job_maintenance = asyncio.create_task(job_service.run_maintenance())
+    budget_store_gc = asyncio.create_task(budget_store.run_garbage_collector())
+    rollup_sync = None
+    if sales_rollup_service.SALES_ROLLUPS_ENABLED and database.AsyncExternalSessionLocal:
+        rollup_sync = asyncio.create_task(sales_rollup_service.run_sync())
+    yield
+    connection_check.cancel()
+    job_maintenance.cancel()
+    budget_store_gc.cancel()
+    if rollup_sync:
+        rollup_sync.cancel()
+    job_service.shutdown()
+    render_service.shutdown()
+    await database.dispose_engines()
 
-os.makedirs("app/static/budgets", exist_ok=True)
+app = FastAPI(lifespan=lifespan)
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Tempo das queries de todos os engines (fase "db" do Server-Timing)
+for engine in (database.engine, database.async_engine, database.external_engine, database.async_external_engine):
+    if engine is not None:
+        telemetry.instrument_engine(engine)
+
+os.makedirs(budget_store.BUDGETS_DIR, exist_ok=True)
+
+app.mount("/static", StaticFiles(directory=budget_store.STATIC_DIR), name="static")
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # Permite que o front leia os tempos de cada fase (DevTools / Resource Timing)
+    expose_headers=["Server-Timing"],
 )
 
+app.add_middleware(telemetry.TimingMiddleware)
+
 app.include_router(chat.router, prefix="/chat")
 
 app.include_router(analysis_router.router)
@@ -28,6 +64,11 @@ app.include_router(pdf_router.router)
 
 app.include_router(customer_router.router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas no formato do Prometheus (por worker)."""
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "API de Orçamentos de Móveis - Online"}
\ No newline at end of file
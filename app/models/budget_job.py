@@ -0,0 +1,21 @@
+from sqlalchemy import Boolean, Column, String, Text, DateTime, func, true
+from database import Base
+import uuid
+
+class BudgetJob(Base):
+    __tablename__ = "budget_jobs"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, index=True, nullable=False)
+    customer_id = Column(String, nullable=False)
+    description = Column(Text, nullable=False)
+    output_format = Column(String, nullable=False)
+    use_cache = Column(Boolean, nullable=False, default=True, server_default=true())
+    # queued -> running -> succeeded | failed; succeeded -> expired quando o arquivo é removido
+    status = Column(String, nullable=False, default="queued", index=True)
+    error = Column(Text)
+    artifact_path = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True))
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, func
 from database import Base
 import uuid
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_session_id_created_at", "session_id", "created_at"),
+    )
     
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     session_id = Column(String, ForeignKey('sessions.id'), index=True)
@@ -0,0 +1,45 @@
+from sqlalchemy import Column, String, Text, Date, DateTime, Float, Integer
+from database import Base
+
+# Agregados diários das vendas aprovadas de cada usuário, copiados do banco
+# externo pelo sync incremental (ver services/sales_rollup_service.py)
+
+class SalesRollupDay(Base):
+    __tablename__ = "sales_rollup_days"
+
+    user_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    approved_count = Column(Integer, nullable=False)
+    total_value = Column(Float, nullable=False)
+
+
+class SalesRollupItem(Base):
+    """Quantas categorias/produtos com cada nome entraram nos orçamentos aprovados do dia."""
+    __tablename__ = "sales_rollup_items"
+
+    user_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    # "category" ou "product"
+    kind = Column(String, primary_key=True)
+    name = Column(Text, primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+
+class SalesRollupUser(Base):
+    __tablename__ = "sales_rollup_users"
+
+    user_id = Column(String, primary_key=True)
+    user_name = Column(Text)
+    # Muda sempre que os agregados do usuário são recalculados
+    refreshed_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class SalesRollupState(Base):
+    """Linha única com o progresso do sync."""
+    __tablename__ = "sales_rollup_state"
+
+    id = Column(Integer, primary_key=True)
+    # Maior Budget.updatedAt já processado (horário do banco externo, sem fuso)
+    watermark = Column(DateTime)
+    last_sync_at = Column(DateTime(timezone=True))
+    last_full_sync_at = Column(DateTime(timezone=True))
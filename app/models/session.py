@@ -1,10 +1,21 @@
-from sqlalchemy import Column, String, DateTime, func
+from sqlalchemy import Column, String, Text, DateTime, Index, func
 from database import Base
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_user_id_created_at", "user_id", "created_at"),
+    )
     
     id = Column(String, primary_key = True, index = True)
     user_id = Column(String, index = True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    title = Column(String)
\ No newline at end of file
+    title = Column(String)
+    # "pending" enquanto o título provisório aguarda o refinamento pela IA
+    title_status = Column(String, nullable=False, default="final", server_default="final")
+    # Resumo das conversas antigas usado como contexto do chat; cobre todas as
+    # conversas até (`summarized_until`, `summarized_until_id`), na ordem
+    # (created_at, id) (ver services/context_service.py)
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(DateTime(timezone=True), nullable=True)
+    summarized_until_id = Column(String, nullable=True)
\ No newline at end of file
@@ -1,42 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-import google.generativeai as genai
+from datetime import date
 import os
 
-from database import get_external_db
-from services import analysis_service
+from database import AsyncSessionLocal, AsyncExternalSessionLocal, get_async_db, get_async_external_db
+from services import analysis_service, cache_service, llm_service, sales_rollup_service, single_flight, sse
 
 router = APIRouter(prefix="/analysis", tags=["Analysis & Insights"])
-try:
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    text_model = genai.GenerativeModel('gemini-2.5-pro-preview-06-05')
-except Exception as e:
-    text_model = None
-    print(f"Alerta: Chave da API do Gemini não configurada. {e}")
-    
-@router.get("/{user_id}/sales-trends")
-async def get_sales_trends_analysis(
-    user_id: str = Path(..., description="ID do usuário para o qual a análise será gerada"),
-    days: int = Query(90, ge=1, le=365, description="Número de dias para análise"),
-    edb: Session = Depends(get_external_db)
-):
-    if not text_model:
-        raise HTTPException(status_code=503, detail="Alerta: Chave da API do Gemini não configurada")
-    
-    # Obtém os dados agregados vindos do service
-    try:
-        trends_data = analysis_service.get_sales_trends_data(
-            db=edb, 
-            user_id=user_id, 
-            days_to_analyze=days
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao consultar dados externos: {e}")
-    
-    # Constrói o prompt para a API do Gemini
-    
-    prompt = f"""
+
+sales_trends_cache = cache_service.ResponseCache(
+    cache_service.create_backend(),
+    namespace="sales-trends",
+    ttl=int(os.getenv("SALES_TRENDS_CACHE_TTL", "3600"))
+)
+
+# Pedidos idênticos simultâneos (mesma chave do cache) geram uma única análise
+sales_trends_flight = single_flight.SingleFlight(
+    "sales-trends",
+    timeout=float(os.getenv("SALES_TRENDS_TIMEOUT_SECONDS", "120"))
+)
+
+def build_sales_trends_prompt(trends_data: dict, top: int) -> str:
+    """Prompt da análise de tendências a partir dos dados agregados."""
+    return f"""
     Você é um analista de negócios especialista em empresas de móveis planejados.
     Analise os seguintes dados de vendas do usuário com ID '{trends_data['user_id']}', chamado de {trends_data['user_name']} nos últimos {trends_data['period_days']} dias e forneça insights acionáveis para ele.
 
@@ -45,10 +33,10 @@ async def get_sales_trends_analysis(
     - Faturamento Total (Vendas): R$ {trends_data['summary']['total_sales_value']:.2f}
     - Ticket Médio por Orçamento: R$ {trends_data['summary']['average_budget_value']:.2f}
 
-    Top 5 Categorias Mais Populares (por nº de orçamentos deste usuário):
+    Top {top} Categorias Mais Populares (por nº de orçamentos deste usuário):
     {', '.join([f'{cat["name"]} ({cat["count"]})' for cat in trends_data["top_categories"]]) if trends_data["top_categories"] else "Nenhuma"}
 
-    Top 5 Produtos Mais Populares (por nº de orçamentos deste usuário):
+    Top {top} Produtos Mais Populares (por nº de orçamentos deste usuário):
     {', '.join([f'{prod["name"]} ({prod["count"]})' for prod in trends_data["top_products"]]) if trends_data["top_products"] else "Nenhum"}
 
     Com base nestes dados pessoais de desempenho dos últimos {trends_data['period_days']} dias, gere uma análise em 3 partes para este usuário:
@@ -58,22 +46,173 @@ async def get_sales_trends_analysis(
 
     Use um tom de coaching, direcionado diretamente ao usuário. Lembre-se de cumprimentá-lo utilizando o nome dele, {trends_data['user_name']}, e sempre mencione que a análise se refere aos últimos {trends_data['period_days']} dias.
     """
-    
-    # Chama a API e retorna a resposta
+
+async def _resolve_source(db: AsyncSession, edb: AsyncSession, user_id: str, days: int, top: int, daily_series: bool):
+    """
+    Escolhe de onde vêm os dados (depois do primeiro sync, dos rollups locais;
+    antes disso, do banco externo) e calcula a chave do cache da análise.
+    Retorna `(service, sessão, chave)`.
+    """
+    if sales_rollup_service.SALES_ROLLUPS_ENABLED and await sales_rollup_service.is_ready(db):
+        source, source_db = sales_rollup_service, db
+    else:
+        source, source_db = analysis_service, edb
+
+    # Assinatura dos orçamentos do usuário: se nada mudou, a análise em cache ainda vale
     try:
-        response = text_model.generate_content(prompt)
-        return {
-            "user_id": trends_data['user_id'],
-            "user_name": trends_data['user_name'],
-            "period_analyzed": f"{trends_data['period_days']} dias",
-            "analysis": response.text,
-            "data_summary": trends_data['summary']
-        }
+        fingerprint = await source.get_sales_trends_fingerprint(source_db, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar dados externos: {e}")
+    # A janela de análise é relativa a hoje, então a data também entra na chave
+    cache_key = f"{user_id}:{days}:{top}:{int(daily_series)}:{date.today().isoformat()}:{fingerprint}"
+    return source, source_db, cache_key
+
+def _build_result(trends_data: dict, analysis: str, daily_series: bool) -> dict:
+    result = {
+        "user_id": trends_data['user_id'],
+        "user_name": trends_data['user_name'],
+        "period_analyzed": f"{trends_data['period_days']} dias",
+        "analysis": analysis,
+        "data_summary": trends_data['summary']
+    }
+    if daily_series:
+        result["daily_series"] = trends_data["daily_series"]
+    return result
+
+@router.get("/{user_id}/sales-trends")
+async def get_sales_trends_analysis(
+    http_request: Request,
+    response: Response,
+    user_id: str = Path(..., description="ID do usuário para o qual a análise será gerada"),
+    days: int = Query(90, ge=1, le=365, description="Número de dias para análise"),
+    top: int = Query(5, ge=1, le=20, description="Quantidade de categorias e produtos no ranking"),
+    daily_series: bool = Query(False, description="Inclui a série diária de vendas para gráficos"),
+    db: AsyncSession = Depends(get_async_db),
+    edb: AsyncSession = Depends(get_async_external_db)
+):
+    if not llm_service.is_configured():
+        raise HTTPException(status_code=503, detail="Alerta: Chave da API do Gemini não configurada")
+
+    source, source_db, cache_key = await _resolve_source(db, edb, user_id, days, top, daily_series)
+    response.headers["X-Data-Source"] = "rollup" if source is sales_rollup_service else "external"
+
+    cached = await sales_trends_cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        return cached
+    response.headers["X-Cache"] = "MISS"
+
+    # Abas e componentes que pedem a mesma análise ao mesmo tempo compartilham
+    # as consultas e a chamada ao Gemini
+    session_factory = AsyncSessionLocal if source is sales_rollup_service else AsyncExternalSessionLocal
+
+    async def compute():
+        # Sessão própria: a execução é compartilhada e pode continuar depois que a
+        # requisição que a iniciou terminar
+        try:
+            async with session_factory() as session:
+                trends_data = await source.get_sales_trends_data(
+                    db=session,
+                    user_id=user_id,
+                    days_to_analyze=days,
+                    top_n=top,
+                    include_daily_series=daily_series
+                )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao consultar dados externos: {e}")
+
+        try:
+            analysis = await llm_service.generate("analysis", build_sales_trends_prompt(trends_data, top))
+        except llm_service.LLMError as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Erro ao gerar análise com a API do Gemini: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao gerar análise com a API do Gemini: {str(e)}")
+
+        result = _build_result(trends_data, analysis, daily_series)
+        await sales_trends_cache.set(cache_key, result)
+        return result
+
+    try:
+        return await sales_trends_flight.do(cache_key, compute, http_request=http_request)
+    except single_flight.SingleFlightError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Erro ao gerar análise: {str(e)}")
+
+@router.get("/{user_id}/sales-trends/stream")
+async def stream_sales_trends_analysis(
+    user_id: str = Path(..., description="ID do usuário para o qual a análise será gerada"),
+    days: int = Query(90, ge=1, le=365, description="Número de dias para análise"),
+    top: int = Query(5, ge=1, le=20, description="Quantidade de categorias e produtos no ranking"),
+    daily_series: bool = Query(False, description="Inclui a série diária de vendas para gráficos"),
+    db: AsyncSession = Depends(get_async_db),
+    edb: AsyncSession = Depends(get_async_external_db)
+):
+    """
+    Versão em streaming da análise de tendências (Server-Sent Events).
+
+    O primeiro evento (`summary`) traz os números do período, sem o texto; em
+    seguida o texto da análise chega em eventos `data: {"delta": ...}` conforme
+    o Gemini o gera, e um evento `done` encerra a resposta. Análises em cache
+    são enviadas num único delta. A análise completa é gravada no mesmo cache
+    do endpoint sem streaming.
+    """
+    if not llm_service.is_configured():
+        raise HTTPException(status_code=503, detail="Alerta: Chave da API do Gemini não configurada")
+
+    source, source_db, cache_key = await _resolve_source(db, edb, user_id, days, top, daily_series)
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "X-Data-Source": "rollup" if source is sales_rollup_service else "external",
+    }
+
+    cached = await sales_trends_cache.get(cache_key)
+    if cached is not None:
+        async def cached_stream():
+            yield sse.event({key: value for key, value in cached.items() if key != "analysis"}, event="summary")
+            yield sse.event({"delta": cached["analysis"]})
+            yield sse.event({"cached": True}, event="done")
+
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers={**headers, "X-Cache": "HIT"})
+
+    # Os dados são consultados antes de a resposta começar, enquanto a sessão da
+    # requisição ainda está aberta; o streaming só depende do Gemini
+    try:
+        trends_data = await source.get_sales_trends_data(
+            db=source_db,
+            user_id=user_id,
+            days_to_analyze=days,
+            top_n=top,
+            include_daily_series=daily_series
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar análise com a API do Gemini: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar dados externos: {e}")
+
+    async def event_stream():
+        summary = _build_result(trends_data, "", daily_series)
+        del summary["analysis"]
+        yield sse.event(summary, event="summary")
+
+        parts = []
+        try:
+            async for text in llm_service.stream("analysis", build_sales_trends_prompt(trends_data, top)):
+                parts.append(text)
+                yield sse.event({"delta": text})
+        except Exception as e:
+            yield sse.event({"detail": f"Erro ao gerar análise com a API do Gemini: {str(e)}"}, event="error")
+            return
+
+        await sales_trends_cache.set(cache_key, _build_result(trends_data, "".join(parts), daily_series))
+        yield sse.event({"cached": False}, event="done")
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={**headers, "X-Cache": "MISS"})
+
+@router.get("/cache-stats")
+async def get_cache_stats():
+    """Métricas de acerto do cache de análises."""
+    return sales_trends_cache.stats()
     
 @router.get("/debug-db-tables")
-async def debug_db_connection(edb: Session = Depends(get_external_db)):
+async def debug_db_connection(edb: AsyncSession = Depends(get_async_external_db)):
     """
     Endpoint de teste para verificar TODAS as tabelas que a aplicação consegue ver no schema 'public'.
     """
@@ -85,7 +224,7 @@ async def debug_db_connection(edb: Session = Depends(get_external_db)):
             WHERE table_schema = 'public'
             ORDER BY table_name;
         """)
-        result = edb.execute(query).fetchall()
+        result = (await edb.execute(query)).fetchall()
         
         # Converte o resultado para uma lista simples de nomes de tabela
         tables = [row[0] for row in result]
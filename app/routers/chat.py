@@ -1,66 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
 import uuid
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db
 from models.conversation import Conversation
 from models.session import Session as SessionModel
 from schemas.chat import SessionResponse, PromptRequest, ConversationResponse, CreateSessionRequest
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
+from services import chat_service, context_service, llm_service, sse, title_service
 
 router = APIRouter()
 
-load_dotenv(override=True)
-# Configuração do Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-text_model = genai.GenerativeModel('gemini-2.5-pro-preview-05-06')
-
-# Dependência do banco de dados
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close
-        
 # Cria uma nova sessão
 @router.post("/session/new")
-async def create_session(request: CreateSessionRequest, db: Session = Depends(get_db)):
+async def create_session(request: CreateSessionRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Cria a sessão com um título provisório tirado do primeiro prompt. O título
+    definitivo é gerado em segundo plano; enquanto isso `title_status` é "pending".
+    """
     session_id = str(uuid.uuid4())
-
-    # Gera o título com base no primeiro prompt
-    try:
-        title_response = text_model.generate_content(request.first_prompt)
-        title = title_response.text.strip()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar título: {str(e)}")
+    title = title_service.heuristic_title(request.first_prompt)
+    title_status = "pending" if llm_service.is_configured() else "final"
 
     new_session = SessionModel(
         id=session_id,
         user_id=request.user_id,
-        title=title
+        title=title,
+        title_status=title_status
     )
 
     db.add(new_session)
-    db.commit()
-    return {"session_id": session_id, "title": title}
+    await db.commit()
+    if title_status == "pending":
+        title_service.schedule_refinement(session_id, request.first_prompt)
+    return {"session_id": session_id, "title": title, "title_status": title_status}
 
 # Rota para obter histórico por sessão
 @router.get("/sessions/{session_id}", response_model=SessionResponse)
-async def get_session(session_id: str, db: Session = Depends(get_db)):
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+async def get_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    session = (await db.execute(select(SessionModel).filter(SessionModel.id == session_id))).scalars().first()
     if not session:
         raise HTTPException(status_code=404, detail="Sessão não encontrada")
     
-    conversations = db.query(Conversation)\
-        .filter(Conversation.session_id == session_id)\
-        .order_by(Conversation.created_at.asc())\
-        .all()
+    conversations = (await db.execute(
+        select(Conversation)
+        .filter(Conversation.session_id == session_id)
+        .order_by(Conversation.created_at.asc())
+    )).scalars().all()
         
     return {
         "id": session.id,
         "title": session.title,
+        "title_status": session.title_status,
         "created_at": session.created_at,
         "conversations": conversations
     }
@@ -68,56 +60,123 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
 @router.post("/ask")
 async def ask(
     request: PromptRequest,
-    db: Session = Depends(get_db)
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         # Verifica se a sessão existe
-        session = db.query(SessionModel).filter(SessionModel.id == request.session_id).first()
+        session = (await db.execute(
+            select(SessionModel).filter(SessionModel.id == request.session_id)
+        )).scalars().first()
         if not session:
             raise HTTPException(status_code=404, detail="Sessão inválida")
         
-        # Geração da resposta
-        response = text_model.generate_content(request.prompt)
+        # Geração da resposta com o resumo e as conversas recentes da sessão
+        contents = await context_service.build_contents(db, session, request.prompt)
+        response_text = await llm_service.generate("chat", contents, http_request=http_request)
         
         # Salva na conversa
         db_conversation = Conversation(
             session_id=request.session_id,  # Agora usa session_id
             prompt=request.prompt,
-            response=response.text
+            response=response_text
         )
         
         # Atualiza título da sessão se for o primeiro prompt
         if not session.title:
-            session.title = request.prompt[:50] + "..."
+            session.title = title_service.heuristic_title(request.prompt)
             db.add(session)
             
         db.add(db_conversation)
-        db.commit()
+        await db.commit()
+        context_service.schedule_summary(request.session_id)
         
-        return {"response": response.text}
+        return {"response": response_text}
         
+    except HTTPException:
+        raise
+    except llm_service.LLMError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+async def _save_conversation(session_id: str, prompt: str, response_text: str) -> str:
+    """Grava a conversa usando uma sessão de banco curta, aberta só para a escrita."""
+    async with AsyncSessionLocal() as db:
+        db_conversation = Conversation(session_id=session_id, prompt=prompt, response=response_text)
+        db.add(db_conversation)
+
+        session = (await db.execute(select(SessionModel).filter(SessionModel.id == session_id))).scalars().first()
+        if session and not session.title:
+            session.title = title_service.heuristic_title(prompt)
+            db.add(session)
+
+        await db.commit()
+        return db_conversation.id
+
+@router.post("/ask/stream")
+async def ask_stream(request: PromptRequest):
+    """
+    Versão em streaming do /ask (Server-Sent Events).
+
+    Cada parte gerada pelo Gemini é enviada como um evento `data: {"delta": ...}`
+    assim que chega; ao final a conversa é gravada e um evento `done` é emitido.
+    Nenhuma sessão de banco fica aberta durante a geração.
+    """
+    async with AsyncSessionLocal() as db:
+        session = (await db.execute(
+            select(SessionModel).filter(SessionModel.id == request.session_id)
+        )).scalars().first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Sessão inválida")
+        contents = await context_service.build_contents(db, session, request.prompt)
+    if not llm_service.is_configured():
+        raise HTTPException(status_code=503, detail="Chave da API do Gemini não configurada")
+
+    async def event_stream():
+        parts = []
+        try:
+            async for text in llm_service.stream("chat", contents):
+                parts.append(text)
+                yield sse.event({"delta": text})
+        except Exception as e:
+            yield sse.event({"detail": str(e)}, event="error")
+            return
+
+        try:
+            conversation_id = await _save_conversation(request.session_id, request.prompt, "".join(parts))
+        except Exception as e:
+            yield sse.event({"detail": f"Erro ao salvar conversa: {e}"}, event="error")
+            return
+        context_service.schedule_summary(request.session_id)
+        yield sse.event({"conversation_id": conversation_id}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    
 @router.get("/history", response_model=list[SessionResponse])
-async def get_history(user_id: str, db: Session = Depends(get_db)):
-    sessions = db.query(SessionModel)\
-        .filter(SessionModel.user_id == user_id)\
-        .order_by(SessionModel.created_at.desc())\
-        .all()
-        
-    result = []
-    for session in sessions:
-        conversations = db.query(Conversation)\
-            .filter(Conversation.session_id == session.id)\
-            .order_by(Conversation.created_at.asc())\
-            .all()
-            
-        result.append({
-            "id": session.id,
-            "title": session.title,
-            "created_at": session.created_at,
-            "conversations": conversations
-        })
-        
-    return result
\ No newline at end of file
+async def get_history(
+    response: Response,
+    user_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Número máximo de sessões por página"),
+    cursor: Optional[str] = Query(None, description="Cursor retornado no header X-Next-Cursor da página anterior"),
+    conversations_per_session: Optional[int] = Query(None, ge=1, description="Mantém só as N conversas mais recentes de cada sessão"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        sessions, next_cursor = await chat_service.get_history_page(
+            db,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+            conversations_per_session=conversations_per_session
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return sessions
@@ -1,21 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from database import get_external_db
-from models.external_data import ExternalCustomer
+from database import get_async_external_db
 from schemas.customer_schema import CustomerResponse
+from services import cache_service, customer_service
 
 router = APIRouter(prefix="/customers", tags=["Clientes"])
 
 @router.get("/", response_model=List[CustomerResponse])
 async def get_customers_by_user(
+    response: Response,
     user_id: str = Query(..., description="ID do usuário para buscar os clientes associados"),
-    edb: Session = Depends(get_external_db)
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Número máximo de clientes por página"),
+    cursor: Optional[str] = Query(None, description="Cursor retornado no header X-Next-Cursor da página anterior"),
+    search: Optional[str] = Query(None, max_length=100, description="Filtra pelo nome (início do nome ou, a partir de 3 caracteres, qualquer trecho)"),
+    if_none_match: Optional[str] = Header(None),
+    edb: AsyncSession = Depends(get_async_external_db)
 ):
     """
-    Retorna uma lista de todos os clientes vinculados a um user_id específico.
+    Retorna os clientes vinculados a um user_id específico, ordenados por nome.
+
+    Com `limit` a lista é paginada e o cursor da próxima página vem no header
+    X-Next-Cursor. A resposta traz um ETag; se o cliente enviar o mesmo valor em
+    If-None-Match e nada tiver mudado, a resposta é 304 sem corpo.
     """
-    customers = edb.query(ExternalCustomer).filter(ExternalCustomer.userId == user_id).order_by(ExternalCustomer.name).all()
-    
-    return customers
\ No newline at end of file
+    try:
+        rows, next_cursor = await customer_service.list_customers(
+            edb,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+            search=search
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"ETag": customer_service.compute_etag(rows, next_cursor), "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if cache_service.etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return [row._asdict() for row in rows]
@@ -1,114 +1,252 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session, joinedload
-import io
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import base64
 import json
-import google.generativeai as genai
 import os
-from datetime import datetime, timedelta
+from typing import Optional
 
-from database import get_external_db
-from models.external_data import ExternalUser, ExternalCustomer 
-from schemas.pdf_schema import BudgetGenerationRequest
-from services import document_service
-
-# Configuração do Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-text_model = genai.GenerativeModel('gemini-1.5-pro')
+from database import get_async_db
+from models.budget_job import BudgetJob
+from schemas.pdf_schema import BudgetBatchRequest, BudgetGenerationRequest, BudgetJobResponse
+from services import archive_service, budget_cache, budget_service, budget_store, document_cache, job_service, llm_service, reference_cache, render_service, single_flight
 
 router = APIRouter(prefix="/documents", tags=["Geração de Documentos"])
 
+async def _prepare_budget(request: BudgetGenerationRequest, http_request: Request):
+    """Carrega cliente e configurações e gera os dados do orçamento; retorna `(budget_data, cache_hit)`."""
+    try:
+        customer, settings = await budget_service.load_customer_and_settings(request.customer_id, request.user_id)
+    except budget_service.BudgetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    try:
+        ai_budget_data, cache_hit = await budget_service.get_ai_budget(
+            request.user_id,
+            request.description,
+            http_request=http_request,
+            use_cache=request.use_cache
+        )
+    except (llm_service.LLMError, single_flight.SingleFlightError) as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Erro ao gerar dados da IA: {str(e)}")
+    except budget_service.BudgetGenerationError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar ou processar dados da IA: {str(e)}")
+
+    return budget_service.build_budget_data(ai_budget_data, customer, settings), cache_hit
+
+async def _render(budget_data: dict, output_format: str) -> bytes:
+    try:
+        return await budget_service.render_document_async(budget_data, output_format)
+    except render_service.RenderQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except render_service.RenderTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
 @router.post("/generate-budget")
 async def generate_dynamic_budget_document(
     request: BudgetGenerationRequest,
-    edb: Session = Depends(get_external_db)
+    http_request: Request
 ):
-    customer = edb.query(ExternalCustomer).filter(ExternalCustomer.id == request.customer_id).first()
-    user_with_settings = edb.query(ExternalUser).options(
-        joinedload(ExternalUser.settings)
-    ).filter(ExternalUser.id == request.user_id).first()
-
-    if not customer:
-        raise HTTPException(status_code=404, detail="Cliente não encontrado.")
-    if not user_with_settings or not user_with_settings.settings:
-        raise HTTPException(status_code=404, detail="Usuário ou suas configurações não encontrados.")
-    
-    settings = user_with_settings.settings
-
-    prompt_for_gemini = f"""
-    Você é um especialista em vendas de móveis planejados. Sua tarefa é criar um orçamento detalhado com base no pedido de um cliente.
-    Pedido do Cliente: "{request.description}"
-    Gere uma lista de categorias e produtos para este orçamento. Calcule o preço de cada produto e o total geral.
-    Responda APENAS com um objeto JSON válido, sem nenhum texto ou formatação adicional antes ou depois. O JSON deve ter a seguinte estrutura:
-    {{
-      "name": "Orçamento para Home Office",
-      "categories": [
-        {{
-          "name": "Mobiliário Principal",
-          "products": [
-            {{"name": "Escrivaninha em L em MDF amadeirado", "price": 1800.00}},
-            {{"name": "Estante de livros alta (5 prateleiras)", "price": 1250.50}},
-            {{"name": "Gaveteiro com 3 gavetas e rodízios", "price": 750.00}}
-          ]
-        }}
-      ],
-      "total": 3800.50
-    }}
-    """
+    budget_data, cache_hit = await _prepare_budget(request, http_request)
+    fmt = request.output_format
+    headers = {
+        "Content-Disposition": f"attachment; filename=orcamento.{fmt}",
+        "X-Cache": "HIT" if cache_hit else "MISS"
+    }
+    if not document_cache.DOCUMENT_CACHE_ENABLED:
+        return Response(content=await _render(budget_data, fmt), media_type=budget_service.OUTPUT_FORMATS[fmt], headers=headers)
+
+    # Documentos idênticos (mesmo contexto e mesma versão dos templates) não são renderizados de novo
+    key = await asyncio.to_thread(document_cache.document_key, budget_service.plain_budget_data(budget_data), fmt)
+    headers["ETag"] = f'"{key}"'
+    token = await asyncio.to_thread(budget_store.find, key, fmt)
+    if token:
+        headers["Content-Location"] = budget_store.url_for(token, fmt)
+        headers["X-Document-Cache"] = "HIT"
+        return FileResponse(budget_store.path_for(token, fmt), media_type=budget_service.OUTPUT_FORMATS[fmt], headers=headers)
+
+    file_bytes = await _render(budget_data, fmt)
+    headers["X-Document-Cache"] = "MISS"
+    # Publica em /static/budgets: novos downloads do mesmo orçamento viram leitura de arquivo estático
+    token = await asyncio.to_thread(budget_store.publish, key, fmt, file_bytes)
+    headers["Content-Location"] = budget_store.url_for(token, fmt)
+    return Response(content=file_bytes, media_type=budget_service.OUTPUT_FORMATS[fmt], headers=headers)
 
+@router.get("/files-cache-stats")
+async def get_document_cache_stats():
+    """Métricas dos documentos publicados, que servem de cache dos documentos renderizados."""
+    return {"enabled": document_cache.DOCUMENT_CACHE_ENABLED, **await asyncio.to_thread(budget_store.stats)}
+
+@router.post("/generate-budget/bundle")
+async def generate_budget_bundle(
+    request: BudgetGenerationRequest,
+    http_request: Request
+):
+    """
+    Gera o orçamento em PDF e DOCX (renderizados em paralelo) e entrega os dois
+    num ZIP enviado em streaming: cada documento entra no arquivo assim que fica
+    pronto. A resposta só começa depois do primeiro, para que erros de
+    renderização ainda virem status HTTP. `output_format` é ignorado.
+    """
+    budget_data, cache_hit = await _prepare_budget(request, http_request)
+    renders = {
+        asyncio.create_task(_render(budget_data, fmt)): fmt for fmt in budget_service.OUTPUT_FORMATS
+    }
     try:
-        safety_settings = {
-            'HARM_CATEGORY_HARASSMENT': 'BLOCK_ONLY_HIGH',
-            'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_ONLY_HIGH',
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_ONLY_HIGH',
-            'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_ONLY_HIGH',
+        done, pending = await asyncio.wait(renders, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except BaseException:
+        for task in renders:
+            task.cancel()
+        raise
+
+    async def entries():
+        ready, waiting = done, pending
+        try:
+            while True:
+                for task in ready:
+                    yield f"orcamento.{renders.pop(task)}", task.result()
+                if not waiting:
+                    return
+                ready, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Cliente desconectou: cancela o que ainda está renderizando
+            for task in waiting:
+                task.cancel()
+
+    return StreamingResponse(
+        archive_service.zip_stream(entries()),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": "attachment; filename=orcamento.zip",
+            "X-Cache": "HIT" if cache_hit else "MISS"
         }
-        
-        response = text_model.generate_content(
-            prompt_for_gemini,
-            safety_settings=safety_settings
+    )
+
+@router.post("/generate-budget/batch")
+async def generate_budget_batch(request: BudgetBatchRequest):
+    """
+    Gera vários orçamentos de uma vez. Clientes e configurações são carregados
+    uma única vez e os itens são gerados em paralelo; cada documento é enviado
+    assim que fica pronto. Itens com erro não interrompem o lote: no ZIP eles
+    aparecem em `resultado.json` e no NDJSON como linhas com status "failed".
+    """
+    try:
+        customers, settings = await budget_service.load_batch_context(
+            [item.customer_id for item in request.items], request.user_id
         )
-        
-        raw_text = response.text
-        print(f"Raw Gemini Response: '{raw_text}'")
+    except budget_service.BudgetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-        json_start = raw_text.find('{')
-        json_end = raw_text.rfind('}')
+    results = budget_service.generate_batch(
+        request.items, customers, settings, request.user_id, use_cache=request.use_cache
+    )
 
-        if json_start == -1 or json_end == -1:
-            raise ValueError("Não foi encontrado um objeto JSON válido na resposta da IA.")
-            
-        json_text = raw_text[json_start:json_end+1]
-        
-        ai_budget_data = json.loads(json_text)
+    def summary(index, item, error):
+        return {
+            "index": index,
+            "customer_id": item.customer_id,
+            "status": "failed" if error else "succeeded",
+            "filename": None if error else budget_service.batch_filename(index, customers.get(item.customer_id), item.output_format),
+            "error": error,
+        }
 
-    except (json.JSONDecodeError, ValueError, Exception) as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar ou processar dados da IA: {str(e)}")
+    if request.response_format == "ndjson":
+        async def lines():
+            async for index, item, file_bytes, error in results:
+                line = summary(index, item, error)
+                line["content_base64"] = base64.b64encode(file_bytes).decode() if file_bytes else None
+                yield json.dumps(line, ensure_ascii=False) + "\n"
 
-    budget_data = {
-        "budget": {
-            "id": f"{datetime.now().strftime('%Y%m%d')}",
-            "name": ai_budget_data.get("name", "Orçamento Personalizado"),
-            "categories": ai_budget_data.get("categories", []),
-            "total": ai_budget_data.get("total", 0.0),
-            "createdAt": datetime.now()
-        },
-        "customer": customer,
-        "settings": settings,
-        "timedelta": timedelta
-    }
-    
-    if request.output_format == 'docx':
-        file_bytes = document_service.generate_budget_docx(budget_data, "temp/budget.docx")
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        file_extension = "docx"
-    else: # O padrão é PDF
-        file_bytes = document_service.generate_budget_pdf(budget_data)
-        media_type = "application/pdf"
-        file_extension = "pdf"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    async def entries():
+        manifest = []
+        async for index, item, file_bytes, error in results:
+            line = summary(index, item, error)
+            manifest.append(line)
+            if file_bytes:
+                yield line["filename"], file_bytes
+        manifest.sort(key=lambda line: line["index"])
+        yield "resultado.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode()
 
     return StreamingResponse(
-        io.BytesIO(file_bytes),
-        media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename=orcamento.{file_extension}"}
-    )
\ No newline at end of file
+        archive_service.zip_stream(entries()),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=orcamentos.zip"}
+    )
+
+@router.get("/generate-budget/cache-stats")
+async def get_budget_cache_stats():
+    """Métricas do cache semântico de orçamentos (taxa de acerto, entradas, descartes)."""
+    return budget_cache.budget_cache.stats()
+
+@router.get("/reference-cache-stats")
+async def get_reference_cache_stats():
+    """Métricas do cache de clientes e usuários/configurações do banco externo."""
+    return {"customers": reference_cache.customers.stats(), "users": reference_cache.users.stats()}
+
+@router.delete("/reference-cache", status_code=204)
+async def invalidate_reference_cache(user_id: Optional[str] = None, customer_id: Optional[str] = None):
+    """
+    Descarta do cache (em todos os workers e no pool de jobs) o cliente e/ou o
+    usuário informados, ex.: logo após alterar as configurações da empresa. Sem
+    parâmetros, limpa tudo.
+    """
+    if customer_id is None and user_id is None:
+        await reference_cache.customers.invalidate()
+        await reference_cache.users.invalidate()
+    if customer_id is not None:
+        await reference_cache.customers.invalidate(customer_id)
+    if user_id is not None:
+        await reference_cache.users.invalidate(user_id)
+
+@router.post("/generate-budget/jobs", response_model=BudgetJobResponse, status_code=202)
+async def create_budget_job(
+    request: BudgetGenerationRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Enfileira a geração do orçamento e retorna imediatamente o id do job.
+    O andamento é consultado em /generate-budget/jobs/{job_id} e o arquivo, quando
+    pronto, em /generate-budget/jobs/{job_id}/result.
+    """
+    return await job_service.enqueue(
+        db,
+        user_id=request.user_id,
+        customer_id=request.customer_id,
+        description=request.description,
+        output_format=request.output_format,
+        use_cache=request.use_cache
+    )
+
+@router.get("/generate-budget/jobs/{job_id}", response_model=BudgetJobResponse)
+async def get_budget_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(BudgetJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job
+
+@router.get("/generate-budget/jobs/{job_id}/result")
+async def get_budget_job_result(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(BudgetJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    if job.status == "expired":
+        raise HTTPException(status_code=410, detail="O arquivo deste job expirou.")
+    if job.status == "failed":
+        raise HTTPException(status_code=422, detail=f"O job falhou: {job.error}")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail="O job ainda não terminou.")
+    if not job.artifact_path or not os.path.exists(job.artifact_path):
+        raise HTTPException(status_code=410, detail="O arquivo deste job não está mais disponível.")
+
+    return FileResponse(
+        job.artifact_path,
+        media_type=budget_service.OUTPUT_FORMATS[job.output_format],
+        filename=f"orcamento.{job.output_format}"
+    )
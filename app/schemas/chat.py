@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Literal
 from datetime import datetime
 
 class PromptRequest(BaseModel):
@@ -8,6 +9,7 @@ class PromptRequest(BaseModel):
 class SessionBase(BaseModel):
     id: str
     title: str
+    title_status: Literal['pending', 'final'] = 'final'
     created_at: datetime
     
 class CreateSessionRequest(BaseModel):
@@ -0,0 +1,50 @@
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+from typing import Optional
+
+# Cópias imutáveis das linhas do banco externo guardadas pelo reference_cache.
+# Os nomes dos campos seguem as colunas, então os templates usam os dois da mesma forma.
+
+class CustomerSnapshot(BaseModel):
+    id: str
+    name: str
+    phone: str
+    email: Optional[str] = None
+    birthdate: Optional[datetime] = None
+    userId: str
+    address: Optional[str] = None
+    cnpj: Optional[str] = None
+    cpf: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+class SettingsSnapshot(BaseModel):
+    id: str
+    userId: str
+    companyName: str
+    cnpj: str
+    street: str
+    number: int
+    zipCode: str
+    state: str
+    city: str
+    phone: str
+    responsiblePerson: str
+    createdAt: datetime
+    updatedAt: datetime
+    logo: Optional[str] = None
+    budgetValidityDays: Optional[int] = None
+    deliveryTimeDays: Optional[int] = None
+    observation: Optional[str] = None
+    paymentMethod: Optional[str] = None
+    neighborhood: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+class UserSnapshot(BaseModel):
+    id: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    settings: Optional[SettingsSnapshot] = None
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
@@ -1,8 +1,50 @@
-from pydantic import BaseModel
-from typing import Literal
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime
+from typing import List, Literal, Optional
 
 class BudgetGenerationRequest(BaseModel):
     customer_id: str
     user_id: str
     description: str
-    output_format: Literal['pdf', 'docx'] = 'pdf'
\ No newline at end of file
+    output_format: Literal['pdf', 'docx'] = 'pdf'
+    # False força uma nova geração pela IA, ignorando o cache semântico
+    use_cache: bool = True
+
+class BudgetBatchItem(BaseModel):
+    customer_id: str
+    description: str
+    output_format: Literal['pdf', 'docx'] = 'pdf'
+
+class BudgetBatchRequest(BaseModel):
+    user_id: str
+    items: List[BudgetBatchItem] = Field(min_length=1, max_length=50)
+    # "zip": um arquivo ZIP montado conforme os documentos ficam prontos;
+    # "ndjson": uma linha JSON por item, na ordem em que terminam
+    response_format: Literal['zip', 'ndjson'] = 'zip'
+    use_cache: bool = True
+
+class BudgetJobResponse(BaseModel):
+    id: str
+    status: Literal['queued', 'running', 'succeeded', 'failed', 'expired']
+    output_format: Literal['pdf', 'docx']
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+# Estrutura do orçamento devolvida pelo Gemini. Também é a origem do
+# `response_schema` enviado no modo JSON (ver llm_service.response_schema).
+class BudgetProduct(BaseModel):
+    name: str
+    price: float = Field(ge=0)
+
+class BudgetCategory(BaseModel):
+    name: str
+    products: List[BudgetProduct]
+
+class AIBudget(BaseModel):
+    name: str
+    categories: List[BudgetCategory]
+    total: float = 0.0
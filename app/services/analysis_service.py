@@ -1,72 +1,130 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, literal_column, null, cast, union_all, Date, Float, Integer, Text
 from datetime import datetime, timedelta
 from models.external_data import ExternalUser
 
 from models.external_data import ExternalBudget, ExternalProduct, ExternalCategory, BudgetStatusEnum
 
-def get_sales_trends_data(db: Session, user_id: str, days_to_analyze: int = 30):
+async def get_sales_trends_fingerprint(db: AsyncSession, user_id: str) -> str:
+    """
+    Retorna uma assinatura barata dos orçamentos do usuário (última alteração e
+    quantidade). Muda sempre que um orçamento é criado, alterado ou removido.
+    """
+    last_update, budgets_count = (await db.execute(select(
+        func.max(ExternalBudget.updatedAt),
+        func.count(ExternalBudget.id)
+    ).filter(ExternalBudget.userId == user_id))).one()
+    return f"{last_update.isoformat() if last_update else '-'}:{budgets_count}"
+
+def _ranked_names(name_column, id_column, *joins):
+    """Nomes mais frequentes nos orçamentos filtrados, numerados por popularidade."""
+    count = func.count(id_column)
+    query = select(
+        name_column.label("name"),
+        count.label("quantity"),
+        func.row_number().over(order_by=(count.desc(), name_column)).label("position")
+    )
+    for target, onclause in joins:
+        query = query.join(target, onclause)
+    return query.group_by(name_column)
+
+
+async def get_sales_trends_data(
+    db: AsyncSession,
+    user_id: str,
+    days_to_analyze: int = 30,
+    top_n: int = 5,
+    include_daily_series: bool = False
+):
+    """
+    Agrega as vendas aprovadas do usuário no período em uma única consulta.
+
+    Os orçamentos filtrados (usuário, status e período) ficam em uma CTE reaproveitada
+    pelo resumo, pelos rankings de categorias e produtos e, opcionalmente, pela série
+    diária; cada parte vira um bloco de linhas de um UNION ALL identificado por `kind`.
+    """
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days_to_analyze)
 
-    # Agrega dados gerais sobre orçamentos aprovados no período definido pelo parâmetro days_to_analyze
-    approved_budgets_summary = db.query(
-        func.count(ExternalBudget.id).label("count"),
-        func.sum(ExternalBudget.total).label("total_value"),
-        func.avg(ExternalBudget.total).label("average_value")
+    filtered_budgets = select(
+        ExternalBudget.id,
+        ExternalBudget.total,
+        ExternalBudget.createdAt
     ).filter(
         ExternalBudget.userId == user_id,
         ExternalBudget.status == BudgetStatusEnum.Aceito.value,
         ExternalBudget.createdAt >= start_date,
         ExternalBudget.createdAt <= end_date
-    ).first()
-    
-    # Encontra as categorias mais populares em orçamentos aprovados.
-    
-    top_categories = db.query(
-        ExternalCategory.name,
-        func.count(ExternalCategory.id).label("category_count")
-    ).join(
-        ExternalBudget, ExternalCategory.budgetId == ExternalBudget.id
-    ).filter(
-        ExternalBudget.userId == user_id,
-        ExternalBudget.status == BudgetStatusEnum.Aceito.value,
-        ExternalBudget.createdAt >= start_date
-    ).group_by(
-        ExternalCategory.name
-    ).order_by(
-        func.count(ExternalCategory.id).desc()
-    ).limit(5).all()
-    
-    # Encontra os produtos mais populares
-    top_products = db.query(
-        ExternalProduct.name,
-        func.count(ExternalProduct.id).label("product_count")
-    ).join(
-        ExternalCategory, ExternalProduct.categoryId == ExternalCategory.id
-    ).join(
-        ExternalBudget, ExternalCategory.budgetId == ExternalBudget.id
-    ).filter(
-        ExternalBudget.userId == user_id,
-        ExternalBudget.status == BudgetStatusEnum.Aceito.value,
-        ExternalBudget.createdAt >= start_date
-    ).group_by(
-        ExternalProduct.name
-    ).order_by(
-        func.count(ExternalProduct.id).desc()
-    ).limit(5).all()
+    ).cte("filtered_budgets")
+
+    top_categories = _ranked_names(
+        ExternalCategory.name, ExternalCategory.id,
+        (filtered_budgets, ExternalCategory.budgetId == filtered_budgets.c.id)
+    ).cte("top_categories")
+
+    top_products = _ranked_names(
+        ExternalProduct.name, ExternalProduct.id,
+        (ExternalCategory, ExternalProduct.categoryId == ExternalCategory.id),
+        (filtered_budgets, ExternalCategory.budgetId == filtered_budgets.c.id)
+    ).cte("top_products")
+
+    no_text = null().cast(Text)
+    no_number = null().cast(Float)
+    parts = [
+        select(
+            literal_column("'summary'", Text).label("kind"),
+            no_text.label("name"),
+            func.count(filtered_budgets.c.id).cast(Float).label("quantity"),
+            func.sum(filtered_budgets.c.total).cast(Float).label("total_value"),
+            func.avg(filtered_budgets.c.total).cast(Float).label("average_value"),
+            literal_column("0", Integer).label("position")
+        ),
+        select(
+            literal_column("'user'", Text), ExternalUser.name, no_number, no_number, no_number, literal_column("0", Integer)
+        ).filter(ExternalUser.id == user_id),
+        select(
+            literal_column("'category'", Text), top_categories.c.name, top_categories.c.quantity.cast(Float),
+            no_number, no_number, top_categories.c.position
+        ).filter(top_categories.c.position <= top_n),
+        select(
+            literal_column("'product'", Text), top_products.c.name, top_products.c.quantity.cast(Float),
+            no_number, no_number, top_products.c.position
+        ).filter(top_products.c.position <= top_n),
+    ]
+    if include_daily_series:
+        day = cast(filtered_budgets.c.createdAt, Date)
+        parts.append(
+            select(
+                literal_column("'day'", Text), cast(day, Text), func.count(filtered_budgets.c.id).cast(Float),
+                func.sum(filtered_budgets.c.total).cast(Float), no_number, literal_column("0", Integer)
+            ).group_by(day)
+        )
+
+    rows = (await db.execute(union_all(*parts))).all()
+
+    summary = next(row for row in rows if row.kind == "summary")
+    user_name = next((row.name for row in rows if row.kind == "user"), None)
+
+    def ranking(kind):
+        ranked = sorted((row for row in rows if row.kind == kind), key=lambda row: row.position)
+        return [{"name": row.name, "count": int(row.quantity)} for row in ranked]
 
-    user_name = db.query(ExternalUser.name).filter(ExternalUser.id == user_id).scalar()
-    
-    return {
+    result = {
         "user_id": user_id,
         "user_name": user_name,
         "period_days": days_to_analyze,
         "summary": {
-            "approved_budgets_count": approved_budgets_summary.count or 0,
-            "total_sales_value": approved_budgets_summary.total_value or 0,
-            "average_budget_value": approved_budgets_summary.average_value or 0
+            "approved_budgets_count": int(summary.quantity or 0),
+            "total_sales_value": summary.total_value or 0,
+            "average_budget_value": summary.average_value or 0
         },
-        "top_categories": [{"name": name, "count": count} for name, count in top_categories],
-        "top_products": [{"name": name, "count": count} for name, count in top_products]
-    }
\ No newline at end of file
+        "top_categories": ranking("category"),
+        "top_products": ranking("product")
+    }
+    if include_daily_series:
+        result["daily_series"] = sorted(
+            ({"date": row.name, "approved_budgets_count": int(row.quantity), "total_sales_value": row.total_value or 0}
+             for row in rows if row.kind == "day"),
+            key=lambda point: point["date"]
+        )
+    return result
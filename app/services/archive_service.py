@@ -0,0 +1,123 @@
+"""
+Escrita de arquivos ZIP em streaming.
+
+Cada entrada é emitida assim que fica disponível e só ela fica em memória; do
+restante do arquivo o gerador guarda apenas os metadados do diretório central
+(nome, CRC, tamanho e posição). Os documentos já são comprimidos (PDF e DOCX),
+então as entradas são armazenadas sem compressão, o que também permite calcular
+o tamanho final do arquivo antes de começar a enviá-lo (ver `zip_size`).
+"""
+import struct
+import time
+import zlib
+from typing import AsyncIterator, Union
+
+EntryData = Union[bytes, AsyncIterator[bytes]]
+
+_VERSION = 20
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_MAX_SIZE = 0xFFFFFFFF
+_MAX_ENTRIES = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+
+
+def _dos_datetime(timestamp: float) -> tuple[int, int]:
+    t = time.localtime(timestamp)
+    date = (max(t.tm_year, 1980) - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    clock = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    return date, clock
+
+
+class _Entry:
+    def __init__(self, name: bytes, offset: int, flags: int, date: int, clock: int):
+        self.name = name
+        self.offset = offset
+        self.flags = flags
+        self.date = date
+        self.clock = clock
+        self.crc = 0
+        self.size = 0
+
+
+def _local_header(entry: _Entry) -> bytes:
+    return _LOCAL_HEADER.pack(
+        0x04034B50, _VERSION, entry.flags, 0, entry.clock, entry.date,
+        entry.crc, entry.size, entry.size, len(entry.name), 0
+    ) + entry.name
+
+
+def _central_directory(entries: list[_Entry], offset: int) -> bytes:
+    records = [
+        _CENTRAL_HEADER.pack(
+            0x02014B50, _VERSION, _VERSION, entry.flags, 0, entry.clock, entry.date,
+            entry.crc, entry.size, entry.size, len(entry.name), 0, 0, 0, 0, 0, entry.offset
+        ) + entry.name
+        for entry in entries
+    ]
+    directory = b"".join(records)
+    return directory + _END_OF_CENTRAL_DIRECTORY.pack(
+        0x06054B50, 0, 0, len(entries), len(entries), len(directory), offset, 0
+    )
+
+
+async def zip_stream(entries: AsyncIterator[tuple[str, EntryData]]) -> AsyncIterator[bytes]:
+    """
+    Gera o ZIP em partes a partir de pares `(nome, conteúdo)`.
+
+    Conteúdo em `bytes` sai com CRC e tamanho já no cabeçalho local. Conteúdo
+    em partes (iterador assíncrono) é repassado parte a parte, com o CRC
+    calculado incrementalmente e gravado num data descriptor após os dados.
+    Arquivos ZIP64 (mais de 4 GiB ou 65535 entradas) não são suportados.
+    """
+    written: list[_Entry] = []
+    offset = 0
+    date, clock = _dos_datetime(time.time())
+
+    async for name, data in entries:
+        if len(written) >= _MAX_ENTRIES:
+            raise ValueError("Número máximo de entradas do ZIP excedido")
+        streamed = not isinstance(data, (bytes, bytearray, memoryview))
+        flags = _FLAG_UTF8 | (_FLAG_DATA_DESCRIPTOR if streamed else 0)
+        entry = _Entry(name.encode(), offset, flags, date, clock)
+
+        if not streamed:
+            entry.crc, entry.size = zlib.crc32(data), len(data)
+            chunk = _local_header(entry)
+            yield chunk
+            yield bytes(data)
+            offset += len(chunk) + entry.size
+        else:
+            chunk = _local_header(entry)
+            yield chunk
+            offset += len(chunk)
+            async for part in data:
+                entry.crc = zlib.crc32(part, entry.crc)
+                entry.size += len(part)
+                offset += len(part)
+                yield part
+            chunk = _DATA_DESCRIPTOR.pack(0x08074B50, entry.crc, entry.size, entry.size)
+            yield chunk
+            offset += len(chunk)
+
+        if offset > _MAX_SIZE:
+            raise ValueError("O ZIP excedeu 4 GiB")
+        written.append(entry)
+
+    yield _central_directory(written, offset)
+
+
+def zip_size(entries: list[tuple[str, int]]) -> int:
+    """
+    Tamanho exato do ZIP gerado por `zip_stream` quando todas as entradas são
+    `bytes` de tamanho conhecido; usado como Content-Length.
+    """
+    size = _END_OF_CENTRAL_DIRECTORY.size
+    for name, data_size in entries:
+        name_size = len(name.encode())
+        size += _LOCAL_HEADER.size + name_size + data_size + _CENTRAL_HEADER.size + name_size
+    return size
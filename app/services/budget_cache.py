@@ -0,0 +1,172 @@
+"""
+Cache semântico dos orçamentos gerados pela IA. Descrições quase iguais
+("cozinha planejada em L com ilha" / "Cozinha planejada em L, com ilha!") reaproveitam
+a estrutura já validada em vez de uma nova chamada ao Gemini.
+
+A similaridade é estimada com MinHash sobre trigramas de caracteres da descrição
+normalizada; um índice LSH (bandas de MinHash) por usuário limita a comparação
+a poucos candidatos, que são então confirmados pela similaridade de Jaccard exata.
+"""
+import copy
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+BUDGET_CACHE_ENABLED = os.getenv("BUDGET_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+BUDGET_CACHE_MAX_ENTRIES = int(os.getenv("BUDGET_CACHE_MAX_ENTRIES", "2000"))
+BUDGET_CACHE_TTL_SECONDS = int(os.getenv("BUDGET_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+BUDGET_CACHE_SIMILARITY = float(os.getenv("BUDGET_CACHE_SIMILARITY", "0.85"))
+
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 4  # 16 bandas de 4 linhas: pares com Jaccard ≥ 0,7 quase sempre colidem
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _PRIME or 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERMUTATIONS)
+]
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# Números e letras soltas (medidas, quantidades, formatos como "em L" / "em U")
+# mudam o orçamento mesmo alterando poucos trigramas, então precisam ser iguais.
+# Ficam de fora "a", "e" e "o", que são artigos e conjunções.
+_KEY_TOKEN = re.compile(r"\b(?:\d+|[b-df-np-z])\b")
+
+
+def normalize(description: str) -> str:
+    """Minúsculas, sem acentos nem pontuação e com espaços simples."""
+    text = unicodedata.normalize("NFKD", description.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def shingles(normalized: str) -> frozenset[str]:
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(max(len(padded) - 2, 1)))
+
+
+def minhash(items: frozenset[str]) -> tuple[int, ...]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(item.encode(), digest_size=4).digest(), "big")
+        for item in items
+    ]
+    return tuple(min((a * h + b) % _PRIME & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature: tuple[int, ...]) -> list[tuple]:
+    return [(i, signature[i:i + BAND_ROWS]) for i in range(0, NUM_PERMUTATIONS, BAND_ROWS)]
+
+
+@dataclass
+class _Entry:
+    user_id: str
+    shingles: frozenset[str]
+    key_tokens: tuple[str, ...]
+    bands: list[tuple]
+    budget: dict
+    expires_at: float
+    hits: int = field(default=0)
+
+
+class SemanticBudgetCache:
+    """Índice em memória, por usuário, de orçamentos já validados, com TTL e descarte LRU."""
+
+    def __init__(
+        self,
+        max_entries: int = BUDGET_CACHE_MAX_ENTRIES,
+        ttl: int = BUDGET_CACHE_TTL_SECONDS,
+        threshold: float = BUDGET_CACHE_SIMILARITY
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        # (user_id, banda) -> ids das entradas que compartilham aquela banda
+        self._buckets: dict[tuple, set[int]] = {}
+        self._next_id = 0
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for band in entry.bands:
+            bucket = self._buckets.get((entry.user_id, band))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(entry.user_id, band)]
+
+    def get(self, user_id: str, description: str) -> Optional[dict]:
+        """Retorna uma cópia do orçamento mais parecido acima do limiar, ou None."""
+        normalized = normalize(description)
+        items = shingles(normalized)
+        key_tokens = tuple(_KEY_TOKEN.findall(normalized))
+        now = time.monotonic()
+
+        candidates = set()
+        for band in _bands(minhash(items)):
+            candidates |= self._buckets.get((user_id, band), set())
+
+        best_id, best_score = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.expires_at < now:
+                self._remove(entry_id)
+                continue
+            if entry.key_tokens != key_tokens:
+                continue
+            score = len(items & entry.shingles) / len(items | entry.shingles)
+            if score > best_score:
+                best_id, best_score = entry_id, score
+
+        if best_id is None or best_score < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry = self._entries[best_id]
+        entry.hits += 1
+        self._entries.move_to_end(best_id)
+        return copy.deepcopy(entry.budget)
+
+    def set(self, user_id: str, description: str, budget: dict):
+        normalized = normalize(description)
+        items = shingles(normalized)
+        entry = _Entry(
+            user_id=user_id,
+            shingles=items,
+            key_tokens=tuple(_KEY_TOKEN.findall(normalized)),
+            bands=_bands(minhash(items)),
+            budget=copy.deepcopy(budget),
+            expires_at=time.monotonic() + self.ttl
+        )
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        for band in entry.bands:
+            self._buckets.setdefault((user_id, band), set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": BUDGET_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "threshold": self.threshold,
+        }
+
+
+budget_cache = SemanticBudgetCache()
@@ -0,0 +1,298 @@
+import asyncio
+import copy
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Request
+from pydantic import BaseModel
+from sqlalchemy import inspect as sa_inspect
+
+import telemetry
+from schemas.pdf_schema import AIBudget
+from services import budget_cache, document_service, llm_service, reference_cache, render_service, single_flight
+
+SAFETY_SETTINGS = {
+    'HARM_CATEGORY_HARASSMENT': 'BLOCK_ONLY_HIGH',
+    'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_ONLY_HIGH',
+    'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_ONLY_HIGH',
+    'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_ONLY_HIGH',
+}
+
+OUTPUT_FORMATS = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_NON_FILENAME = re.compile(r"[^\w]+")
+
+# Documentos de um mesmo lote gerados ao mesmo tempo
+BATCH_CONCURRENCY = int(os.getenv("BUDGET_BATCH_CONCURRENCY", "8"))
+BATCH_RENDER_RETRIES = 10
+BATCH_RENDER_RETRY_SECONDS = 1
+
+# Geração + conserto, cada uma limitada por LLM_TIMEOUT_SECONDS
+_generation_flight = single_flight.SingleFlight(
+    "ai-budget",
+    timeout=float(os.getenv("BUDGET_GENERATION_TIMEOUT_SECONDS", "150"))
+)
+
+
+class BudgetNotFoundError(LookupError):
+    """Cliente, usuário ou configurações necessários ao orçamento não existem."""
+
+
+class BudgetGenerationError(ValueError):
+    """A resposta da IA não pôde ser convertida em um orçamento."""
+
+
+async def _load_settings(user_id: str):
+    user = await reference_cache.users.get(user_id)
+    if not user or not user.settings:
+        raise BudgetNotFoundError("Usuário ou suas configurações não encontrados.")
+    return user.settings
+
+
+async def load_customer_and_settings(customer_id: str, user_id: str):
+    """
+    Busca o cliente e as configurações da empresa do usuário (snapshots do
+    reference_cache; só consulta o banco externo no primeiro acesso ou após o TTL).
+    """
+    customer, settings = await asyncio.gather(reference_cache.customers.get(customer_id), _load_settings(user_id))
+
+    if not customer:
+        raise BudgetNotFoundError("Cliente não encontrado.")
+
+    return customer, settings
+
+
+async def load_batch_context(customer_ids: list[str], user_id: str):
+    """
+    Versão em lote de `load_customer_and_settings`: os clientes que não estão em
+    cache são buscados numa única consulta. Retorna `({customer_id: cliente},
+    configurações)`; clientes inexistentes simplesmente ficam fora do dicionário.
+    """
+    customers, settings = await asyncio.gather(reference_cache.customers.get_many(customer_ids), _load_settings(user_id))
+    return customers, settings
+
+
+def build_prompt(description: str) -> str:
+    return f"""
+    Você é um especialista em vendas de móveis planejados. Sua tarefa é criar um orçamento detalhado com base no pedido de um cliente.
+    Pedido do Cliente: "{description}"
+    Gere uma lista de categorias e produtos para este orçamento. Calcule o preço de cada produto e o total geral.
+    Responda APENAS com um objeto JSON válido, sem nenhum texto ou formatação adicional antes ou depois. O JSON deve ter a seguinte estrutura:
+    {{
+      "name": "Orçamento para Home Office",
+      "categories": [
+        {{
+          "name": "Mobiliário Principal",
+          "products": [
+            {{"name": "Escrivaninha em L em MDF amadeirado", "price": 1800.00}},
+            {{"name": "Estante de livros alta (5 prateleiras)", "price": 1250.50}},
+            {{"name": "Gaveteiro com 3 gavetas e rodízios", "price": 750.00}}
+          ]
+        }}
+      ],
+      "total": 3800.50
+    }}
+    """
+
+
+def _budget_generation_config() -> dict:
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": llm_service.response_schema(AIBudget),
+    }
+
+
+def parse_ai_budget(raw_text: str) -> AIBudget:
+    """
+    Converte a resposta da IA no orçamento validado. Antes do parse aplica os
+    consertos locais mais comuns (texto em volta do JSON, cercas de markdown e
+    vírgulas sobrando). Lança ValueError se o JSON continuar inválido.
+    """
+    json_start = raw_text.find('{')
+    json_end = raw_text.rfind('}')
+    if json_start == -1 or json_end == -1:
+        raise ValueError("Não foi encontrado um objeto JSON na resposta da IA.")
+
+    json_text = _TRAILING_COMMA.sub(r"\1", raw_text[json_start:json_end+1])
+    budget = AIBudget.model_validate(json.loads(json_text))
+    # O total informado pela IA não é confiável; vale a soma dos itens
+    budget.total = round(sum(p.price for c in budget.categories for p in c.products), 2)
+    return budget
+
+
+def build_repair_prompt(raw_text: str, error: Exception) -> str:
+    return f"""
+    O JSON abaixo deveria ser um orçamento, mas é inválido.
+    Erro encontrado: {error}
+    Corrija apenas o necessário para que ele siga o schema, mantendo os nomes e os preços existentes.
+    JSON:
+    {raw_text}
+    """
+
+
+async def generate_ai_budget(description: str, http_request: Optional[Request] = None) -> dict:
+    """
+    Pede ao Gemini a estrutura do orçamento (categorias, produtos e total) no
+    modo JSON com schema. Se a resposta vier inválida, faz uma única chamada de
+    conserto com o modelo barato em vez de gerar o orçamento de novo.
+    """
+    generation_config = _budget_generation_config()
+    raw_text = await llm_service.generate(
+        "budget",
+        build_prompt(description),
+        http_request=http_request,
+        generation_config=generation_config,
+        safety_settings=SAFETY_SETTINGS
+    )
+    try:
+        with telemetry.span("parse"):
+            return parse_ai_budget(raw_text).model_dump()
+    except ValueError as e:
+        print("Resposta da IA inválida, tentando conserto:", e)
+        error = e
+
+    repaired_text = await llm_service.generate(
+        "repair",
+        build_repair_prompt(raw_text, error),
+        http_request=http_request,
+        generation_config=generation_config
+    )
+    try:
+        with telemetry.span("parse"):
+            return parse_ai_budget(repaired_text).model_dump()
+    except ValueError as e:
+        raise BudgetGenerationError(f"Resposta da IA inválida mesmo após o conserto: {e}")
+
+
+async def get_ai_budget(
+    user_id: str,
+    description: str,
+    http_request: Optional[Request] = None,
+    use_cache: bool = True
+) -> tuple[dict, bool]:
+    """
+    Retorna a estrutura do orçamento e se ela veio do cache semântico. Pedidos
+    parecidos do mesmo usuário reaproveitam um orçamento já validado.
+    """
+    use_cache = use_cache and budget_cache.BUDGET_CACHE_ENABLED
+    if use_cache:
+        cached = budget_cache.budget_cache.get(user_id, description)
+        if cached is not None:
+            return cached, True
+
+    async def generate():
+        ai_budget_data = await generate_ai_budget(description)
+        if use_cache:
+            budget_cache.budget_cache.set(user_id, description, ai_budget_data)
+        return ai_budget_data
+
+    # Pedidos iguais feitos ao mesmo tempo (antes de o primeiro chegar ao cache)
+    # esperam a mesma geração; quem desconecta só deixa de esperar
+    key = f"{user_id}:{int(use_cache)}:{budget_cache.normalize(description)}"
+    ai_budget_data = await _generation_flight.do(key, generate, http_request=http_request)
+    return copy.deepcopy(ai_budget_data), False
+
+
+def build_budget_data(ai_budget_data: dict, customer, settings) -> dict:
+    """Monta o contexto usado pelos templates de PDF e DOCX."""
+    return {
+        "budget": {
+            "id": f"{datetime.now().strftime('%Y%m%d')}",
+            "name": ai_budget_data.get("name", "Orçamento Personalizado"),
+            "categories": ai_budget_data.get("categories", []),
+            "total": ai_budget_data.get("total", 0.0),
+            "createdAt": datetime.now()
+        },
+        "customer": customer,
+        "settings": settings,
+        "timedelta": timedelta
+    }
+
+
+def _plain(obj):
+    """Copia as colunas de um objeto do SQLAlchemy (ou de um snapshot) para um dict; os templates acessam os dois da mesma forma."""
+    if obj is None or isinstance(obj, dict):
+        return obj
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return {attr.key: getattr(obj, attr.key) for attr in sa_inspect(obj).mapper.column_attrs}
+
+
+def plain_budget_data(budget_data: dict) -> dict:
+    """Contexto do template só com dicts, para ser enviado a outro processo."""
+    return {**budget_data, "customer": _plain(budget_data["customer"]), "settings": _plain(budget_data["settings"])}
+
+
+def render_document(budget_data: dict, output_format: str) -> bytes:
+    """Renderiza o orçamento no formato pedido ('pdf' ou 'docx')."""
+    if output_format == 'docx':
+        return document_service.generate_budget_docx(budget_data)
+    return document_service.generate_budget_pdf(budget_data)
+
+
+async def render_document_async(budget_data: dict, output_format: str) -> bytes:
+    """
+    Versão para uso nos routers: PDF e DOCX são gerados no pool de processos do
+    render_service, fora do event loop.
+    """
+    if output_format == 'docx':
+        return await render_service.render_docx(plain_budget_data(budget_data))
+    return await render_service.render_pdf(document_service.render_budget_html(budget_data))
+
+
+async def _render_batch_item(budget_data: dict, output_format: str) -> bytes:
+    # No lote, fila de renderização cheia significa esperar a vez, não falhar o item
+    for _ in range(BATCH_RENDER_RETRIES):
+        try:
+            return await render_document_async(budget_data, output_format)
+        except render_service.RenderQueueFullError:
+            await asyncio.sleep(BATCH_RENDER_RETRY_SECONDS)
+    return await render_document_async(budget_data, output_format)
+
+
+def batch_filename(index: int, customer, output_format: str) -> str:
+    name = _NON_FILENAME.sub("-", customer.name).strip("-").lower() if customer else "cliente"
+    return f"{index + 1:02d}-{name or 'cliente'}.{output_format}"
+
+
+async def generate_batch(items, customers: dict, settings, user_id: str, use_cache: bool = True):
+    """
+    Gera os documentos de um lote em paralelo (no máximo BATCH_CONCURRENCY por
+    vez) e os entrega na ordem em que ficam prontos, como tuplas
+    `(índice, item, bytes, erro)`. A falha de um item não interrompe os demais:
+    ele é entregue com `bytes` None e a mensagem em `erro`.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(item):
+        customer = customers.get(item.customer_id)
+        if customer is None:
+            raise BudgetNotFoundError("Cliente não encontrado.")
+        async with semaphore:
+            ai_budget_data, _ = await get_ai_budget(user_id, item.description, use_cache=use_cache)
+            budget_data = build_budget_data(ai_budget_data, customer, settings)
+            return await _render_batch_item(budget_data, item.output_format)
+
+    tasks = {asyncio.create_task(run(item)): index for index, item in enumerate(items)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = tasks[task]
+                if task.exception() is not None:
+                    yield index, items[index], None, str(task.exception()) or type(task.exception()).__name__
+                else:
+                    yield index, items[index], task.result(), None
+    finally:
+        # Cliente desconectou ou o consumidor parou de iterar: cancela o restante
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,272 @@
+"""
+Documentos publicados em app/static/budgets, servidos diretamente pelo mount
+/static. Cada documento recebe um id aleatório (não adivinhável) e um prazo de
+validade; um manifesto em JSON indexa os documentos, de forma que nenhuma
+consulta precisa listar o diretório. O manifesto fica fora da pasta pública,
+para não expor os ids. Vários workers compartilham a pasta: toda alteração do
+manifesto é feita sob um lock de arquivo. Quando a pasta passa da cota, os
+documentos acessados há mais tempo são removidos primeiro.
+"""
+import asyncio
+import json
+import os
+import pathlib
+import secrets
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+APP_DIR = pathlib.Path(__file__).resolve().parent.parent
+STATIC_DIR = APP_DIR / "static"
+BUDGETS_DIR = STATIC_DIR / "budgets"
+MANIFEST_PATH = pathlib.Path(os.getenv("BUDGET_STORE_MANIFEST", APP_DIR.parent / "temp" / "budgets-manifest.json"))
+LOCK_PATH = MANIFEST_PATH.with_suffix(".lock")
+
+BUDGET_STORE_TTL = timedelta(hours=float(os.getenv("BUDGET_STORE_TTL_HOURS", "72")))
+BUDGET_STORE_MAX_BYTES = int(os.getenv("BUDGET_STORE_MAX_MB", "1024")) * 1024 * 1024
+GC_INTERVAL_SECONDS = 600
+# Intervalo mínimo entre gravações do último acesso de um mesmo documento
+ACCESS_FLUSH_SECONDS = 60
+
+
+class _Snapshot(NamedTuple):
+    mtime: Optional[int]
+    entries: dict[str, dict]
+    by_key: dict[tuple[str, str], str]
+
+
+# Trocado por inteiro a cada leitura do manifesto e nunca alterado: as consultas
+# não precisam de lock. Só as gravações usam `_thread_lock` e o lock de arquivo.
+_snapshot = _Snapshot(None, {}, {})
+_thread_lock = threading.Lock()
+_hits = 0
+_misses = 0
+# Acessos ainda não gravados no manifesto (token -> instante do acesso)
+_accessed: dict[str, str] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def url_for(token: str, output_format: str) -> str:
+    return f"/static/budgets/{token}.{output_format}"
+
+
+def _set_manifest(manifest: dict, mtime):
+    global _snapshot
+    _snapshot = _Snapshot(mtime, manifest, {(entry["key"], entry["format"]): token for token, entry in manifest.items()})
+
+
+def _current() -> _Snapshot:
+    """Snapshot do manifesto, relido do disco se outro worker o alterou."""
+    snapshot = _snapshot
+    try:
+        mtime = MANIFEST_PATH.stat().st_mtime_ns
+        if mtime != snapshot.mtime:
+            _set_manifest(json.loads(MANIFEST_PATH.read_text()), mtime)
+    except FileNotFoundError:
+        if snapshot.mtime is not None:
+            _set_manifest({}, None)
+    return _snapshot
+
+
+def _write_manifest(manifest: dict):
+    partial_path = MANIFEST_PATH.with_name(f"manifest.{os.getpid()}.partial")
+    partial_path.write_text(json.dumps(manifest))
+    partial_path.replace(MANIFEST_PATH)
+    _set_manifest(manifest, MANIFEST_PATH.stat().st_mtime_ns)
+
+
+def _lock_file(lock_file, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            # LK_LOCK desiste após 10 tentativas; continua esperando
+
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _apply_accesses(manifest: dict):
+    """Copia para o manifesto os acessos registrados por `find` neste processo."""
+    global _accessed
+    accessed, _accessed = _accessed, {}
+    for token, accessed_at in accessed.items():
+        entry = manifest.get(token)
+        if entry is not None and accessed_at > entry.get("last_access", entry["created_at"]):
+            manifest[token] = {**entry, "last_access": accessed_at}
+
+
+@contextmanager
+def _locked_manifest(blocking: bool = True):
+    """
+    Lê o manifesto mais recente sob lock exclusivo, já com os acessos pendentes;
+    o chamador grava as alterações. Com `blocking=False`, entrega None se outra
+    gravação estiver com o lock.
+    """
+    BUDGETS_DIR.mkdir(parents=True, exist_ok=True)
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    if not _thread_lock.acquire(blocking=blocking):
+        yield None
+        return
+    try:
+        with open(LOCK_PATH, "w") as lock_file:
+            if not _lock_file(lock_file, blocking):
+                yield None
+                return
+            try:
+                manifest = dict(_current().entries)
+                _apply_accesses(manifest)
+                yield manifest
+            finally:
+                _unlock_file(lock_file)
+    finally:
+        _thread_lock.release()
+
+
+def _remove(manifest: dict, token: str):
+    entry = manifest.pop(token)
+    (BUDGETS_DIR / entry["file"]).unlink(missing_ok=True)
+
+
+def find(key: str, output_format: str) -> Optional[str]:
+    """
+    Token do documento já publicado com essa chave de conteúdo, se ainda válido.
+    Não espera as gravações em andamento, mas faz I/O de disco (stat e, se o
+    manifesto mudou, a sua leitura): use fora do event loop.
+
+    O acesso fica registrado para a ordem de remoção por cota. Ele é gravado no
+    manifesto junto com a próxima alteração, ou aqui mesmo se o último acesso
+    gravado tiver mais de ACCESS_FLUSH_SECONDS e o lock estiver livre.
+    """
+    global _hits, _misses
+    snapshot = _current()
+    token = snapshot.by_key.get((key, output_format))
+    entry = snapshot.entries.get(token)
+    now = _now()
+    if entry is None or datetime.fromisoformat(entry["expires_at"]) < now or not (BUDGETS_DIR / entry["file"]).exists():
+        _misses += 1
+        return None
+    _hits += 1
+    _accessed[token] = now.isoformat()
+    last_access = datetime.fromisoformat(entry.get("last_access", entry["created_at"]))
+    if (now - last_access).total_seconds() > ACCESS_FLUSH_SECONDS:
+        with _locked_manifest(blocking=False) as manifest:
+            if manifest is not None:
+                _write_manifest(manifest)
+    return token
+
+
+def path_for(token: str, output_format: str) -> pathlib.Path:
+    return BUDGETS_DIR / f"{token}.{output_format}"
+
+
+def publish(key: str, output_format: str, data: bytes) -> str:
+    """
+    Grava o documento na pasta pública e retorna seu token. Se o mesmo conteúdo
+    já estiver publicado, apenas renova o prazo. Os documentos acessados há mais
+    tempo são removidos enquanto a pasta passar da cota de disco.
+    """
+    with _locked_manifest() as manifest:
+        now = _now()
+        token = _current().by_key.get((key, output_format))
+        if token is None or not (BUDGETS_DIR / manifest[token]["file"]).exists():
+            token = secrets.token_urlsafe(24)
+            file_name = f"{token}.{output_format}"
+            partial_path = BUDGETS_DIR / f"{file_name}.partial"
+            partial_path.write_bytes(data)
+            partial_path.replace(BUDGETS_DIR / file_name)
+            manifest[token] = {
+                "file": file_name,
+                "key": key,
+                "format": output_format,
+                "size": len(data),
+                "created_at": now.isoformat(),
+            }
+        manifest[token] = {
+            **manifest[token],
+            "expires_at": (now + BUDGET_STORE_TTL).isoformat(),
+            "last_access": now.isoformat(),
+        }
+
+        total_bytes = sum(entry["size"] for entry in manifest.values())
+        for old_token in sorted(manifest, key=lambda t: manifest[t].get("last_access", manifest[t]["created_at"])):
+            if total_bytes <= BUDGET_STORE_MAX_BYTES:
+                break
+            if old_token == token:
+                continue
+            total_bytes -= manifest[old_token]["size"]
+            _remove(manifest, old_token)
+
+        _write_manifest(manifest)
+    return token
+
+
+def stats() -> dict:
+    entries = _current().entries
+    lookups = _hits + _misses
+    return {
+        "files": len(entries),
+        "bytes": sum(entry["size"] for entry in entries.values()),
+        "max_bytes": BUDGET_STORE_MAX_BYTES,
+        "hits": _hits,
+        "misses": _misses,
+        "hit_rate": round(_hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+def collect_garbage() -> int:
+    """
+    Remove os documentos vencidos e os arquivos que não constam no manifesto
+    (ex.: gravações interrompidas). Retorna quantos arquivos foram apagados.
+    """
+    removed = 0
+    with _locked_manifest() as manifest:
+        now = _now()
+        for token in [t for t, entry in manifest.items() if datetime.fromisoformat(entry["expires_at"]) < now]:
+            _remove(manifest, token)
+            removed += 1
+        _write_manifest(manifest)
+
+        known_files = {entry["file"] for entry in manifest.values()}
+        for entry in os.scandir(BUDGETS_DIR):
+            if entry.is_file() and entry.name not in known_files and not entry.name.startswith("."):
+                # Arquivos parciais recentes podem ser de uma gravação em andamento
+                age = now.timestamp() - entry.stat().st_mtime
+                if not entry.name.endswith(".partial") or age > GC_INTERVAL_SECONDS:
+                    os.unlink(entry.path)
+                    removed += 1
+    return removed
+
+
+async def run_garbage_collector():
+    """Tarefa de fundo: limpa periodicamente os documentos publicados vencidos."""
+    while True:
+        try:
+            await asyncio.to_thread(collect_garbage)
+        except Exception as e:
+            print("Erro ao limpar documentos publicados:", e)
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
@@ -0,0 +1,121 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class InMemoryBackend:
+    """Cache em memória do processo, com expiração por TTL e descarte LRU."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Cache compartilhado entre workers. Aceita qualquer cliente com a interface
+    assíncrona do redis-py (`get`, `set(..., ex=)`, `delete`), o que permite usar
+    um substituto local em desenvolvimento e testes. Os valores são guardados em JSON.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: int):
+        await self.client.set(key, json.dumps(value, default=str), ex=ttl)
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+
+class ResponseCache:
+    """Cache de respostas com namespace, TTL padrão e métricas de acerto."""
+
+    def __init__(self, backend, namespace: str, ttl: int):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.backend.get(self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        await self.backend.set(self._key(key), value, ttl or self.ttl)
+
+    async def delete(self, key: str):
+        await self.backend.delete(self._key(key))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.backend.evictions,
+        }
+
+
+def create_backend():
+    """
+    Escolhe o backend pelo ambiente: CACHE_BACKEND=redis (com REDIS_URL) usa o Redis,
+    qualquer outro valor usa o cache em memória do processo.
+    """
+    if os.getenv("CACHE_BACKEND", "memory").lower() == "redis":
+        try:
+            import redis.asyncio as redis
+            return RedisBackend(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+        except ImportError:
+            print("Alerta: pacote redis não instalado, usando cache em memória.")
+    return InMemoryBackend(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Indica se o header If-None-Match do cliente contém o ETag atual."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
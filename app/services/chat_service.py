@@ -0,0 +1,92 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from models.conversation import Conversation
+from models.session import Session as SessionModel
+
+
+def encode_cursor(created_at: datetime, session_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{session_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Decodifica o cursor gerado por `encode_cursor`. Lança ValueError se for inválido."""
+    try:
+        created_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), session_id
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+async def get_history_page(
+    db: AsyncSession,
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    conversations_per_session: Optional[int] = None,
+):
+    """
+    Retorna uma página do histórico de sessões do usuário com as conversas de cada uma.
+
+    São feitas sempre duas consultas, independentemente do número de sessões: uma
+    para as sessões (paginação por keyset em `created_at, id`, da mais recente para
+    a mais antiga) e outra, em lote, para as conversas de todas elas.
+    `conversations_per_session` limita cada sessão às N conversas mais recentes.
+
+    Retorna `(sessões, próximo_cursor)`; o cursor é None quando não há mais páginas.
+    """
+    sessions_query = select(SessionModel).filter(SessionModel.user_id == user_id)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        sessions_query = sessions_query.filter(
+            tuple_(SessionModel.created_at, SessionModel.id) < tuple_(cursor_created_at, cursor_id)
+        )
+    sessions_query = sessions_query.order_by(SessionModel.created_at.desc(), SessionModel.id.desc())
+    if limit:
+        sessions_query = sessions_query.limit(limit + 1)
+
+    sessions = (await db.execute(sessions_query)).scalars().all()
+
+    next_cursor = None
+    if limit and len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_cursor(sessions[-1].created_at, sessions[-1].id)
+
+    conversations_by_session = {session.id: [] for session in sessions}
+    if sessions:
+        if conversations_per_session:
+            position = func.row_number().over(
+                partition_by=Conversation.session_id,
+                order_by=Conversation.created_at.desc()
+            ).label("position")
+            ranked = select(Conversation, position)\
+                .filter(Conversation.session_id.in_(conversations_by_session.keys()))\
+                .subquery()
+            conversation = aliased(Conversation, ranked)
+            conversations_query = select(conversation).filter(ranked.c.position <= conversations_per_session)
+        else:
+            conversation = Conversation
+            conversations_query = select(conversation)\
+                .filter(conversation.session_id.in_(conversations_by_session.keys()))
+
+        conversations_query = conversations_query.order_by(conversation.session_id, conversation.created_at.asc())
+        for item in (await db.execute(conversations_query)).scalars():
+            conversations_by_session[item.session_id].append(item)
+
+    result = [
+        {
+            "id": session.id,
+            "title": session.title,
+            "title_status": session.title_status,
+            "created_at": session.created_at,
+            "conversations": conversations_by_session[session.id]
+        }
+        for session in sessions
+    ]
+    return result, next_cursor
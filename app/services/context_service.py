@@ -0,0 +1,165 @@
+"""
+Montagem do contexto enviado ao Gemini em cada pergunta do chat.
+
+O contexto de uma sessão é formado pelo resumo das conversas antigas (gravado em
+`sessions.summary`) seguido das conversas mais recentes, na íntegra, até o limite
+de tokens. Depois de cada resposta, as conversas que saíram da janela recente são
+incorporadas ao resumo em segundo plano, de forma que o tamanho do prompt fique
+estável independentemente da duração da conversa.
+"""
+import asyncio
+import math
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models.conversation import Conversation
+from models.session import Session as SessionModel
+from services import llm_service
+
+# Orçamento de tokens do histórico (resumo + conversas recentes) em cada pergunta
+CONTEXT_MAX_TOKENS = int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "6000"))
+# Conversas recentes mantidas na íntegra; o que passar disso vai para o resumo
+CONTEXT_RECENT_TOKENS = int(os.getenv("CHAT_CONTEXT_RECENT_TOKENS", "3000"))
+CONTEXT_MAX_TURNS = int(os.getenv("CHAT_CONTEXT_MAX_TURNS", "20"))
+SUMMARY_MAX_WORDS = int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "300"))
+SUMMARY_BATCH_TURNS = 40
+
+# Estimativa local: em português o tokenizador do Gemini fica perto de 4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+_summarizing: dict[str, asyncio.Task] = {}
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Estimativa do número de tokens de um texto, sem chamar a API."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _turn_tokens(conversation: Conversation) -> int:
+    return count_tokens(conversation.prompt) + count_tokens(conversation.response)
+
+
+def _unsummarized(session: SessionModel):
+    query = select(Conversation).filter(Conversation.session_id == session.id)
+    if session.summarized_until_id is not None:
+        # Keyset em (created_at, id): conversas com o mesmo horário da última
+        # resumida não ficam de fora
+        query = query.filter(
+            tuple_(Conversation.created_at, Conversation.id)
+            > tuple_(session.summarized_until, session.summarized_until_id)
+        )
+    elif session.summarized_until is not None:
+        # Resumos gravados antes de `summarized_until_id` existir
+        query = query.filter(Conversation.created_at > session.summarized_until)
+    return query
+
+
+async def build_contents(db: AsyncSession, session: SessionModel, prompt: str) -> list[dict]:
+    """
+    Retorna o `contents` da chamada ao Gemini: resumo da sessão, conversas
+    recentes que couberem no orçamento de tokens e, por último, o novo prompt.
+    """
+    recent = (await db.execute(
+        _unsummarized(session)
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(CONTEXT_MAX_TURNS)
+    )).scalars().all()
+
+    budget = CONTEXT_MAX_TOKENS - count_tokens(session.summary)
+    turns = []
+    for conversation in recent:
+        budget -= _turn_tokens(conversation)
+        if budget < 0:
+            break
+        turns.append(conversation)
+
+    contents = []
+    if session.summary:
+        contents.append({"role": "user", "parts": [f"Resumo da nossa conversa até aqui:\n{session.summary}"]})
+        contents.append({"role": "model", "parts": ["Entendido, vou considerar esse contexto."]})
+    for conversation in reversed(turns):
+        contents.append({"role": "user", "parts": [conversation.prompt]})
+        contents.append({"role": "model", "parts": [conversation.response or ""]})
+    contents.append({"role": "user", "parts": [prompt]})
+    return contents
+
+
+def build_summary_prompt(summary: Optional[str], conversations: list[Conversation]) -> str:
+    transcript = "\n".join(
+        f"Usuário: {c.prompt}\nAssistente: {c.response}" for c in conversations
+    )
+    return f"""
+    Você mantém o resumo de uma conversa entre um usuário e um assistente.
+    Resumo atual: {summary or "(vazio)"}
+    Novas trocas de mensagens:
+    {transcript}
+    Escreva o resumo atualizado, com no máximo {SUMMARY_MAX_WORDS} palavras, preservando fatos,
+    decisões, números e preferências do usuário. Responda apenas com o resumo.
+    """
+
+
+async def summarize_session(session_id: str):
+    """
+    Incorpora ao resumo da sessão as conversas que já saíram da janela recente.
+    A gravação só acontece se nenhum outro processo tiver avançado o resumo nesse meio tempo.
+    """
+    while True:
+        async with AsyncSessionLocal() as db:
+            session = await db.get(SessionModel, session_id)
+            if session is None:
+                return
+            conversations = (await db.execute(
+                _unsummarized(session).order_by(Conversation.created_at.asc(), Conversation.id.asc())
+            )).scalars().all()
+
+        recent_tokens = 0
+        keep = len(conversations)
+        while keep > 0 and recent_tokens + _turn_tokens(conversations[keep - 1]) <= CONTEXT_RECENT_TOKENS:
+            recent_tokens += _turn_tokens(conversations[keep - 1])
+            keep -= 1
+        to_fold = conversations[:keep][:SUMMARY_BATCH_TURNS]
+        if not to_fold:
+            return
+
+        summary = (await llm_service.generate("summary", build_summary_prompt(session.summary, to_fold))).strip()
+        summarized_until: datetime = to_fold[-1].created_at
+
+        async with AsyncSessionLocal() as db:
+            current = (
+                SessionModel.summarized_until.is_(None)
+                if session.summarized_until is None
+                else SessionModel.summarized_until == session.summarized_until
+            )
+            current_id = (
+                SessionModel.summarized_until_id.is_(None)
+                if session.summarized_until_id is None
+                else SessionModel.summarized_until_id == session.summarized_until_id
+            )
+            updated = await db.execute(
+                update(SessionModel)
+                .where(SessionModel.id == session_id, current, current_id)
+                .values(summary=summary, summarized_until=summarized_until, summarized_until_id=to_fold[-1].id)
+            )
+            await db.commit()
+        if updated.rowcount == 0 or len(to_fold) == keep:
+            return
+
+
+async def _summarize_in_background(session_id: str):
+    try:
+        await summarize_session(session_id)
+    except Exception as e:
+        print(f"Erro ao resumir a sessão {session_id}:", e)
+    finally:
+        _summarizing.pop(session_id, None)
+
+
+def schedule_summary(session_id: str):
+    """Agenda o resumo da sessão, sem duplicar um que já esteja em andamento."""
+    if session_id not in _summarizing:
+        _summarizing[session_id] = asyncio.create_task(_summarize_in_background(session_id))
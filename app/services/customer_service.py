@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import json
+from typing import Optional
+
+from sqlalchemy import select, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.external_data import ExternalCustomer
+
+# Só as colunas expostas em CustomerResponse; cpf, cnpj e birthdate nunca saem do banco
+CUSTOMER_COLUMNS = (
+    ExternalCustomer.id,
+    ExternalCustomer.name,
+    ExternalCustomer.phone,
+    ExternalCustomer.email,
+    ExternalCustomer.address,
+)
+# A partir desse tamanho a busca também procura o termo no meio do nome. Com um
+# índice pg_trgm (gin_trgm_ops) em "Customer".name o ILIKE '%termo%' usa o índice.
+CONTAINS_SEARCH_MIN_LENGTH = 3
+
+
+def encode_cursor(name: str, customer_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, customer_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Decodifica o cursor gerado por `encode_cursor`. Lança ValueError se for inválido."""
+    try:
+        name, customer_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return name, customer_id
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def list_customers(
+    edb: AsyncSession,
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
+):
+    """
+    Retorna uma página dos clientes do usuário, ordenados por nome, com paginação
+    por keyset em `(name, id)`. `search` filtra pelo início do nome (autocomplete)
+    ou, com termos a partir de 3 caracteres, por qualquer trecho do nome.
+
+    Retorna `(linhas, próximo_cursor)`; o cursor é None quando não há mais páginas.
+    """
+    query = select(*CUSTOMER_COLUMNS).filter(ExternalCustomer.userId == user_id)
+
+    search = (search or "").strip()
+    if search:
+        term = _escape_like(search)
+        condition = ExternalCustomer.name.ilike(f"{term}%", escape="\\")
+        if len(search) >= CONTAINS_SEARCH_MIN_LENGTH:
+            condition = or_(condition, ExternalCustomer.name.ilike(f"%{term}%", escape="\\"))
+        query = query.filter(condition)
+
+    if cursor:
+        cursor_name, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(ExternalCustomer.name, ExternalCustomer.id) > tuple_(cursor_name, cursor_id))
+    query = query.order_by(ExternalCustomer.name, ExternalCustomer.id)
+    if limit:
+        query = query.limit(limit + 1)
+
+    rows = (await edb.execute(query)).all()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].name, rows[-1].id)
+    return rows, next_cursor
+
+
+def compute_etag(rows, next_cursor: Optional[str]) -> str:
+    """ETag da página calculado sobre as tuplas do banco, antes de qualquer serialização."""
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    digest.update((next_cursor or "").encode())
+    return f'"{digest.hexdigest()}"'
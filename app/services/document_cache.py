@@ -0,0 +1,72 @@
+"""
+Chave de conteúdo dos documentos renderizados: um hash do contexto do template
+(orçamento, campos do cliente e das configurações), da versão dos templates e do
+formato. Os documentos em si ficam no budget_store, indexados por essa chave:
+renders idênticos viram leitura de arquivo.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import time
+from datetime import date, datetime
+
+APP_DIR = pathlib.Path(__file__).resolve().parent.parent
+TEMPLATE_DIR = APP_DIR / "templates"
+
+DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Intervalo mínimo entre verificações das datas de modificação dos templates
+TEMPLATE_CHECK_SECONDS = float(os.getenv("TEMPLATE_CHECK_SECONDS", "5"))
+
+_template_version: tuple[tuple, str] = ((), "")
+_template_checked_at = float("-inf")
+
+
+def template_version() -> str:
+    """
+    Hash do conteúdo de app/templates; recalculado só quando algum arquivo muda.
+    Faz I/O de disco: chame fora do event loop (ver `document_key`).
+    """
+    global _template_version, _template_checked_at
+    if time.monotonic() - _template_checked_at < TEMPLATE_CHECK_SECONDS:
+        return _template_version[1]
+    _template_checked_at = time.monotonic()
+    files = sorted(path for path in TEMPLATE_DIR.iterdir() if path.is_file())
+    stamp = tuple((path.name, path.stat().st_mtime_ns, path.stat().st_size) for path in files)
+    if stamp != _template_version[0]:
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _template_version = (stamp, digest.hexdigest())
+    return _template_version[1]
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def document_key(plain_budget_data: dict, output_format: str) -> str:
+    """
+    Chave do documento. Recebe o contexto já sem objetos do SQLAlchemy (ver
+    budget_service.plain_budget_data). A data de emissão entra só com o dia, que
+    é a granularidade dos prazos do orçamento: gerar de novo o mesmo orçamento no
+    mesmo dia devolve o documento já emitido. Como consulta os templates em
+    disco, os routers a chamam com `asyncio.to_thread`.
+    """
+    budget = dict(plain_budget_data["budget"])
+    created_at = budget.get("createdAt")
+    if isinstance(created_at, datetime):
+        budget["createdAt"] = created_at.date()
+    payload = {
+        "budget": budget,
+        "customer": plain_budget_data["customer"],
+        "settings": plain_budget_data["settings"],
+        "template": template_version(),
+        "format": output_format,
+    }
+    serialized = json.dumps(payload, sort_keys=True, default=_json_default, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode()).hexdigest()
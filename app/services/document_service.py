@@ -1,10 +1,12 @@
 from jinja2 import Environment, FileSystemLoader
 from weasyprint import HTML
+from services import render_cache
 from docxtpl import DocxTemplate
 from datetime import timedelta
 import io
-import pathlib 
+import pathlib
 import os
+import uuid
 
 SERVICE_DIR = pathlib.Path(__file__).resolve().parent
 
@@ -15,36 +17,104 @@ TEMPLATE_DIR = APP_DIR / "templates"
 
 env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
 pdf_template = env.get_template("budget_template.html")
+pdf_stylesheet_path = TEMPLATE_DIR / "budget_template.css"
+
+def render_budget_html(budget_data):
+    """Renderiza o HTML do orçamento, que depois é convertido em PDF."""
+    return pdf_template.render(budget_data)
+
+def html_to_pdf(html_out):
+    """
+    Converte o HTML do orçamento em PDF reaproveitando a folha de estilo compilada,
+    a configuração de fontes e as imagens já baixadas pelo processo.
+    """
+    return HTML(string=html_out, url_fetcher=render_cache.cached_url_fetcher).write_pdf(
+        stylesheets=[render_cache.get_stylesheet(pdf_stylesheet_path)],
+        font_config=render_cache.get_font_config()
+    )
 
 def generate_budget_pdf(budget_data):
     """Gera um PDF de orçamento a partir dos dados processados."""
-    html_out = pdf_template.render(budget_data)
-    return HTML(string=html_out).write_pdf()
+    html_out = render_budget_html(budget_data)
+    return html_to_pdf(html_out)
 
 
 docx_template_path = TEMPLATE_DIR / "budget_template.docx"
+# Pasta opcional onde uma cópia de cada DOCX gerado é gravada (ex.: para depuração)
+DOCX_COPY_DIR = os.getenv("DOCX_COPY_DIR")
+
+
+class _CompiledXmlEnvironment(Environment):
+    """Ambiente Jinja que compila cada parte XML do template DOCX uma única vez."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.compiled = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class:
+            return super().from_string(source, globals, template_class)
+        template = self.compiled.get(source)
+        if template is None:
+            template = self.compiled[source] = super().from_string(source)
+        return template
+
+
+class _PreparedDocxTemplate(DocxTemplate):
+    """DocxTemplate que reaproveita o XML já ajustado pelo docxtpl (`patch_xml`)."""
+
+    def __init__(self, template_file, patched_xml: dict):
+        super().__init__(template_file)
+        self.patched_xml = patched_xml
+
+    def patch_xml(self, src_xml):
+        patched = self.patched_xml.get(src_xml)
+        if patched is None:
+            patched = self.patched_xml[src_xml] = super().patch_xml(src_xml)
+        return patched
+
+
+class DocxEngine:
+    """
+    Renderiza o template DOCX mantendo em memória o arquivo, o XML ajustado e os
+    templates Jinja já compilados. Cada render abre uma cópia do pacote a partir
+    dos bytes em memória, sem tocar no disco. O template é recarregado se mudar.
+    """
+
+    def __init__(self, template_path: pathlib.Path):
+        self.template_path = template_path
+        self._mtime = None
+        self._source = None
+        self._patched_xml = {}
+        self._jinja_env = None
+
+    def _load(self):
+        mtime = self.template_path.stat().st_mtime
+        if mtime != self._mtime:
+            self._source = self.template_path.read_bytes()
+            self._patched_xml = {}
+            self._jinja_env = _CompiledXmlEnvironment()
+            self._mtime = mtime
+
+    def render(self, context) -> bytes:
+        self._load()
+        document = _PreparedDocxTemplate(io.BytesIO(self._source), self._patched_xml)
+        document.render(context, self._jinja_env)
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return buffer.getvalue()
+
+
+docx_engine = DocxEngine(docx_template_path)
 
-def generate_budget_docx(budget_data, output_path):
-    """Gera um DOCX de orçamento a partir dos dados processados."""
-    # Carrega o template usando o caminho absoluto
-    docx_template = DocxTemplate(docx_template_path)
-    
-    # Renderiza o template .docx com o contexto
-    docx_template.render(budget_data)
-    
-    file_stream = io.BytesIO()
-    docx_template.save(file_stream)
-    
-    if output_path:
-        output_dir = os.path.dirname(output_path)
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-            
-            with open(output_path, 'wb') as f:
-                f.write(file_stream.getvalue())
-                
-    file_stream.seek(0)
-    
-    return file_stream.read()
-    
-   
\ No newline at end of file
+def generate_budget_docx(budget_data, copy_dir=DOCX_COPY_DIR):
+    """
+    Gera um DOCX de orçamento a partir dos dados processados. Com `copy_dir`, uma
+    cópia também é gravada nessa pasta com um nome único.
+    """
+    file_bytes = docx_engine.render(budget_data)
+    if copy_dir:
+        os.makedirs(copy_dir, exist_ok=True)
+        with open(os.path.join(copy_dir, f"budget-{uuid.uuid4().hex}.docx"), "wb") as f:
+            f.write(file_bytes)
+    return file_bytes
@@ -0,0 +1,200 @@
+import asyncio
+import multiprocessing
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from database import AsyncSessionLocal
+from models.budget_job import BudgetJob
+from services import budget_service
+
+APP_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+JOB_WORKERS = int(os.getenv("BUDGET_JOB_WORKERS", "2"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("BUDGET_JOB_TIMEOUT_SECONDS", "300"))
+JOB_TTL = timedelta(hours=float(os.getenv("BUDGET_JOB_TTL_HOURS", "24")))
+CLEANUP_INTERVAL_SECONDS = 600
+ARTIFACTS_DIR = pathlib.Path(os.getenv("BUDGET_JOB_ARTIFACTS_DIR", APP_DIR.parent / "temp" / "jobs"))
+
+_executor: ProcessPoolExecutor = None
+_dispatched: set[asyncio.Task] = set()
+
+# Event loop do processo worker. É mantido entre os jobs porque as conexões do
+# pool do SQLAlchemy e o cliente do Gemini ficam presos ao loop em que foram criados.
+_worker_loop: asyncio.AbstractEventLoop = None
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# --- Lado do worker (executado nos processos do pool) ---
+
+def _init_worker():
+    global _worker_loop
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+
+
+def run_job(job_id: str):
+    """Ponto de entrada no processo worker."""
+    _worker_loop.run_until_complete(_run_job(job_id))
+
+
+async def _finish_job(job_id: str, **values):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(BudgetJob)
+            .where(BudgetJob.id == job_id, BudgetJob.status == "running")
+            .values(finished_at=_now(), **values)
+        )
+        await db.commit()
+
+
+async def _build_artifact(job: BudgetJob) -> pathlib.Path:
+    customer, settings = await budget_service.load_customer_and_settings(job.customer_id, job.user_id)
+    ai_budget_data, _ = await budget_service.get_ai_budget(job.user_id, job.description, use_cache=job.use_cache)
+    budget_data = budget_service.build_budget_data(ai_budget_data, customer, settings)
+    # Numa thread: bloqueando o loop, o timeout de _run_job não dispararia durante a renderização
+    file_bytes = await asyncio.to_thread(budget_service.render_document, budget_data, job.output_format)
+
+    ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
+    artifact_path = ARTIFACTS_DIR / f"{job.id}.{job.output_format}"
+    partial_path = artifact_path.with_suffix(".partial")
+    partial_path.write_bytes(file_bytes)
+    partial_path.replace(artifact_path)
+    return artifact_path
+
+
+async def _run_job(job_id: str):
+    async with AsyncSessionLocal() as db:
+        claimed = await db.execute(
+            update(BudgetJob)
+            .where(BudgetJob.id == job_id, BudgetJob.status == "queued")
+            .values(status="running", started_at=_now())
+        )
+        await db.commit()
+        if claimed.rowcount == 0:
+            return  # Outro worker já pegou o job
+        job = await db.get(BudgetJob, job_id)
+
+    try:
+        artifact_path = await asyncio.wait_for(_build_artifact(job), JOB_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        await _finish_job(job_id, status="failed", error=f"Tempo limite de {JOB_TIMEOUT_SECONDS:.0f} segundos excedido")
+        return
+    except Exception as e:
+        await _finish_job(job_id, status="failed", error=str(e))
+        return
+
+    await _finish_job(
+        job_id,
+        status="succeeded",
+        artifact_path=str(artifact_path),
+        expires_at=_now() + JOB_TTL
+    )
+
+
+# --- Lado da API ---
+
+def start():
+    """Cria o pool de processos dos workers. Chamado no startup da aplicação."""
+    global _executor
+    _executor = ProcessPoolExecutor(
+        max_workers=JOB_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    )
+
+
+def shutdown():
+    for task in list(_dispatched):
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _dispatch(job_id: str):
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_executor, run_job, job_id)
+    except Exception as e:
+        # Falha do próprio pool (ex.: worker morto); o job ainda pode estar na fila
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(BudgetJob)
+                .where(BudgetJob.id == job_id, BudgetJob.status.in_(("queued", "running")))
+                .values(status="failed", error=str(e), finished_at=_now())
+            )
+            await db.commit()
+
+
+def dispatch(job_id: str):
+    """Envia o job ao pool de processos sem aguardar sua conclusão."""
+    task = asyncio.create_task(_dispatch(job_id))
+    _dispatched.add(task)
+    task.add_done_callback(_dispatched.discard)
+
+
+async def enqueue(db, user_id: str, customer_id: str, description: str, output_format: str, use_cache: bool = True) -> BudgetJob:
+    job = BudgetJob(
+        user_id=user_id,
+        customer_id=customer_id,
+        description=description,
+        output_format=output_format,
+        use_cache=use_cache,
+        status="queued"
+    )
+    db.add(job)
+    await db.commit()
+    dispatch(job.id)
+    return job
+
+
+async def recover_pending_jobs():
+    """
+    Reenfileira os jobs que ficaram para trás em um restart: os que ainda estavam
+    na fila e os que estão "em execução" há mais tempo que o timeout (o processo
+    que os executava morreu sem finalizá-los).
+    """
+    stale_before = _now() - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(BudgetJob)
+            .where(BudgetJob.status == "running", BudgetJob.started_at < stale_before)
+            .values(status="queued", started_at=None)
+        )
+        await db.commit()
+        job_ids = (await db.execute(select(BudgetJob.id).where(BudgetJob.status == "queued"))).scalars().all()
+    for job_id in job_ids:
+        dispatch(job_id)
+
+
+async def remove_expired_artifacts():
+    async with AsyncSessionLocal() as db:
+        expired_jobs = (await db.execute(
+            select(BudgetJob).where(BudgetJob.status == "succeeded", BudgetJob.expires_at < _now())
+        )).scalars().all()
+        for job in expired_jobs:
+            if job.artifact_path:
+                pathlib.Path(job.artifact_path).unlink(missing_ok=True)
+            job.status = "expired"
+            job.artifact_path = None
+        await db.commit()
+
+
+async def run_maintenance():
+    """Tarefa de fundo: recupera jobs pendentes e remove periodicamente os arquivos expirados."""
+    try:
+        await recover_pending_jobs()
+    except Exception as e:
+        print("Erro ao recuperar jobs pendentes:", e)
+    while True:
+        try:
+            await remove_expired_artifacts()
+        except Exception as e:
+            print("Erro ao remover arquivos de jobs expirados:", e)
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
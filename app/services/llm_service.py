@@ -0,0 +1,495 @@
+import asyncio
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import google.generativeai as genai
+import grpc
+from google.ai.generativelanguage_v1beta.services.generative_service.transports import GenerativeServiceGrpcAsyncIOTransport
+from google.api_core import exceptions as google_exceptions
+from google.generativeai.types import AsyncGenerateContentResponse, GenerateContentResponse
+from dotenv import load_dotenv
+from fastapi import Request
+from pydantic import BaseModel
+
+import telemetry
+
+load_dotenv(override=True)
+
+T = TypeVar("T")
+
+# Modelos utilizados por cada parte da aplicação. Cada chave pode ser
+# sobrescrita por variável de ambiente sem alterar o código dos routers.
+MODELS = {
+    "chat": os.getenv("GEMINI_CHAT_MODEL", "gemini-2.5-pro-preview-05-06"),
+    "analysis": os.getenv("GEMINI_ANALYSIS_MODEL", "gemini-2.5-pro-preview-06-05"),
+    "budget": os.getenv("GEMINI_BUDGET_MODEL", "gemini-1.5-pro"),
+    # Modelo barato usado só para consertar respostas JSON inválidas
+    "repair": os.getenv("GEMINI_REPAIR_MODEL", "gemini-1.5-flash"),
+    # Resumo incremental das conversas antigas de cada sessão de chat
+    "summary": os.getenv("GEMINI_SUMMARY_MODEL", "gemini-1.5-flash"),
+    # Títulos das sessões de chat, gerados em segundo plano
+    "title": os.getenv("GEMINI_TITLE_MODEL", "gemini-1.5-flash"),
+}
+
+# Modelos mais rápidos/baratos usados, em ordem, quando o circuit breaker do
+# modelo principal está aberto. Sobrescreva com GEMINI_<CHAVE>_FALLBACK_MODELS
+# (separados por vírgula; vazio desativa o fallback).
+_DEFAULT_FALLBACKS = {"chat": "gemini-1.5-flash", "analysis": "gemini-1.5-flash", "budget": "gemini-1.5-flash"}
+FALLBACK_MODELS = {
+    key: [name.strip() for name in os.getenv(f"GEMINI_{key.upper()}_FALLBACK_MODELS", _DEFAULT_FALLBACKS.get(key, "")).split(",") if name.strip()]
+    for key in MODELS
+}
+
+# Campos do JSON Schema aceitos pelo `response_schema` do Gemini. O restante
+# (default, title, minimum, ...) é rejeitado pela API e precisa ser removido.
+_SCHEMA_FIELDS = {"type", "format", "description", "nullable", "enum", "properties", "required", "items"}
+
+# Limite padrão de chamadas simultâneas por modelo (por worker). Pode ser
+# ajustado por modelo com LLM_MAX_CONCURRENCY_<CHAVE>, ex.: LLM_MAX_CONCURRENCY_CHAT.
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Limite opcional de requisições por minuto de cada modelo (por worker e chave
+# de API): LLM_RPM vale para todos e LLM_RPM_<MODELO> para um modelo, ex.:
+# LLM_RPM_GEMINI_1_5_FLASH=1000. Sem nenhum dos dois, o modelo não tem limite.
+DEFAULT_RPM = os.getenv("LLM_RPM")
+# Retentativas de erros temporários (429, 5xx), com backoff exponencial e jitter
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# Circuit breaker: abre quando, nas últimas BREAKER_WINDOW chamadas, a fração de
+# erros temporários ou de respostas mais lentas que BREAKER_SLOW_SECONDS chega a
+# BREAKER_FAILURE_RATE; fica aberto por BREAKER_OPEN_SECONDS.
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "30"))
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+RATE_LIMIT_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Servidor gRPC alternativo, sem TLS: um Gemini falso local para testes de carga
+# e de falhas (ex.: GEMINI_API_ENDPOINT=localhost:50051)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_KEY:
+    if not GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY)
+else:
+    print("Alerta: Chave da API do Gemini não configurada.")
+
+# Instâncias por nome de modelo (o fallback usa modelos fora de MODELS)
+_models: dict[str, genai.GenerativeModel] = {}
+_semaphores: dict[str, asyncio.Semaphore] = {}
+_endpoint_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class LLMError(Exception):
+    """Erro base das chamadas ao Gemini. `status_code` é usado pelos routers."""
+    status_code = 500
+
+
+class LLMNotConfiguredError(LLMError):
+    status_code = 503
+
+
+class LLMTimeoutError(LLMError):
+    status_code = 504
+
+
+class LLMCancelledError(LLMError):
+    """O cliente HTTP desconectou antes da resposta ficar pronta."""
+    status_code = 499
+
+
+class LLMRateLimitError(LLMError):
+    """A fila do limite de requisições por minuto passaria do tempo disponível."""
+    status_code = 429
+
+
+class LLMUnavailableError(LLMError):
+    """Erros temporários persistentes ou todos os modelos com o circuit breaker aberto."""
+    status_code = 503
+
+
+def is_configured() -> bool:
+    return bool(GEMINI_API_KEY)
+
+
+def _configure_endpoint():
+    """
+    Aponta o SDK para GEMINI_API_ENDPOINT. O canal gRPC assíncrono fica preso
+    ao event loop em que foi criado, então a configuração é feita dentro do loop
+    (e refeita se o loop mudar, como entre testes).
+    """
+    global _endpoint_loop
+    loop = asyncio.get_running_loop()
+    if _endpoint_loop is not loop:
+        transport = GenerativeServiceGrpcAsyncIOTransport(channel=grpc.aio.insecure_channel(GEMINI_API_ENDPOINT))
+        genai.configure(transport=transport, default_metadata=[("x-goog-api-key", GEMINI_API_KEY)])
+        # Cada GenerativeModel guarda o cliente da configuração anterior
+        _models.clear()
+        _endpoint_loop = loop
+
+
+def get_model(model_name: str) -> genai.GenerativeModel:
+    """Retorna (e memoriza) o GenerativeModel com o nome informado."""
+    if GEMINI_API_ENDPOINT:
+        _configure_endpoint()
+    model = _models.get(model_name)
+    if model is None:
+        model = genai.GenerativeModel(model_name)
+        _models[model_name] = model
+    return model
+
+
+def _check_configured():
+    if not is_configured():
+        raise LLMNotConfiguredError("Chave da API do Gemini não configurada")
+
+
+def response_schema(model_cls: type[BaseModel]) -> dict:
+    """
+    Converte um modelo Pydantic no schema aceito pelo modo JSON do Gemini:
+    resolve as referências ($defs) e descarta as restrições não suportadas,
+    que continuam sendo validadas pelo próprio Pydantic na resposta.
+    """
+    json_schema = model_cls.model_json_schema()
+    definitions = json_schema.get("$defs", {})
+
+    def convert(node: dict) -> dict:
+        if "$ref" in node:
+            node = definitions[node["$ref"].split("/")[-1]]
+        schema = {key: value for key, value in node.items() if key in _SCHEMA_FIELDS}
+        if "properties" in schema:
+            schema["properties"] = {name: convert(prop) for name, prop in schema["properties"].items()}
+        if "items" in schema:
+            schema["items"] = convert(schema["items"])
+        return schema
+
+    return convert(json_schema)
+
+
+def _get_semaphore(model_key: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(model_key)
+    if semaphore is None:
+        limit = int(os.getenv(f"LLM_MAX_CONCURRENCY_{model_key.upper()}", DEFAULT_MAX_CONCURRENCY))
+        semaphore = asyncio.Semaphore(limit)
+        _semaphores[model_key] = semaphore
+    return semaphore
+
+
+class TokenBucket:
+    """
+    Limite de requisições por minuto de um modelo. Quem passa do limite espera
+    a sua vez aqui, em vez de receber um 429 do Gemini.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1.0, requests_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self, max_wait: float) -> float:
+        """
+        Reserva uma requisição e retorna quantos segundos esperar por ela. Lança
+        LLMRateLimitError (sem reservar) se a espera passar de `max_wait`.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Reservas além do disponível deixam o saldo negativo e formam a fila
+        wait = max(0.0, self.paused_until - now, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            raise LLMRateLimitError("Limite de requisições ao Gemini atingido, tente novamente em instantes")
+        self.tokens -= 1
+        return wait
+
+    def pause(self, seconds: float):
+        """O Gemini respondeu 429: segura as próximas requisições por `seconds`."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """
+    Saúde de um modelo nas últimas chamadas. Aberto, o modelo é pulado (e o
+    próximo da lista de fallback é usado) por BREAKER_OPEN_SECONDS; depois disso
+    uma única chamada de teste decide se ele volta ou se o circuito reabre.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.outcomes: deque[bool] = deque(maxlen=BREAKER_WINDOW)
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing or time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS else "open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+            return False
+        self.probing = True
+        return True
+
+    def record(self, model_key: str, ok: bool, seconds: float = 0.0):
+        """`model_key` é o uso da chamada (chat, budget...), só para as métricas."""
+        failed = not ok or seconds > BREAKER_SLOW_SECONDS
+        if self.opened_at is None:
+            self.outcomes.append(failed)
+            if len(self.outcomes) >= BREAKER_MIN_CALLS and sum(self.outcomes) / len(self.outcomes) >= BREAKER_FAILURE_RATE:
+                self._open(model_key)
+        elif self.probing:
+            self.probing = False
+            if failed:
+                self._open(model_key)
+            else:
+                self.opened_at = None
+        # Com o circuito aberto, chamadas iniciadas antes da abertura não contam
+
+    def release(self):
+        """A chamada terminou sem dizer nada sobre a saúde do modelo (ex.: cancelada)."""
+        self.probing = False
+
+    def _open(self, model_key: str):
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        telemetry.LLM_EVENTS.inc(model=self.model_name, use=model_key, event="circuit_open")
+
+
+_buckets: dict[tuple, Optional[TokenBucket]] = {}
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def _get_bucket(model_name: str) -> Optional[TokenBucket]:
+    """Limite do modelo, ou None se não houver um configurado."""
+    # A cota do Gemini é por chave de API e modelo
+    key = (GEMINI_API_KEY, model_name)
+    if key not in _buckets:
+        rpm = os.getenv("LLM_RPM_" + re.sub(r"[^A-Z0-9]", "_", model_name.upper()), DEFAULT_RPM)
+        _buckets[key] = TokenBucket(float(rpm)) if rpm else None
+    return _buckets[key]
+
+
+def _get_breaker(model_name: str) -> CircuitBreaker:
+    breaker = _breakers.get(model_name)
+    if breaker is None:
+        breaker = CircuitBreaker(model_name)
+        _breakers[model_name] = breaker
+    return breaker
+
+
+def _backoff(retry: int) -> float:
+    """Backoff exponencial com jitter completo."""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** retry))
+
+
+async def _call_resilient(
+    model_key: str,
+    deadline: float,
+    http_request: Optional[Request],
+    attempt: Callable[[str, float], Awaitable[T]],
+) -> tuple[str, T]:
+    """
+    Executa `attempt(nome_do_modelo, segundos_restantes)` respeitando o limite de
+    requisições do modelo, repetindo erros temporários com backoff e trocando
+    para o próximo modelo de FALLBACK_MODELS enquanto o circuit breaker do atual
+    estiver aberto. Retorna o modelo usado e o resultado.
+    """
+    models = [MODELS[model_key], *FALLBACK_MODELS.get(model_key, [])]
+    last_error = None
+    for retry in range(MAX_RETRIES + 1):
+        model_name = next((name for name in models if _get_breaker(name).allow()), None)
+        if model_name is None:
+            raise LLMUnavailableError("Modelos do Gemini indisponíveis no momento, tente novamente em instantes") from last_error
+        if model_name != models[0]:
+            telemetry.LLM_EVENTS.inc(model=model_name, use=model_key, event="fallback")
+
+        breaker = _get_breaker(model_name)
+        delay = _backoff(retry)
+        try:
+            bucket = _get_bucket(model_name)
+            wait = bucket.reserve(deadline - time.monotonic()) if bucket else 0
+            if wait:
+                telemetry.LLM_EVENTS.inc(model=model_name, use=model_key, event="throttled")
+                await _run_guarded(asyncio.sleep(wait), http_request, None)
+            started = time.perf_counter()
+            result = await attempt(model_name, deadline - time.monotonic())
+        except RETRYABLE_ERRORS as e:
+            breaker.record(model_key, False)
+            if isinstance(e, RATE_LIMIT_ERRORS) and bucket:
+                bucket.pause(delay)
+            last_error = e
+        except LLMTimeoutError:
+            breaker.record(model_key, False)
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record(model_key, True, time.perf_counter() - started)
+            return model_name, result
+
+        if retry == MAX_RETRIES or delay >= deadline - time.monotonic():
+            break
+        telemetry.LLM_EVENTS.inc(model=model_name, use=model_key, event="retry")
+        await _run_guarded(asyncio.sleep(delay), http_request, None)
+
+    raise LLMUnavailableError(f"O Gemini falhou após {retry + 1} tentativa(s): {last_error}") from last_error
+
+
+def _request_options(kwargs: dict) -> dict:
+    # As retentativas ficam por conta de _call_resilient, não do SDK
+    return {"retry": None, **kwargs.pop("request_options", {})}
+
+
+async def _wait_for_disconnect(http_request: Request):
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _run_guarded(coro, http_request: Optional[Request], timeout: float):
+    """
+    Executa a corrotina aplicando timeout e cancelando-a caso o cliente HTTP
+    desconecte no meio do caminho.
+    """
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(http_request)) if http_request else None
+    waiting = {task, watcher} if watcher else {task}
+    try:
+        done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            return task.result()
+        task.cancel()
+        if watcher in done:
+            raise LLMCancelledError("Cliente desconectou antes da resposta do Gemini")
+        raise LLMTimeoutError(f"O Gemini não respondeu em {timeout:.0f} segundos")
+    finally:
+        if watcher:
+            watcher.cancel()
+        if not task.done():
+            task.cancel()
+
+
+async def generate(
+    model_key: str,
+    prompt,
+    *,
+    http_request: Optional[Request] = None,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> str:
+    """
+    Gera uma resposta completa do modelo sem bloquear o event loop.
+
+    As chamadas de cada modelo são limitadas por um semáforo; `http_request`,
+    quando informado, permite cancelar a geração se o cliente desconectar. O
+    timeout vale para todas as tentativas juntas (ver `_call_resilient`).
+    """
+    _check_configured()
+    request_options = _request_options(kwargs)
+
+    def attempt(model_name: str, remaining: float):
+        return _run_guarded(
+            get_model(model_name).generate_content_async(prompt, request_options=request_options, **kwargs),
+            http_request,
+            remaining,
+        )
+
+    async with _get_semaphore(model_key):
+        started = time.perf_counter()
+        deadline = time.monotonic() + (timeout or DEFAULT_TIMEOUT_SECONDS)
+        with telemetry.span("llm"):
+            model_name, response = await _call_resilient(model_key, deadline, http_request, attempt)
+        telemetry.record_llm_call(model_key, model_name, response.usage_metadata, time.perf_counter() - started)
+    return response.text
+
+
+async def stream(
+    model_key: str,
+    prompt,
+    *,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> AsyncIterator[str]:
+    """
+    Gera a resposta do modelo em partes, repassando o texto conforme o Gemini o produz.
+
+    O timeout vale para a espera de cada parte e não para a geração inteira. Se o
+    consumidor parar de iterar (ex.: cliente desconectou), a geração é encerrada.
+    Retentativas e fallback só acontecem até a primeira parte chegar; depois
+    disso o texto já foi repassado e um erro encerra o streaming.
+    """
+    _check_configured()
+    timeout = timeout or DEFAULT_TIMEOUT_SECONDS
+    request_options = _request_options(kwargs)
+
+    async def attempt(model_name: str, remaining: float):
+        try:
+            response = await asyncio.wait_for(
+                get_model(model_name).generate_content_async(prompt, stream=True, request_options=request_options, **kwargs),
+                remaining,
+            )
+            chunks = _iter_chunks(response)
+            try:
+                return chunks, await asyncio.wait_for(chunks.__anext__(), remaining)
+            except StopAsyncIteration:
+                return chunks, None
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"O Gemini não respondeu em {timeout:.0f} segundos")
+
+    async with _get_semaphore(model_key):
+        started = time.perf_counter()
+        model_name = MODELS[model_key]
+        usage = None
+        try:
+            model_name, (chunks, chunk) = await _call_resilient(model_key, time.monotonic() + timeout, None, attempt)
+            while chunk is not None:
+                # A contagem de tokens completa vem na última parte
+                usage = chunk.usage_metadata or usage
+                if chunk.parts:
+                    yield chunk.text
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"O Gemini não respondeu em {timeout:.0f} segundos")
+        finally:
+            # Inclui o tempo em que o consumidor processava as partes
+            seconds = time.perf_counter() - started
+            telemetry.add_phase("llm", seconds)
+            telemetry.record_llm_call(model_key, model_name, usage, seconds)
+
+
+async def _iter_chunks(response: AsyncGenerateContentResponse):
+    """
+    Percorre as partes de uma resposta em streaming assim que chegam.
+
+    O `__aiter__` do SDK só entrega cada parte depois de receber a seguinte, o que
+    atrasa o primeiro token; por isso o iterador interno é consumido diretamente.
+    """
+    yield GenerateContentResponse.from_response(response._result)
+    async for item in response._iterator:
+        yield GenerateContentResponse.from_response(item)
@@ -0,0 +1,242 @@
+"""
+Cache de leitura dos dados de referência do banco externo: clientes e usuários
+com as configurações da empresa. Essas linhas quase nunca mudam, e cada consulta
+ao Supabase custa uma ida e volta entre regiões.
+
+Os valores são snapshots Pydantic imutáveis, que não dependem da sessão que os
+carregou. Buscas simultâneas da mesma chave compartilham uma única consulta, e
+`get_many` busca todas as chaves que faltam numa consulta só. Cada processo
+tem o seu cache; alterações feitas no banco externo aparecem depois do TTL ou de
+uma invalidação explícita (DELETE /documents/reference-cache).
+
+A invalidação vale para todos os processos do servidor (workers e o pool de
+jobs): cada uma grava um arquivo-marca em temp/, e os caches conferem a pasta
+no máximo a cada REFERENCE_CACHE_SYNC_SECONDS. Servidores que não compartilham
+a pasta só veem a alteração depois do TTL.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+import database
+from models.external_data import ExternalCustomer, ExternalUser
+from schemas.external_schema import CustomerSnapshot, UserSnapshot
+
+REFERENCE_CACHE_ENABLED = os.getenv("REFERENCE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+REFERENCE_CACHE_TTL_SECONDS = float(os.getenv("REFERENCE_CACHE_TTL_SECONDS", "300"))
+# Ids inexistentes também são lembrados, por menos tempo
+REFERENCE_CACHE_MISSING_TTL_SECONDS = float(os.getenv("REFERENCE_CACHE_MISSING_TTL_SECONDS", "30"))
+REFERENCE_CACHE_MAX_ENTRIES = int(os.getenv("REFERENCE_CACHE_MAX_ENTRIES", "5000"))
+REFERENCE_CACHE_SYNC_SECONDS = float(os.getenv("REFERENCE_CACHE_SYNC_SECONDS", "1"))
+INVALIDATIONS_DIR = pathlib.Path(os.getenv(
+    "REFERENCE_CACHE_INVALIDATIONS_DIR",
+    pathlib.Path(__file__).resolve().parent.parent.parent / "temp" / "reference-cache-invalidations"
+))
+
+Loader = Callable[[list[str]], Awaitable[dict[str, BaseModel]]]
+
+
+class ReferenceCache:
+    def __init__(
+        self,
+        name: str,
+        load_many: Loader,
+        ttl: float = REFERENCE_CACHE_TTL_SECONDS,
+        missing_ttl: float = REFERENCE_CACHE_MISSING_TTL_SECONDS,
+        max_entries: int = REFERENCE_CACHE_MAX_ENTRIES,
+    ):
+        self.name = name
+        self.load_many = load_many
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.max_entries = max_entries
+        # chave -> (expira_em, snapshot ou None se não existe)
+        self._entries: OrderedDict[str, tuple[float, Optional[BaseModel]]] = OrderedDict()
+        self._pending: dict[str, asyncio.Task] = {}
+        # Incrementado a cada invalidação; buscas iniciadas antes não gravam o resultado
+        self._generation = 0
+        # Marcas de invalidação já aplicadas: nome do arquivo -> mtime
+        self._seen: dict[str, int] = {}
+        self._invalidations_mtime = None
+        self._synced_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+
+    async def get(self, key: str) -> Optional[BaseModel]:
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, BaseModel]:
+        """Snapshots das chaves pedidas; chaves inexistentes ficam fora do dicionário."""
+        keys = list(dict.fromkeys(keys))
+        if not REFERENCE_CACHE_ENABLED:
+            return await self.load_many(keys)
+        self._sync_invalidations()
+
+        result = {}
+        waiting: dict[str, asyncio.Task] = {}
+        missing = []
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                if entry[1] is not None:
+                    result[key] = entry[1]
+            elif key in self._pending:
+                self.coalesced += 1
+                waiting[key] = self._pending[key]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing:
+            task = asyncio.ensure_future(self._fetch(missing, self._generation))
+            # Se todos os interessados desistirem, a exceção não fica sem leitor
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            for key in missing:
+                self._pending[key] = task
+                waiting[key] = task
+
+        # shield: o cancelamento de uma requisição não cancela a busca das outras
+        for task in set(waiting.values()):
+            await asyncio.shield(task)
+        for key, task in waiting.items():
+            value = task.result().get(key)
+            if value is not None:
+                result[key] = value
+        return result
+
+    async def _fetch(self, keys: list[str], generation: int) -> dict[str, BaseModel]:
+        self.fetches += 1
+        try:
+            loaded = await self.load_many(keys)
+        finally:
+            for key in keys:
+                if self._pending.get(key) is asyncio.current_task():
+                    del self._pending[key]
+        if generation == self._generation:
+            now = time.monotonic()
+            for key in keys:
+                value = loaded.get(key)
+                self._entries[key] = (now + (self.ttl if value is not None else self.missing_ttl), value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return loaded
+
+    async def invalidate(self, key: Optional[str] = None):
+        """
+        Descarta uma chave (ou todas, se None) neste e nos demais processos. As
+        entradas locais são alteradas no event loop, como nas buscas; só a
+        gravação da marca em disco vai para uma thread.
+        """
+        self._invalidate_local(key)
+        seen = await asyncio.to_thread(self._broadcast, key)
+        self._seen.update(seen)
+
+    def _invalidate_local(self, key: Optional[str]):
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def _broadcast(self, key: Optional[str]) -> dict[str, int]:
+        """Grava a marca da invalidação e retorna {nome: mtime} para `_seen`."""
+        INVALIDATIONS_DIR.mkdir(parents=True, exist_ok=True)
+        suffix = "all" if key is None else hashlib.sha256(key.encode()).hexdigest()[:32]
+        path = INVALIDATIONS_DIR / f"{self.name}.{suffix}"
+        partial_path = path.with_name(f"{path.name}.{os.getpid()}.partial")
+        partial_path.write_text(json.dumps({"key": key}))
+        partial_path.replace(path)
+        seen = {path.name: path.stat().st_mtime_ns}
+
+        # Marcas mais antigas que o TTL não afetam mais nenhuma entrada
+        oldest = time.time() - max(self.ttl, self.missing_ttl)
+        for entry in os.scandir(INVALIDATIONS_DIR):
+            if entry.name.startswith(f"{self.name}.") and entry.stat().st_mtime < oldest:
+                pathlib.Path(entry.path).unlink(missing_ok=True)
+        return seen
+
+    def _sync_invalidations(self):
+        """
+        Aplica as invalidações gravadas por outros processos. Custa um stat da
+        pasta a cada REFERENCE_CACHE_SYNC_SECONDS; as marcas só são lidas quando
+        a pasta muda, o que é raro.
+        """
+        now = time.monotonic()
+        if now - self._synced_at < REFERENCE_CACHE_SYNC_SECONDS:
+            return
+        self._synced_at = now
+        try:
+            mtime = INVALIDATIONS_DIR.stat().st_mtime_ns
+            if mtime == self._invalidations_mtime:
+                return
+            self._invalidations_mtime = mtime
+            entries = [entry for entry in os.scandir(INVALIDATIONS_DIR) if entry.name.startswith(f"{self.name}.")]
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.endswith(".partial"):
+                continue
+            try:
+                stamp = entry.stat().st_mtime_ns
+                if stamp <= self._seen.get(entry.name, 0):
+                    continue
+                key = json.loads(pathlib.Path(entry.path).read_text())["key"]
+            except FileNotFoundError:
+                continue  # removida por ser antiga
+            self._seen[entry.name] = stamp
+            self._invalidate_local(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": REFERENCE_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _external_session():
+    if database.AsyncExternalSessionLocal is None:
+        raise Exception("A URL do banco externo não está configurada.")
+    return database.AsyncExternalSessionLocal()
+
+
+async def _load_customers(customer_ids: list[str]) -> dict[str, CustomerSnapshot]:
+    async with _external_session() as edb:
+        rows = (await edb.execute(
+            select(ExternalCustomer).filter(ExternalCustomer.id.in_(customer_ids))
+        )).scalars().all()
+        return {row.id: CustomerSnapshot.model_validate(row) for row in rows}
+
+
+async def _load_users(user_ids: list[str]) -> dict[str, UserSnapshot]:
+    """Usuários já com as configurações da empresa (`settings` None se ainda não cadastradas)."""
+    async with _external_session() as edb:
+        rows = (await edb.execute(
+            select(ExternalUser).options(joinedload(ExternalUser.settings)).filter(ExternalUser.id.in_(user_ids))
+        )).scalars().all()
+        return {row.id: UserSnapshot.model_validate(row) for row in rows}
+
+
+customers = ReferenceCache("customers", _load_customers)
+users = ReferenceCache("users", _load_users)
@@ -0,0 +1,106 @@
+"""
+Cache dos recursos reaproveitados entre renders de PDF no mesmo processo: a
+configuração de fontes, as folhas de estilo já compiladas e as imagens externas
+(logos das empresas), servidas ao WeasyPrint por um `url_fetcher` próprio.
+"""
+import os
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from weasyprint import CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+LOGO_CACHE_SIZE = int(os.getenv("LOGO_CACHE_SIZE", "128"))
+# Durante esse período a imagem é servida do cache sem nenhuma requisição; depois
+# disso é revalidada com If-None-Match / If-Modified-Since.
+LOGO_CACHE_FRESH_SECONDS = float(os.getenv("LOGO_CACHE_FRESH_SECONDS", "3600"))
+FETCH_TIMEOUT_SECONDS = 10
+
+_font_config: FontConfiguration = None
+_stylesheets: dict[str, tuple[float, CSS]] = {}
+_lock = threading.Lock()
+
+
+def get_font_config() -> FontConfiguration:
+    global _font_config
+    if _font_config is None:
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def get_stylesheet(path: pathlib.Path) -> CSS:
+    """Retorna a folha de estilo compilada, recompilando só se o arquivo mudar."""
+    mtime = path.stat().st_mtime
+    cached = _stylesheets.get(str(path))
+    if cached is None or cached[0] != mtime:
+        stylesheet = CSS(filename=str(path), font_config=get_font_config())
+        _stylesheets[str(path)] = (mtime, stylesheet)
+        return stylesheet
+    return cached[1]
+
+
+class LogoCache:
+    """LRU de imagens remotas, com revalidação por ETag/Last-Modified."""
+
+    def __init__(self, max_entries: int = LOGO_CACHE_SIZE, fresh_seconds: float = LOGO_CACHE_FRESH_SECONDS):
+        self.max_entries = max_entries
+        self.fresh_seconds = fresh_seconds
+        self.network_fetches = 0
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+    def _store(self, url: str, entry: dict):
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def fetch(self, url: str) -> dict:
+        with _lock:
+            entry = self._entries.get(url)
+            if entry and time.monotonic() - entry["checked_at"] < self.fresh_seconds:
+                self._entries.move_to_end(url)
+                return entry["resource"]
+
+        headers = {"User-Agent": "planeja-pdf-ai-backend"}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        self.network_fetches += 1
+        try:
+            with urlopen(Request(url, headers=headers), timeout=FETCH_TIMEOUT_SECONDS) as response:
+                info = response.info()
+                resource = {
+                    "string": response.read(),
+                    "mime_type": info.get_content_type(),
+                    "redirected_url": response.geturl(),
+                }
+                etag, last_modified = info.get("ETag"), info.get("Last-Modified")
+        except HTTPError as e:
+            if e.code != 304 or not entry:
+                raise
+            resource, etag, last_modified = entry["resource"], entry["etag"], entry["last_modified"]
+
+        with _lock:
+            self._store(url, {
+                "resource": resource,
+                "etag": etag,
+                "last_modified": last_modified,
+                "checked_at": time.monotonic(),
+            })
+        return resource
+
+
+logo_cache = LogoCache()
+
+
+def cached_url_fetcher(url: str, timeout=FETCH_TIMEOUT_SECONDS, ssl_context=None) -> dict:
+    """url_fetcher do WeasyPrint que atende imagens http(s) a partir do `logo_cache`."""
+    if url.startswith(("http://", "https://")):
+        return dict(logo_cache.fetch(url))
+    return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+# Renders aguardando um worker livre, além dos que já estão em execução
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", str(RENDER_WORKERS * 4)))
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "60"))
+# Cada worker é substituído após N renders, para conter o crescimento de memória
+RENDER_MAX_TASKS_PER_WORKER = int(os.getenv("RENDER_MAX_TASKS_PER_WORKER", "200"))
+
+WARM_UP_HTML = "<html><body><p>Aquecimento</p></body></html>"
+
+_executor: ProcessPoolExecutor = None
+# Processos dos pools substituídos após um timeout, à espera de terminar os renders em andamento
+_retired: dict[ProcessPoolExecutor, list] = {}
+_start_options: tuple = (None, True)
+_capacity = 0
+_in_flight = 0
+
+
+class RenderQueueFullError(Exception):
+    """Todos os workers estão ocupados e a fila de renders está cheia."""
+
+
+class RenderTimeoutError(Exception):
+    pass
+
+
+# --- Lado do worker (executado nos processos do pool) ---
+
+def _init_worker():
+    # Importa o WeasyPrint e faz um render descartável: o primeiro render de cada
+    # processo paga a carga das bibliotecas nativas, das fontes e a compilação do CSS.
+    from services import document_service
+    document_service.html_to_pdf(WARM_UP_HTML)
+
+
+def _render_pdf(html: str) -> bytes:
+    from services import document_service
+    return document_service.html_to_pdf(html)
+
+
+def _render_docx(context: dict) -> bytes:
+    from services import document_service
+    return document_service.generate_budget_docx(context)
+
+
+def _ready() -> bool:
+    return True
+
+
+# --- Lado da API ---
+
+def start(workers: int = None, warm_up: bool = True):
+    """Cria o pool de renderização e já sobe todos os workers."""
+    global _executor, _capacity, _start_options
+    _start_options = (workers, warm_up)
+    workers = workers or RENDER_WORKERS
+    _capacity = workers + RENDER_QUEUE_SIZE
+    _executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker if warm_up else None,
+        max_tasks_per_child=RENDER_MAX_TASKS_PER_WORKER
+    )
+    # O pool cria os processos sob demanda; enviar uma tarefa por worker faz
+    # com que todos sejam iniciados (e aquecidos) antes do primeiro pedido real.
+    for _ in range(workers):
+        _executor.submit(_ready)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    for executor in list(_retired):
+        _terminate(executor)
+
+
+def _terminate(executor: ProcessPoolExecutor):
+    """Mata os processos que ainda restam num pool aposentado."""
+    for process in _retired.pop(executor, []):
+        if process.is_alive():
+            process.terminate()
+
+
+def _retire(executor: ProcessPoolExecutor):
+    """
+    Substitui o pool que tem um worker preso num render que passou do timeout.
+    Os próximos renders vão para um pool novo; o antigo não recebe mais tarefas
+    e tem até RENDER_TIMEOUT_SECONDS para concluir os renders em andamento
+    antes de ter os processos mortos.
+    """
+    if executor is not _executor:
+        return  # outro timeout do mesmo pool já o substituiu
+    start(*_start_options)
+    # O ProcessPoolExecutor não permite matar só um worker, e o shutdown
+    # esquece a lista de processos
+    _retired[executor] = list(executor._processes.values())
+    executor.shutdown(wait=False)
+    asyncio.get_running_loop().call_later(RENDER_TIMEOUT_SECONDS, _terminate, executor)
+
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+
+
+async def _submit(function, argument, timeout: float, document: str) -> bytes:
+    global _in_flight
+    if _executor is None:
+        start()
+    if _in_flight >= _capacity:
+        raise RenderQueueFullError("Fila de renderização cheia. Tente novamente em instantes.")
+
+    timeout = timeout or RENDER_TIMEOUT_SECONDS
+    loop = asyncio.get_running_loop()
+    executor = _executor
+    future = executor.submit(function, argument)
+    # A vaga só é liberada quando o worker termina de fato (ou a tarefa é
+    # cancelada ainda na fila), não quando o chamador desiste de esperar
+    _in_flight += 1
+    future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(_release))
+    try:
+        with telemetry.span("render"):
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        if not future.done():
+            _retire(executor)
+        raise RenderTimeoutError(f"A renderização do {document} excedeu {timeout:.0f} segundos")
+
+
+async def render_pdf(html: str, timeout: float = None) -> bytes:
+    """
+    Converte o HTML em PDF em um dos processos do pool, sem ocupar o event loop.
+
+    Lança RenderQueueFullError quando a fila está cheia (o chamador deve responder
+    429) e RenderTimeoutError se o render demorar mais que o limite. Em caso de
+    timeout o render continua ocupando a sua vaga até o worker preso ser morto
+    (ver `_retire`).
+    """
+    return await _submit(_render_pdf, html, timeout, "PDF")
+
+
+async def render_docx(context: dict, timeout: float = None) -> bytes:
+    """
+    Renderiza o DOCX em um dos processos do pool, com os mesmos limites de
+    `render_pdf`. O contexto é enviado ao worker, então precisa ser serializável
+    (ver budget_service.plain_budget_data).
+    """
+    return await _submit(_render_docx, context, timeout, "DOCX")
@@ -0,0 +1,260 @@
+"""
+Rollups das vendas aprovadas por usuário e por dia, guardados no banco local.
+
+O sync busca no banco externo só os orçamentos com `updatedAt` após o último
+watermark (menos uma margem, SALES_ROLLUP_LAG_SECONDS) e recalcula, a partir do banco externo, o intervalo de dias (pela data
+de criação) em que eles caem para cada usuário afetado. Cada dia é recalculado
+por inteiro, então repetir o sync é inofensivo. Orçamentos apagados não mudam o
+`updatedAt` de ninguém: eles só somem dos rollups quando outro orçamento do
+mesmo dia muda ou no sync completo, executado periodicamente.
+
+A margem cobre as linhas gravadas depois do sync com um `updatedAt` anterior ao
+watermark: transações lentas e o relógio da aplicação, que é quem preenche o
+campo (Prisma). Os dias dessas linhas são recalculados de novo a cada sync
+enquanto estiverem dentro da margem.
+
+A análise de tendências lê daqui: qualquer janela de 1 a 365 dias é a soma das
+linhas diárias do período, sem consultar o banco externo.
+"""
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import Date, Float, Text, delete, func, literal_column, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal, AsyncExternalSessionLocal
+from models.external_data import ExternalBudget, ExternalCategory, ExternalProduct, ExternalUser, BudgetStatusEnum
+from models.sales_rollup import SalesRollupDay, SalesRollupItem, SalesRollupState, SalesRollupUser
+
+SALES_ROLLUPS_ENABLED = os.getenv("SALES_ROLLUPS_ENABLED", "true").lower() in ("1", "true", "yes")
+SYNC_INTERVAL_SECONDS = float(os.getenv("SALES_ROLLUP_SYNC_SECONDS", "300"))
+FULL_SYNC_INTERVAL = timedelta(hours=float(os.getenv("SALES_ROLLUP_FULL_SYNC_HOURS", "24")))
+SYNC_LAG = timedelta(seconds=float(os.getenv("SALES_ROLLUP_LAG_SECONDS", "300")))
+STATE_ID = 1
+
+_ready = False
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _budget_day():
+    return func.date(ExternalBudget.createdAt, type_=Date)
+
+
+# --- Sync a partir do banco externo ---
+
+async def _changed_days(edb: AsyncSession, since: Optional[datetime]):
+    """
+    Dias (por usuário) com orçamentos alterados após `since` (todos, se None) e
+    o maior `updatedAt` encontrado, que vira o próximo watermark.
+    """
+    day = _budget_day()
+    query = select(ExternalBudget.userId, day, func.max(ExternalBudget.updatedAt)).group_by(ExternalBudget.userId, day)
+    if since is not None:
+        query = query.filter(ExternalBudget.updatedAt > since)
+
+    changed: dict[str, set[date]] = {}
+    watermark = since
+    for user_id, budget_day, last_update in (await edb.execute(query)).all():
+        changed.setdefault(user_id, set()).add(budget_day)
+        watermark = max(watermark, last_update) if watermark else last_update
+    return changed, watermark
+
+
+async def _aggregate(edb: AsyncSession, user_id: str, first_day: Optional[date], last_day: Optional[date]):
+    """Agregados diários do usuário entre as datas (inclusive), calculados no banco externo."""
+    day = _budget_day()
+    approved = select(ExternalBudget.id, ExternalBudget.total, day.label("day")).filter(
+        ExternalBudget.userId == user_id,
+        ExternalBudget.status == BudgetStatusEnum.Aceito.value
+    )
+    if first_day is not None:
+        approved = approved.filter(
+            ExternalBudget.createdAt >= datetime.combine(first_day, time.min),
+            ExternalBudget.createdAt < datetime.combine(last_day + timedelta(days=1), time.min)
+        )
+    approved = approved.cte("approved_budgets")
+
+    no_text = literal_column("NULL", Text)
+    rows = (await edb.execute(union_all(
+        select(
+            literal_column("'day'", Text).label("kind"), approved.c.day, no_text.label("name"),
+            func.count(approved.c.id).label("quantity"), func.sum(approved.c.total).cast(Float).label("total_value")
+        ).group_by(approved.c.day),
+        select(
+            literal_column("'category'", Text), approved.c.day, ExternalCategory.name,
+            func.count(ExternalCategory.id), literal_column("NULL", Float)
+        ).join(approved, ExternalCategory.budgetId == approved.c.id).group_by(approved.c.day, ExternalCategory.name),
+        select(
+            literal_column("'product'", Text), approved.c.day, ExternalProduct.name,
+            func.count(ExternalProduct.id), literal_column("NULL", Float)
+        ).join(ExternalCategory, ExternalProduct.categoryId == ExternalCategory.id)
+        .join(approved, ExternalCategory.budgetId == approved.c.id)
+        .group_by(approved.c.day, ExternalProduct.name),
+    ))).all()
+
+    days = [
+        SalesRollupDay(user_id=user_id, day=row.day, approved_count=row.quantity, total_value=row.total_value or 0)
+        for row in rows if row.kind == "day"
+    ]
+    items = [
+        SalesRollupItem(user_id=user_id, day=row.day, kind=row.kind, name=row.name, quantity=row.quantity)
+        for row in rows if row.kind != "day"
+    ]
+    return days, items
+
+
+async def _refresh_user(db: AsyncSession, edb: AsyncSession, user_id: str, days: Optional[set[date]]):
+    """Substitui os rollups do usuário no intervalo dos dias alterados (ou todos, se None)."""
+    first_day, last_day = (min(days), max(days)) if days else (None, None)
+    rollup_days, rollup_items = await _aggregate(edb, user_id, first_day, last_day)
+
+    for model in (SalesRollupDay, SalesRollupItem):
+        statement = delete(model).filter(model.user_id == user_id)
+        if first_day is not None:
+            statement = statement.filter(model.day >= first_day, model.day <= last_day)
+        await db.execute(statement)
+    db.add_all(rollup_days + rollup_items)
+
+
+async def sync(db: AsyncSession, edb: AsyncSession, full: bool = False) -> Optional[dict]:
+    """
+    Atualiza os rollups com as alterações do banco externo desde o último sync.
+    `full` (ou a ausência de watermark) reconstrói tudo, o que também remove os
+    orçamentos apagados. Retorna None se outro worker já estiver sincronizando.
+    """
+    state = (await db.execute(
+        select(SalesRollupState).filter(SalesRollupState.id == STATE_ID).with_for_update(skip_locked=True)
+    )).scalar_one_or_none()
+    if state is None:
+        return None
+
+    full = full or state.watermark is None
+    changed, watermark = await _changed_days(edb, None if full else state.watermark - SYNC_LAG)
+    # A margem relê linhas já vistas; o watermark nunca volta
+    if state.watermark is not None and not full:
+        watermark = max(watermark, state.watermark)
+
+    if full:
+        await db.execute(delete(SalesRollupDay))
+        await db.execute(delete(SalesRollupItem))
+    for user_id, days in changed.items():
+        await _refresh_user(db, edb, user_id, None if full else days)
+
+    now = _now()
+    if changed:
+        names = dict((await edb.execute(
+            select(ExternalUser.id, ExternalUser.name).filter(ExternalUser.id.in_(changed))
+        )).all())
+        for user_id in changed:
+            await db.merge(SalesRollupUser(user_id=user_id, user_name=names.get(user_id), refreshed_at=now))
+
+    state.watermark = watermark
+    state.last_sync_at = now
+    if full:
+        state.last_full_sync_at = now
+    await db.commit()
+    return {"full": full, "users": len(changed), "days": sum(len(days) for days in changed.values())}
+
+
+async def _full_sync_due(db: AsyncSession) -> bool:
+    state = await db.get(SalesRollupState, STATE_ID)
+    return bool(state and state.last_full_sync_at and _now() - state.last_full_sync_at > FULL_SYNC_INTERVAL)
+
+
+async def run_sync():
+    """Tarefa de fundo: sincroniza os rollups periodicamente."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db, AsyncExternalSessionLocal() as edb:
+                await sync(db, edb, full=await _full_sync_due(db))
+        except Exception as e:
+            print("Erro ao sincronizar os rollups de vendas:", e)
+        await asyncio.sleep(SYNC_INTERVAL_SECONDS)
+
+
+# --- Leitura (mesmo formato de analysis_service) ---
+
+async def is_ready(db: AsyncSession) -> bool:
+    """Os rollups só substituem o banco externo depois do primeiro sync completo."""
+    global _ready
+    if not _ready:
+        state = await db.get(SalesRollupState, STATE_ID)
+        _ready = bool(state and state.last_sync_at)
+    return _ready
+
+
+async def get_sales_trends_fingerprint(db: AsyncSession, user_id: str) -> str:
+    """Muda sempre que os rollups do usuário são recalculados."""
+    refreshed_at = (await db.execute(
+        select(SalesRollupUser.refreshed_at).filter(SalesRollupUser.user_id == user_id)
+    )).scalar_one_or_none()
+    return f"rollup:{refreshed_at.isoformat() if refreshed_at else '-'}"
+
+
+async def get_sales_trends_data(
+    db: AsyncSession,
+    user_id: str,
+    days_to_analyze: int = 30,
+    top_n: int = 5,
+    include_daily_series: bool = False
+):
+    """
+    Mesmo resultado de `analysis_service.get_sales_trends_data`, somando as
+    linhas diárias dos últimos `days_to_analyze` dias (contando hoje).
+    """
+    start_day = datetime.now().date() - timedelta(days=days_to_analyze - 1)
+
+    daily = (await db.execute(
+        select(SalesRollupDay.day, SalesRollupDay.approved_count, SalesRollupDay.total_value)
+        .filter(SalesRollupDay.user_id == user_id, SalesRollupDay.day >= start_day)
+        .order_by(SalesRollupDay.day)
+    )).all()
+
+    quantity = func.sum(SalesRollupItem.quantity)
+    ranked = select(
+        SalesRollupItem.kind,
+        SalesRollupItem.name,
+        quantity.label("quantity"),
+        func.row_number().over(
+            partition_by=SalesRollupItem.kind, order_by=(quantity.desc(), SalesRollupItem.name)
+        ).label("position")
+    ).filter(
+        SalesRollupItem.user_id == user_id, SalesRollupItem.day >= start_day
+    ).group_by(SalesRollupItem.kind, SalesRollupItem.name).subquery()
+    items = (await db.execute(
+        select(ranked).filter(ranked.c.position <= top_n).order_by(ranked.c.kind, ranked.c.position)
+    )).all()
+
+    user_name = (await db.execute(
+        select(SalesRollupUser.user_name).filter(SalesRollupUser.user_id == user_id)
+    )).scalar_one_or_none()
+
+    approved_count = sum(row.approved_count for row in daily)
+    total_value = sum(row.total_value for row in daily)
+
+    def ranking(kind):
+        return [{"name": row.name, "count": int(row.quantity)} for row in items if row.kind == kind]
+
+    result = {
+        "user_id": user_id,
+        "user_name": user_name,
+        "period_days": days_to_analyze,
+        "summary": {
+            "approved_budgets_count": approved_count,
+            "total_sales_value": total_value,
+            "average_budget_value": total_value / approved_count if approved_count else 0
+        },
+        "top_categories": ranking("category"),
+        "top_products": ranking("product")
+    }
+    if include_daily_series:
+        result["daily_series"] = [
+            {"date": row.day.isoformat(), "approved_budgets_count": row.approved_count, "total_sales_value": row.total_value}
+            for row in daily
+        ]
+    return result
@@ -0,0 +1,116 @@
+"""
+Single-flight: chamadas idênticas feitas ao mesmo tempo (mesma chave) executam
+uma única vez, e todos os que esperam recebem o mesmo resultado ou o mesmo erro.
+Não é um cache: a chave é liberada assim que a execução termina.
+
+A execução compartilhada não pertence a nenhuma requisição: cada uma espera com
+o próprio timeout e desiste se o seu cliente desconectar; a execução só é
+cancelada quando não sobra ninguém esperando. Por isso a função executada não
+deve usar a sessão do banco nem o `Request` de uma requisição específica.
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from fastapi import Request
+
+T = TypeVar("T")
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class SingleFlightError(Exception):
+    """Erro base da espera por uma execução compartilhada. `status_code` é usado pelos routers."""
+    status_code = 500
+
+
+class SingleFlightTimeoutError(SingleFlightError):
+    status_code = 504
+
+
+class SingleFlightCancelledError(SingleFlightError):
+    """O cliente HTTP desconectou antes do resultado ficar pronto."""
+    status_code = 499
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+async def _wait_for_disconnect(http_request: Request):
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+class SingleFlight:
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self._calls: dict[str, _Call] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[T]],
+        *,
+        http_request: Optional[Request] = None,
+        timeout: Optional[float] = None,
+    ) -> T:
+        """
+        Retorna o resultado de `factory()`, reaproveitando a execução em andamento
+        para a mesma chave, se houver. Lança SingleFlightTimeoutError após
+        `timeout` segundos e SingleFlightCancelledError se `http_request` desconectar.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+            self.executions += 1
+        else:
+            self.shared += 1
+
+        call.waiters += 1
+        try:
+            return await self._wait(call.task, http_request, timeout or self.timeout)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Ninguém mais espera o resultado
+                self._forget(key, call)
+                call.task.cancel()
+
+    @staticmethod
+    async def _wait(task: asyncio.Task, http_request: Optional[Request], timeout: Optional[float]):
+        # shield: quem desiste de esperar não cancela a execução dos demais
+        shielded = asyncio.shield(task)
+        watcher = asyncio.ensure_future(_wait_for_disconnect(http_request)) if http_request else None
+        waiting = {shielded, watcher} if watcher else {shielded}
+        try:
+            done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if shielded in done:
+                return shielded.result()
+            if watcher in done:
+                raise SingleFlightCancelledError("Cliente desconectou antes do resultado ficar pronto")
+            raise SingleFlightTimeoutError(f"O resultado não ficou pronto em {timeout:.0f} segundos")
+        finally:
+            if watcher:
+                watcher.cancel()
+            if not shielded.done():
+                shielded.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _finished(self, key: str, call: _Call):
+        self._forget(key, call)
+        # Marca a exceção como lida mesmo que todos já tenham desistido de esperar
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "executions": self.executions, "shared": self.shared}
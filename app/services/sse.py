@@ -0,0 +1,7 @@
+import json
+
+
+def event(data: dict, event: str = None) -> str:
+    """Formata um evento Server-Sent Events com `data` em JSON."""
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
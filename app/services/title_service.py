@@ -0,0 +1,87 @@
+"""
+Títulos das sessões de chat. A sessão é criada na hora com um título provisório
+tirado do primeiro prompt; um modelo pequeno gera o título definitivo em segundo
+plano e atualiza `sessions.title`.
+"""
+import asyncio
+import hashlib
+import re
+
+from sqlalchemy import update
+
+from database import AsyncSessionLocal
+from models.session import Session as SessionModel
+from services import llm_service, single_flight
+
+TITLE_MAX_CHARS = 60
+TITLE_MAX_WORDS = 8
+TITLE_GENERATION_CONFIG = {"max_output_tokens": 32, "temperature": 0.2}
+
+_SENTENCE_END = re.compile(r"[.!?\n]")
+_WRAPPING = "\"'`*#“”‘’. "
+
+_refining: set[asyncio.Task] = set()
+# Sessões abertas ao mesmo tempo com a mesma primeira mensagem (ex.: clique duplo) geram um único título
+_title_flight = single_flight.SingleFlight("chat-title")
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= TITLE_MAX_CHARS:
+        return text
+    cut = text[:TITLE_MAX_CHARS].rsplit(" ", 1)[0].rstrip(",;:-")
+    return cut + "..."
+
+
+def heuristic_title(prompt: str) -> str:
+    """Título provisório: a primeira frase do prompt, com no máximo TITLE_MAX_WORDS palavras."""
+    first_sentence = _SENTENCE_END.split(prompt.strip(), 1)[0]
+    words = first_sentence.split()[:TITLE_MAX_WORDS]
+    if not words:
+        return "Nova conversa"
+    title = " ".join(words)
+    return _truncate(title[0].upper() + title[1:])
+
+
+def clean_title(text: str) -> str:
+    """Normaliza a resposta do modelo: primeira linha, sem aspas nem markdown, com limite de tamanho."""
+    lines = text.strip().splitlines()
+    title = lines[0].strip(_WRAPPING).removeprefix("Título:").strip(_WRAPPING) if lines else ""
+    return _truncate(title)
+
+
+def build_title_prompt(first_prompt: str) -> str:
+    return f"""
+    Crie um título curto, de no máximo {TITLE_MAX_WORDS} palavras e em português, para uma
+    conversa que começa com a mensagem abaixo. Responda apenas com o título, sem aspas.
+    Mensagem: "{first_prompt[:1000]}"
+    """
+
+
+async def refine_title(session_id: str, first_prompt: str):
+    """Gera o título definitivo; se a IA falhar, o provisório passa a ser o definitivo."""
+    values = {"title_status": "final"}
+    try:
+        prompt = build_title_prompt(first_prompt)
+        title = clean_title(await _title_flight.do(
+            hashlib.sha256(prompt.encode()).hexdigest(),
+            lambda: llm_service.generate("title", prompt, generation_config=TITLE_GENERATION_CONFIG)
+        ))
+        if title:
+            values["title"] = title
+    except Exception as e:
+        print(f"Erro ao gerar o título da sessão {session_id}:", e)
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(SessionModel)
+            .where(SessionModel.id == session_id, SessionModel.title_status == "pending")
+            .values(**values)
+        )
+        await db.commit()
+
+
+def schedule_refinement(session_id: str, first_prompt: str):
+    """Dispara o refinamento do título sem aguardar a resposta do modelo."""
+    task = asyncio.create_task(refine_title(session_id, first_prompt))
+    _refining.add(task)
+    task.add_done_callback(_refining.discard)
@@ -0,0 +1,279 @@
+"""
+Instrumentação das requisições: tempo gasto em cada fase (banco, Gemini,
+parse do JSON, renderização), header Server-Timing, log estruturado em JSON
+e métricas no formato texto do Prometheus (ver /metrics).
+
+O código da aplicação marca as fases com `span("nome")`; o trace da
+requisição atual fica num ContextVar, então tarefas e threads iniciadas
+durante a requisição (asyncio.gather, asyncio.to_thread) somam no mesmo
+trace. Fases executadas em paralelo somam as durações, por isso a soma das
+fases pode passar do tempo total da requisição.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+REQUEST_LOG_ENABLED = os.getenv("REQUEST_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Preço em dólares por milhão de tokens (entrada, saída), pelo prefixo do nome
+# do modelo. Pode ser substituído por LLM_PRICES='{"gemini-1.5-pro": [1.25, 5.0]}'.
+LLM_PRICES = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+LLM_PRICES.update({name: tuple(price) for name, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class RequestTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, list] = defaultdict(lambda: [0.0, 0])
+        self.llm_calls: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase][0] += seconds
+            self.phases[phase][1] += 1
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(call["input_tokens"] for call in self.llm_calls)
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(call["output_tokens"] for call in self.llm_calls)
+
+    @property
+    def cost(self) -> float:
+        return sum(call["cost"] for call in self.llm_calls)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+# --- Métricas ---
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # labels -> [contagem por bucket..., soma, contagem total]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in self._values.items():
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Duração das requisições HTTP.")
+PHASE_DURATION = Histogram("http_request_phase_duration_seconds", "Tempo de cada fase por requisição (db, llm, parse, render...).")
+LLM_DURATION = Histogram("llm_call_duration_seconds", "Duração das chamadas ao Gemini.")
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens consumidos no Gemini.")
+LLM_COST = Counter("llm_cost_usd_total", "Custo estimado das chamadas ao Gemini, em dólares.")
+LLM_EVENTS = Counter("llm_resilience_events_total", "Retentativas, fallbacks, esperas no limite de taxa e aberturas de circuit breaker do Gemini.")
+
+METRICS = (REQUEST_DURATION, PHASE_DURATION, LLM_DURATION, LLM_TOKENS, LLM_COST, LLM_EVENTS)
+
+
+def render_metrics() -> str:
+    """Todas as métricas no formato texto de exposição do Prometheus."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- API usada pela aplicação ---
+
+def add_phase(phase: str, seconds: float):
+    """Soma `seconds` à fase `phase` da requisição atual (se houver uma)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+@contextmanager
+def span(phase: str):
+    """Soma o tempo do bloco à fase `phase` da requisição atual."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(phase, time.perf_counter() - started)
+
+
+def llm_price(model_name: str) -> tuple[float, float]:
+    for prefix in sorted(LLM_PRICES, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return LLM_PRICES[prefix]
+    return 0.0, 0.0
+
+
+def record_llm_call(model_key: str, model_name: str, usage, seconds: float):
+    """Registra tokens, custo e duração de uma chamada ao Gemini (`usage` = usage_metadata da resposta)."""
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    input_price, output_price = llm_price(model_name)
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    LLM_DURATION.observe(seconds, model=model_name, use=model_key)
+    LLM_TOKENS.inc(input_tokens, model=model_name, use=model_key, kind="input")
+    LLM_TOKENS.inc(output_tokens, model=model_name, use=model_key, kind="output")
+    LLM_COST.inc(cost, model=model_name, use=model_key)
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.llm_calls.append({
+            "model": model_name,
+            "use": model_key,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": round(cost, 6),
+            "seconds": round(seconds, 4),
+        })
+
+
+def instrument_engine(engine):
+    """Mede o tempo de cada query do engine (síncrono ou o `sync_engine` de um AsyncEngine)."""
+    engine = getattr(engine, "sync_engine", engine)
+
+    # O início fica no contexto de execução da própria query: uma query que falha
+    # não deixa marca na conexão, que volta ao pool e é reutilizada.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        add_phase("db", time.perf_counter() - context._query_started)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        started = getattr(exception_context.execution_context, "_query_started", None)
+        if started is not None:
+            add_phase("db", time.perf_counter() - started)
+
+
+def server_timing(trace: RequestTrace, total: float) -> str:
+    entries = [f'{phase};dur={seconds * 1000:.1f};desc="{count}x"' for phase, (seconds, count) in trace.phases.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI que abre o trace de cada requisição, adiciona o header
+    Server-Timing e, ao final, alimenta as métricas e escreve uma linha de log
+    em JSON. Em respostas em streaming o header só contém as fases concluídas
+    antes do início do envio; o log e as métricas consideram a resposta toda.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timing = server_timing(trace, time.perf_counter() - trace.started)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            self._finish(scope, trace, status_code)
+
+    @staticmethod
+    def _finish(scope, trace: RequestTrace, status_code: int):
+        total = time.perf_counter() - trace.started
+        # O template da rota (ex.: /chat/sessions/{session_id}) evita uma série por id
+        route = getattr(scope.get("route"), "path", None) or "<sem rota>"
+        REQUEST_DURATION.observe(total, method=scope["method"], route=route, status=status_code)
+        for phase, (seconds, _) in trace.phases.items():
+            PHASE_DURATION.observe(seconds, route=route, phase=phase)
+
+        if REQUEST_LOG_ENABLED:
+            print(json.dumps({
+                "event": "request",
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status_code,
+                "duration_ms": round(total * 1000, 1),
+                "phases_ms": {phase: round(seconds * 1000, 1) for phase, (seconds, _) in trace.phases.items()},
+                "llm_calls": trace.llm_calls,
+                "llm_input_tokens": trace.input_tokens,
+                "llm_output_tokens": trace.output_tokens,
+                "llm_cost_usd": round(trace.cost, 6),
+            }, ensure_ascii=False), flush=True)
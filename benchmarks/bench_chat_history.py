@@ -0,0 +1,119 @@
+"""
+Benchmark do /chat/history: compara a versão antiga (uma consulta por sessão)
+com a consulta em lote de `chat_service.get_history_page`.
+
+Uso (a partir da raiz do repositório):
+    python benchmarks/bench_chat_history.py --sessions 500 --conversations 10 --rtt-ms 2
+
+Por padrão usa um SQLite temporário; BENCH_DATABASE_URL permite apontar para um
+Postgres de testes (ex.: postgresql+asyncpg://...). `--rtt-ms` simula a latência
+de rede por ida e volta ao banco, que é o que o N+1 multiplica.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app")))
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base
+from models.conversation import Conversation
+from models.session import Session as SessionModel
+from services import chat_service
+
+USER_ID = "bench-user"
+
+
+async def seed(session_factory, sessions: int, conversations: int):
+    now = datetime.now()
+    async with session_factory() as db:
+        for i in range(sessions):
+            session_id = str(uuid.uuid4())
+            created_at = now - timedelta(minutes=i)
+            db.add(SessionModel(id=session_id, user_id=USER_ID, title=f"Sessão {i}", created_at=created_at))
+            for j in range(conversations):
+                db.add(Conversation(
+                    session_id=session_id,
+                    prompt=f"Pergunta {j}",
+                    response="Resposta " * 20,
+                    created_at=created_at + timedelta(seconds=j),
+                ))
+        await db.commit()
+
+
+async def legacy_history(db, user_id):
+    """Implementação anterior: uma consulta para as sessões e uma por sessão."""
+    sessions = (await db.execute(
+        select(SessionModel).filter(SessionModel.user_id == user_id).order_by(SessionModel.created_at.desc())
+    )).scalars().all()
+    result = []
+    for session in sessions:
+        conversations = (await db.execute(
+            select(Conversation)
+            .filter(Conversation.session_id == session.id)
+            .order_by(Conversation.created_at.asc())
+        )).scalars().all()
+        result.append({"id": session.id, "conversations": conversations})
+    return result
+
+
+async def measure(name, session_factory, counter, run):
+    async with session_factory() as db:
+        counter["queries"] = 0
+        started = time.perf_counter()
+        sessions = await run(db)
+        elapsed = (time.perf_counter() - started) * 1000
+    print(f"{name:<42} {counter['queries']:>6} consultas {elapsed:>10.1f} ms  ({len(sessions)} sessões)")
+
+
+async def main(args):
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        url = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_async_engine(url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    counter = {"queries": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_round_trip(*_):
+        counter["queries"] += 1
+        if args.rtt_ms:
+            time.sleep(args.rtt_ms / 1000)
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+    await seed(session_factory, args.sessions, args.conversations)
+    print(f"{args.sessions} sessões x {args.conversations} conversas, RTT simulado de {args.rtt_ms} ms\n")
+
+    await measure("antigo (N+1)", session_factory, counter, lambda db: legacy_history(db, USER_ID))
+    await measure("lote, histórico completo", session_factory, counter,
+                  lambda db: first(chat_service.get_history_page(db, USER_ID)))
+    await measure(f"lote, página de {args.page_size}", session_factory, counter,
+                  lambda db: first(chat_service.get_history_page(db, USER_ID, limit=args.page_size)))
+    await measure(f"lote, página de {args.page_size} (3 conversas/sessão)", session_factory, counter,
+                  lambda db: first(chat_service.get_history_page(
+                      db, USER_ID, limit=args.page_size, conversations_per_session=3)))
+
+    await engine.dispose()
+
+
+async def first(coro):
+    return (await coro)[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    asyncio.run(main(parser.parse_args()))
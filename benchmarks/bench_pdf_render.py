@@ -0,0 +1,82 @@
+"""
+Benchmark do render_service: renders de PDF por segundo conforme o número de
+workers do pool de processos, comparado ao render direto no event loop.
+
+Uso (a partir da raiz do repositório):
+    python benchmarks/bench_pdf_render.py --renders 64 --products 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app")))
+
+from services import document_service, render_service
+
+
+def sample_html(products: int) -> str:
+    budget_data = {
+        "budget": {
+            "id": "20250601",
+            "name": "Orçamento de benchmark",
+            "categories": [
+                {
+                    "name": f"Ambiente {c}",
+                    "products": [{"name": f"Produto {c}.{p}", "price": 100.0 + p} for p in range(products)]
+                }
+                for c in range(4)
+            ],
+            "total": 12345.67,
+            "createdAt": datetime.now()
+        },
+        "customer": SimpleNamespace(name="Cliente Benchmark"),
+        "settings": SimpleNamespace(
+            paymentMethod="Pix", observation=None, deliveryTimeDays=30, budgetValidityDays=15,
+            companyName="Móveis Benchmark", street="Rua A", number=1, neighborhood="Centro",
+            city="Curitiba", state="PR", zipCode="80000-000", cnpj="00.000.000/0001-00", logo=None
+        ),
+        "timedelta": timedelta
+    }
+    return document_service.render_budget_html(budget_data)
+
+
+def bench_inline(html: str, renders: int) -> float:
+    started = time.perf_counter()
+    for _ in range(renders):
+        document_service.html_to_pdf(html)
+    return renders / (time.perf_counter() - started)
+
+
+async def bench_pool(html: str, renders: int, workers: int) -> float:
+    render_service.start(workers)
+    # Garante que os workers terminaram de aquecer antes de medir
+    await asyncio.gather(*(render_service.render_pdf(html) for _ in range(workers)))
+    started = time.perf_counter()
+    await asyncio.gather(*(render_service.render_pdf(html) for _ in range(renders)))
+    elapsed = time.perf_counter() - started
+    render_service.shutdown()
+    return renders / elapsed
+
+
+def main(args):
+    html = sample_html(args.products)
+    render_service.RENDER_QUEUE_SIZE = args.renders
+    cores = os.cpu_count() or 1
+    print(f"{args.renders} renders, {cores} núcleos disponíveis\n")
+    print(f"{'event loop (sem pool)':<24} {bench_inline(html, args.renders):>8.1f} renders/s")
+    workers = 1
+    while workers <= cores:
+        rate = asyncio.run(bench_pool(html, args.renders, workers))
+        print(f"{f'pool com {workers} worker(s)':<24} {rate:>8.1f} renders/s")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=64)
+    parser.add_argument("--products", type=int, default=30)
+    main(parser.parse_args())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos da aplicação se importam a partir de app/ (ex.: `from services import ...`)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
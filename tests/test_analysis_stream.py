@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_async_db, get_async_external_db
+from routers import analysis_router
+from services import analysis_service, cache_service, llm_service, sales_rollup_service
+
+TRENDS = {
+    "user_id": "u1",
+    "user_name": "Ana",
+    "period_days": 90,
+    "summary": {"approved_budgets_count": 2, "total_sales_value": 1500.0, "average_budget_value": 750.0},
+    "top_categories": [{"name": "Cozinha", "count": 2}],
+    "top_products": [],
+}
+
+
+def _events(body: str) -> list[tuple[str, dict]]:
+    """Converte a resposta SSE em pares (evento, dados); eventos sem nome são "delta"."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields.get("event", "delta"), json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch):
+    llm_calls = []
+
+    async def stream(model_key, prompt, **kwargs):
+        llm_calls.append(model_key)
+        for text in ["Olá, Ana. ", "Vendas em alta."]:
+            yield text
+
+    async def fingerprint(db, user_id):
+        return "f1"
+
+    async def trends_data(db, user_id, **kwargs):
+        return TRENDS
+
+    monkeypatch.setattr(llm_service, "is_configured", lambda: True)
+    monkeypatch.setattr(llm_service, "stream", stream)
+    monkeypatch.setattr(sales_rollup_service, "SALES_ROLLUPS_ENABLED", False)
+    monkeypatch.setattr(analysis_service, "get_sales_trends_fingerprint", fingerprint)
+    monkeypatch.setattr(analysis_service, "get_sales_trends_data", trends_data)
+    cache = cache_service.ResponseCache(cache_service.InMemoryBackend(), namespace="sales-trends", ttl=60)
+    monkeypatch.setattr(analysis_router, "sales_trends_cache", cache)
+
+    async def no_session():
+        yield None
+
+    app = FastAPI()
+    app.include_router(analysis_router.router)
+    app.dependency_overrides[get_async_db] = no_session
+    app.dependency_overrides[get_async_external_db] = no_session
+    return TestClient(app), cache, llm_calls
+
+
+def test_stream_sends_summary_first_then_deltas_and_caches_the_result(client):
+    test_client, cache, llm_calls = client
+
+    response = test_client.get("/analysis/u1/sales-trends/stream")
+    events = _events(response.text)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-cache"] == "MISS"
+    assert events[0] == ("summary", {
+        "user_id": "u1", "user_name": "Ana", "period_analyzed": "90 dias", "data_summary": TRENDS["summary"]
+    })
+    assert events[1:-1] == [("delta", {"delta": "Olá, Ana. "}), ("delta", {"delta": "Vendas em alta."})]
+    assert events[-1] == ("done", {"cached": False})
+    assert llm_calls == ["analysis"]
+    [(key, (_, cached))] = cache.backend._entries.items()
+    assert key.startswith("sales-trends:u1:90:5:0:")
+    assert cached["analysis"] == "Olá, Ana. Vendas em alta."
+
+
+def test_stream_replays_a_cached_analysis_without_calling_gemini(client):
+    test_client, cache, llm_calls = client
+    test_client.get("/analysis/u1/sales-trends/stream")
+
+    response = test_client.get("/analysis/u1/sales-trends/stream")
+    events = _events(response.text)
+
+    assert response.headers["x-cache"] == "HIT"
+    assert [name for name, _ in events] == ["summary", "delta", "done"]
+    assert events[1] == ("delta", {"delta": "Olá, Ana. Vendas em alta."})
+    assert events[-1] == ("done", {"cached": True})
+    assert llm_calls == ["analysis"]
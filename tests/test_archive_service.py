@@ -0,0 +1,39 @@
+import asyncio
+import io
+import zipfile
+
+from services import archive_service
+
+
+async def _collect(entries):
+    async def iter_entries():
+        for entry in entries:
+            yield entry
+
+    return [chunk async for chunk in archive_service.zip_stream(iter_entries())]
+
+
+def test_zip_with_known_sizes_matches_precomputed_length():
+    entries = [("orcamento.pdf", b"%PDF-" + b"x" * 1000), ("orçamento.docx", b"PK" + b"y" * 500)]
+
+    data = b"".join(asyncio.run(_collect(entries)))
+
+    assert len(data) == archive_service.zip_size([(name, len(content)) for name, content in entries])
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert {name: archive.read(name) for name in archive.namelist()} == dict(entries)
+
+
+def test_streamed_entries_are_emitted_part_by_part_with_crc():
+    async def parts():
+        for i in range(5):
+            yield bytes([i]) * 100
+
+    chunks = asyncio.run(_collect([("grande.bin", parts()), ("pequeno.txt", b"ok")]))
+
+    # cabeçalho local, as 5 partes como chegaram e o data descriptor
+    assert chunks[1:6] == [bytes([i]) * 100 for i in range(5)]
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.read("grande.bin") == b"".join(bytes([i]) * 100 for i in range(5))
+    assert archive.read("pequeno.txt") == b"ok"
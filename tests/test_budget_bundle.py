@@ -0,0 +1,48 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers import pdf_router
+from services import budget_service, render_service
+
+REQUEST = {"customer_id": "c1", "user_id": "u1", "description": "Cozinha planejada"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def prepare_budget(request, http_request):
+        return {"total": 100}, False
+
+    monkeypatch.setattr(pdf_router, "_prepare_budget", prepare_budget)
+    app = FastAPI()
+    app.include_router(pdf_router.router)
+    return TestClient(app)
+
+
+def test_bundle_writes_each_document_as_it_finishes(client, monkeypatch):
+    async def render(budget_data, output_format):
+        # O DOCX termina primeiro e deve ser a primeira entrada do ZIP
+        await asyncio.sleep(0.05 if output_format == "pdf" else 0)
+        return f"{output_format}-bytes".encode()
+
+    monkeypatch.setattr(budget_service, "render_document_async", render)
+    response = client.post("/documents/generate-budget/bundle", json=REQUEST)
+
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.namelist() == ["orcamento.docx", "orcamento.pdf"]
+    assert archive.read("orcamento.pdf") == b"pdf-bytes"
+
+
+def test_bundle_render_errors_before_the_first_document_are_http_errors(client, monkeypatch):
+    async def render(budget_data, output_format):
+        raise render_service.RenderQueueFullError("Fila de renderização cheia")
+
+    monkeypatch.setattr(budget_service, "render_document_async", render)
+    response = client.post("/documents/generate-budget/bundle", json=REQUEST)
+
+    assert response.status_code == 429
@@ -0,0 +1,32 @@
+from services.budget_cache import SemanticBudgetCache
+
+BUDGET = {"name": "Cozinha", "categories": [], "total": 0.0}
+
+
+def test_similar_description_hits_only_for_the_same_user():
+    cache = SemanticBudgetCache(threshold=0.85)
+    cache.set("user-1", "Cozinha planejada em L com ilha", BUDGET)
+
+    assert cache.get("user-1", "cozinha planejada em L, com ilha!") == BUDGET
+    assert cache.get("user-2", "Cozinha planejada em L com ilha") is None
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_different_measures_or_shapes_do_not_match():
+    cache = SemanticBudgetCache(threshold=0.85)
+    cache.set("user-1", "home office com escrivaninha em L e 3 gavetas", BUDGET)
+
+    assert cache.get("user-1", "home office com escrivaninha em U e 3 gavetas") is None
+    assert cache.get("user-1", "home office com escrivaninha em L e 4 gavetas") is None
+
+
+def test_evicts_least_recently_used_and_returns_copies():
+    cache = SemanticBudgetCache(max_entries=2, threshold=0.85)
+    cache.set("user-1", "cozinha planejada em L com ilha", BUDGET)
+    cache.set("user-1", "home office com escrivaninha", BUDGET)
+    cache.get("user-1", "cozinha planejada em L com ilha")["name"] = "alterado"
+    cache.set("user-1", "guarda-roupa de casal com espelho", BUDGET)
+
+    assert cache.get("user-1", "home office com escrivaninha") is None
+    assert cache.get("user-1", "cozinha planejada em L com ilha") == BUDGET
+    assert cache.stats()["evictions"] == 1
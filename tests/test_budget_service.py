@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from routers import pdf_router
+from schemas.pdf_schema import BudgetGenerationRequest
+from services import budget_service, llm_service
+
+VALID = '{"name": "Cozinha", "categories": [{"name": "Armários", "products": [{"name": "Aéreo", "price": 1200.5}, {"name": "Balcão", "price": 800}]}], "total": 99}'
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Substitui o Gemini por respostas fixas, entregues na ordem das chamadas."""
+    calls = []
+    responses = []
+
+    async def generate(model_key, prompt, **kwargs):
+        calls.append((model_key, prompt))
+        return responses.pop(0)
+
+    monkeypatch.setattr(llm_service, "generate", generate)
+    return calls, responses
+
+
+def test_parse_recomputes_total_and_cleans_fences_and_trailing_commas():
+    raw = '```json\n{"name": "Cozinha", "categories": [{"name": "Armários", "products": [{"name": "Aéreo", "price": 1200.5},],},], "total": 99,}\n```'
+
+    budget = budget_service.parse_ai_budget(raw)
+
+    assert budget.total == 1200.5
+    assert [product.name for product in budget.categories[0].products] == ["Aéreo"]
+
+
+def test_parse_rejects_text_without_json():
+    with pytest.raises(ValueError):
+        budget_service.parse_ai_budget("Não consigo gerar esse orçamento.")
+
+
+def test_valid_response_needs_a_single_call(gemini):
+    calls, responses = gemini
+    responses.append(VALID)
+
+    budget = asyncio.run(budget_service.generate_ai_budget("cozinha"))
+
+    assert budget["total"] == 2000.5
+    assert [model_key for model_key, _ in calls] == ["budget"]
+
+
+def test_invalid_response_is_repaired_once_with_the_repair_model(gemini):
+    calls, responses = gemini
+    responses.extend(['{"name": "Cozinha", "categories": [{"name": "Armários"}]}', VALID])
+
+    budget = asyncio.run(budget_service.generate_ai_budget("cozinha"))
+
+    assert budget["total"] == 2000.5
+    assert [model_key for model_key, _ in calls] == ["budget", "repair"]
+    # O conserto recebe a resposta inválida, não o pedido original
+    assert '"name": "Armários"' in calls[1][1]
+
+
+def test_failed_repair_becomes_a_502(gemini, monkeypatch):
+    calls, responses = gemini
+    responses.extend(["sem json", '{"name": "Cozinha"}'])
+
+    async def load_customer_and_settings(customer_id, user_id):
+        return {"id": customer_id}, {"id": "s1"}
+
+    monkeypatch.setattr(budget_service, "load_customer_and_settings", load_customer_and_settings)
+    request = BudgetGenerationRequest(customer_id="c1", user_id="u1", description="cozinha", use_cache=False)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(pdf_router._prepare_budget(request, None))
+
+    assert error.value.status_code == 502
+    assert [model_key for model_key, _ in calls] == ["budget", "repair"]
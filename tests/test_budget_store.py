@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import budget_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(budget_store, "BUDGETS_DIR", tmp_path / "budgets")
+    monkeypatch.setattr(budget_store, "MANIFEST_PATH", tmp_path / "manifest.json")
+    monkeypatch.setattr(budget_store, "LOCK_PATH", tmp_path / "manifest.lock")
+    monkeypatch.setattr(budget_store, "_snapshot", budget_store._Snapshot(None, {}, {}))
+    return budget_store
+
+
+def test_publish_reuses_the_token_of_identical_content(store):
+    token = store.publish("k1", "pdf", b"%PDF-1")
+
+    assert store.publish("k1", "pdf", b"%PDF-1") == token
+    assert store.find("k1", "pdf") == token
+    assert store.find("k1", "docx") is None
+    assert store.path_for(token, "pdf").read_bytes() == b"%PDF-1"
+    assert store.url_for(token, "pdf") == f"/static/budgets/{token}.pdf"
+    assert (store.stats()["files"], store.stats()["bytes"]) == (1, 6)
+
+
+def test_quota_removes_the_oldest_documents(store, monkeypatch):
+    monkeypatch.setattr(store, "BUDGET_STORE_MAX_BYTES", 250)
+    first = store.publish("a", "pdf", b"a" * 100)
+    store.publish("b", "pdf", b"b" * 100)
+    store.publish("c", "pdf", b"c" * 100)
+
+    assert store.find("a", "pdf") is None
+    assert not store.path_for(first, "pdf").exists()
+    assert store.find("b", "pdf") and store.find("c", "pdf")
+
+
+def test_quota_keeps_the_recently_downloaded_documents(store, monkeypatch):
+    monkeypatch.setattr(store, "BUDGET_STORE_MAX_BYTES", 250)
+    store.publish("a", "pdf", b"a" * 100)
+    second = store.publish("b", "pdf", b"b" * 100)
+    assert store.find("a", "pdf")
+    store.publish("c", "pdf", b"c" * 100)
+
+    assert store.find("b", "pdf") is None
+    assert not store.path_for(second, "pdf").exists()
+    assert store.find("a", "pdf") and store.find("c", "pdf")
+
+
+def test_find_records_stale_accesses_in_the_manifest(store, monkeypatch):
+    token = store.publish("a", "pdf", b"a")
+    monkeypatch.setattr(store, "ACCESS_FLUSH_SECONDS", -1)
+
+    assert store.find("a", "pdf") == token
+    assert store._current().entries[token]["last_access"] > store._current().entries[token]["created_at"]
+
+
+def test_republishing_the_oldest_document_over_quota_still_frees_space(store, monkeypatch):
+    store.publish("a", "pdf", b"a" * 100)
+    second = store.publish("b", "pdf", b"b" * 100)
+    monkeypatch.setattr(store, "BUDGET_STORE_MAX_BYTES", 150)
+    # Republicado com um relógio atrasado, "a" continua o primeiro da fila de remoção
+    monkeypatch.setattr(store, "_now", lambda: datetime(2000, 1, 1, tzinfo=timezone.utc))
+    first = store.publish("a", "pdf", b"a" * 100)
+
+    assert store.path_for(first, "pdf").exists()
+    assert not store.path_for(second, "pdf").exists()
+    assert store.stats()["bytes"] == 100
+
+
+def test_garbage_collector_removes_expired_and_orphan_files(store, monkeypatch):
+    monkeypatch.setattr(store, "BUDGET_STORE_TTL", timedelta(seconds=-1))
+    expired = store.publish("a", "pdf", b"a")
+    monkeypatch.setattr(store, "BUDGET_STORE_TTL", timedelta(hours=1))
+    kept = store.publish("b", "pdf", b"b")
+    (store.BUDGETS_DIR / "orfao.pdf").write_bytes(b"x")
+
+    assert store.find("a", "pdf") is None
+    assert store.collect_garbage() == 2
+    assert sorted(path.name for path in store.BUDGETS_DIR.iterdir()) == [f"{kept}.pdf"]
+    assert not store.path_for(expired, "pdf").exists()
+
+
+def test_find_does_not_wait_for_writers(store):
+    token = store.publish("k1", "pdf", b"%PDF-1")
+
+    # Com uma gravação segurando o lock, a consulta ainda responde
+    with store._thread_lock:
+        assert store.find("k1", "pdf") == token
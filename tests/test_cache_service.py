@@ -0,0 +1,62 @@
+import asyncio
+
+from services import cache_service
+
+
+class FakeRedis:
+    """Substituto local com a mesma interface assíncrona do redis-py."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_memory_backend_evicts_least_recently_used():
+    async def run():
+        backend = cache_service.InMemoryBackend(max_entries=2)
+        await backend.set("a", 1, ttl=60)
+        await backend.set("b", 2, ttl=60)
+        await backend.get("a")
+        await backend.set("c", 3, ttl=60)
+        return backend, [await backend.get(key) for key in ("a", "b", "c")]
+
+    backend, values = asyncio.run(run())
+
+    assert values == [1, None, 3]
+    assert backend.evictions == 1
+
+
+def test_memory_backend_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_service.time, "monotonic", lambda: now[0])
+
+    async def run():
+        backend = cache_service.InMemoryBackend()
+        await backend.set("a", 1, ttl=10)
+        before = await backend.get("a")
+        now[0] += 11
+        return before, await backend.get("a")
+
+    assert asyncio.run(run()) == (1, None)
+
+
+def test_response_cache_tracks_hits_with_redis_compatible_backend():
+    async def run():
+        cache = cache_service.ResponseCache(cache_service.RedisBackend(FakeRedis()), "teste", ttl=60)
+        await cache.get("k")
+        await cache.set("k", {"analysis": "texto", "total": 10.5})
+        return cache, await cache.get("k")
+
+    cache, value = asyncio.run(run())
+
+    assert value == {"analysis": "texto", "total": 10.5}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base
+from models.conversation import Conversation
+from models.session import Session as SessionModel
+from services import context_service, llm_service
+
+
+async def _long_session(tmp_path, monkeypatch, turns, run, interval=timedelta(minutes=1)):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/context.db")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(context_service, "AsyncSessionLocal", session_factory)
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        start = datetime(2025, 6, 1, 12, 0)
+        async with session_factory() as db:
+            db.add(SessionModel(id="s1", user_id="u1", title="Sessão"))
+            for i in range(turns):
+                db.add(Conversation(
+                    id=f"c{i:03d}", session_id="s1", prompt=f"pergunta {i} " + "x" * 400, response=f"resposta {i} " + "y" * 400,
+                    created_at=start + interval * i
+                ))
+            await db.commit()
+        return await run(session_factory)
+    finally:
+        await engine.dispose()
+
+
+async def _prompt_tokens(session_factory):
+    async with session_factory() as db:
+        session = await db.get(SessionModel, "s1")
+        contents = await context_service.build_contents(db, session, "nova pergunta")
+    return sum(context_service.count_tokens(part) for c in contents for part in c["parts"]), session
+
+
+def test_context_stays_within_budget_and_summarizes_old_turns(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_service, "CONTEXT_MAX_TOKENS", 2000)
+    monkeypatch.setattr(context_service, "CONTEXT_RECENT_TOKENS", 1000)
+    prompts = []
+
+    async def fake_generate(model_key, prompt, **kwargs):
+        prompts.append(prompt)
+        return f"resumo {len(prompts)}"
+
+    monkeypatch.setattr(llm_service, "generate", fake_generate)
+
+    async def run(session_factory):
+        before, _ = await _prompt_tokens(session_factory)
+        await context_service.summarize_session("s1")
+        after, session = await _prompt_tokens(session_factory)
+        return before, after, session
+
+    before, after, session = asyncio.run(_long_session(tmp_path, monkeypatch, 100, run))
+
+    assert before <= 2100
+    assert after <= 2100
+    # 100 conversas de ~206 tokens: 96 vão para o resumo em lotes de 40, 4 ficam na íntegra
+    assert len(prompts) == 3
+    assert session.summary == "resumo 3"
+    assert session.summarized_until == datetime(2025, 6, 1, 12, 0) + timedelta(minutes=95)
+
+
+def test_turns_sharing_the_last_summarized_timestamp_stay_in_the_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_service, "CONTEXT_RECENT_TOKENS", 1000)
+
+    async def fake_generate(model_key, prompt, **kwargs):
+        return "resumo"
+
+    monkeypatch.setattr(llm_service, "generate", fake_generate)
+
+    async def run(session_factory):
+        await context_service.summarize_session("s1")
+        _, session = await _prompt_tokens(session_factory)
+        async with session_factory() as db:
+            contents = await context_service.build_contents(db, session, "nova pergunta")
+        return session, contents
+
+    # Todas as conversas com o mesmo horário: 6 vão para o resumo, 4 ficam na íntegra
+    session, contents = asyncio.run(_long_session(tmp_path, monkeypatch, 10, run, interval=timedelta(0)))
+
+    assert session.summarized_until_id == "c005"
+    prompts = [c["parts"][0].split(" ")[1] for c in contents if c["role"] == "user"][1:-1]
+    assert prompts == ["6", "7", "8", "9"]
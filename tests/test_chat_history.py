@@ -0,0 +1,79 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base
+from models.conversation import Conversation
+from models.session import Session as SessionModel
+from services import chat_service
+
+
+async def _seed_and_run(tmp_path, sessions, conversations, run):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/history.db")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    queries = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        now = datetime(2025, 6, 1, 12, 0)
+        async with session_factory() as db:
+            for i in range(sessions):
+                session_id = f"s{i:03d}"
+                db.add(SessionModel(id=session_id, user_id="u1", title=f"Sessão {i}", created_at=now - timedelta(hours=i)))
+                for j in range(conversations):
+                    db.add(Conversation(
+                        id=str(uuid.uuid4()), session_id=session_id, prompt=f"p{j}", response=f"r{j}",
+                        created_at=now - timedelta(hours=i) + timedelta(minutes=j)
+                    ))
+            db.add(SessionModel(id="outro", user_id="u2", title="Outro usuário", created_at=now))
+            await db.commit()
+
+        queries.clear()
+        async with session_factory() as db:
+            return await run(db), queries
+    finally:
+        await engine.dispose()
+
+
+def test_history_uses_two_queries_regardless_of_session_count(tmp_path):
+    (sessions, next_cursor), queries = asyncio.run(_seed_and_run(
+        tmp_path, 30, 3, lambda db: chat_service.get_history_page(db, "u1")
+    ))
+
+    assert len(queries) == 2
+    assert len(sessions) == 30
+    assert next_cursor is None
+    assert [c.prompt for c in sessions[0]["conversations"]] == ["p0", "p1", "p2"]
+
+
+def test_history_keyset_pagination_and_conversation_cap(tmp_path):
+    async def walk_pages(db):
+        pages, cursor = [], None
+        while True:
+            sessions, cursor = await chat_service.get_history_page(
+                db, "u1", limit=4, cursor=cursor, conversations_per_session=2
+            )
+            pages.append(sessions)
+            if not cursor:
+                return pages
+
+    pages, _ = asyncio.run(_seed_and_run(tmp_path, 10, 5, walk_pages))
+
+    ids = [session["id"] for page in pages for session in page]
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert ids == [f"s{i:03d}" for i in range(10)]
+    assert all([c.prompt for c in session["conversations"]] == ["p3", "p4"] for page in pages for session in page)
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        chat_service.decode_cursor("nao-e-um-cursor")
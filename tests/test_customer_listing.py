@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import ExternalBase, get_async_external_db
+from models.external_data import ExternalCustomer, ExternalUser
+from routers import customer_router
+
+NAMES = ["Ana Souza", "André Lima", "Bruno Alves", "Carla Andrade", "Daniel Santos", "Eduarda Anjos"]
+
+
+@pytest.fixture
+def client(tmp_path):
+    # O banco externo usa o schema "public" do Postgres; no SQLite ele é omitido
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/external.db",
+        execution_options={"schema_translate_map": {"public": None}}
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def seed():
+        async with engine.begin() as connection:
+            await connection.run_sync(
+                ExternalBase.metadata.create_all, tables=[ExternalUser.__table__, ExternalCustomer.__table__]
+            )
+        async with session_factory() as db:
+            for i, name in enumerate(NAMES):
+                db.add(ExternalCustomer(id=f"c{i}", name=name, phone="119999", userId="u1", cpf="000"))
+            db.add(ExternalCustomer(id="x", name="Ana Outra", phone="0", userId="u2"))
+            await db.commit()
+
+    asyncio.run(seed())
+
+    async def override():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(customer_router.router)
+    app.dependency_overrides[get_async_external_db] = override
+    with TestClient(app) as test_client:
+        yield test_client
+    asyncio.run(engine.dispose())
+
+
+def test_keyset_pagination_walks_all_customers_without_private_fields(client):
+    names, cursor = [], None
+    while True:
+        params = {"user_id": "u1", "limit": 4}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/customers/", params=params)
+        assert response.status_code == 200
+        assert all("cpf" not in customer for customer in response.json())
+        names += [customer["name"] for customer in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert names == sorted(NAMES)
+
+
+def test_search_by_prefix_and_by_substring(client):
+    def search(term):
+        return [c["name"] for c in client.get("/customers/", params={"user_id": "u1", "search": term}).json()]
+
+    assert search("an") == ["Ana Souza", "André Lima"]
+    assert search("and") == ["André Lima", "Carla Andrade"]
+
+
+def test_unchanged_list_returns_304(client):
+    first = client.get("/customers/", params={"user_id": "u1"})
+    etag = first.headers["ETag"]
+
+    cached = client.get("/customers/", params={"user_id": "u1"}, headers={"If-None-Match": etag})
+    other_page = client.get("/customers/", params={"user_id": "u1", "limit": 2}, headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert other_page.status_code == 200
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from services import document_cache
+
+
+def _context(created_at, company="ACME"):
+    return {
+        "budget": {"id": "20250601", "name": "Cozinha", "categories": [], "total": 0.0, "createdAt": created_at},
+        "customer": {"id": "c1", "name": "Ana"},
+        "settings": {"id": "s1", "companyName": company},
+        "timedelta": None,
+    }
+
+
+def test_key_ignores_time_of_day_but_not_content():
+    morning = document_cache.document_key(_context(datetime(2025, 6, 1, 9, 0)), "pdf")
+
+    assert morning == document_cache.document_key(_context(datetime(2025, 6, 1, 17, 30)), "pdf")
+    assert morning != document_cache.document_key(_context(datetime(2025, 6, 2, 9, 0)), "pdf")
+    assert morning != document_cache.document_key(_context(datetime(2025, 6, 1, 9, 0), company="Outra"), "pdf")
+    assert morning != document_cache.document_key(_context(datetime(2025, 6, 1, 9, 0)), "docx")
+
+
+def test_template_version_checks_the_disk_at_most_once_per_interval(tmp_path, monkeypatch):
+    (tmp_path / "budget.html").write_text("v1")
+    monkeypatch.setattr(document_cache, "TEMPLATE_DIR", tmp_path)
+    monkeypatch.setattr(document_cache, "_template_checked_at", float("-inf"))
+    monkeypatch.setattr(document_cache, "TEMPLATE_CHECK_SECONDS", 60)
+    first = document_cache.template_version()
+
+    (tmp_path / "budget.html").write_text("v2 (alterado)")
+    assert document_cache.template_version() == first
+
+    monkeypatch.setattr(document_cache, "_template_checked_at", float("-inf"))
+    assert document_cache.template_version() != first
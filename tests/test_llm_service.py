@@ -0,0 +1,268 @@
+import asyncio
+import types
+
+import pytest
+import grpc
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import client as genai_client
+from google.generativeai import protos
+from google.generativeai.types import AsyncGenerateContentResponse
+
+from services import llm_service
+
+
+class FakeModel:
+    """Modelo falso que simula a latência do Gemini e registra a concorrência."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return types.SimpleNamespace(text=f"resposta: {prompt}", usage_metadata=None)
+        finally:
+            self.in_flight -= 1
+
+
+class FakeStreamingModel:
+    """Entrega as partes com um intervalo, como o streaming do Gemini."""
+
+    def __init__(self, parts, delay=0.01):
+        self.parts = parts
+        self.delay = delay
+
+    async def _chunks(self):
+        for text in self.parts:
+            await asyncio.sleep(self.delay)
+            yield protos.GenerateContentResponse(
+                candidates=[{"content": {"parts": [{"text": text}], "role": "model"}}]
+            )
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        return await AsyncGenerateContentResponse.from_aiterator(self._chunks())
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after):
+        self.calls = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.calls += 1
+        return self.calls > self.disconnect_after
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(llm_service, "GEMINI_API_KEY", "fake")
+    monkeypatch.setattr(llm_service, "_models", {llm_service.MODELS["chat"]: model})
+    monkeypatch.setattr(llm_service, "_semaphores", {})
+    monkeypatch.setattr(llm_service, "_buckets", {})
+    monkeypatch.setattr(llm_service, "_breakers", {})
+    monkeypatch.setattr(llm_service, "RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(llm_service, "DISCONNECT_POLL_SECONDS", 0.01)
+    return model
+
+
+def test_generate_runs_calls_concurrently_up_to_limit(fake_model, monkeypatch):
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY_CHAT", "10")
+
+    async def run():
+        return await asyncio.gather(*(llm_service.generate("chat", str(i)) for i in range(30)))
+
+    results = asyncio.run(run())
+
+    assert results[3] == "resposta: 3"
+    assert fake_model.max_in_flight == 10
+
+
+def test_generate_times_out(fake_model):
+    fake_model.delay = 1
+
+    with pytest.raises(llm_service.LLMTimeoutError):
+        asyncio.run(llm_service.generate("chat", "lento", timeout=0.05))
+
+
+def test_generate_is_cancelled_when_client_disconnects(fake_model):
+    fake_model.delay = 1
+
+    with pytest.raises(llm_service.LLMCancelledError):
+        asyncio.run(llm_service.generate("chat", "oi", http_request=FakeRequest(disconnect_after=2)))
+    assert fake_model.in_flight == 0
+
+
+def test_generate_without_api_key(monkeypatch):
+    monkeypatch.setattr(llm_service, "GEMINI_API_KEY", None)
+
+    with pytest.raises(llm_service.LLMNotConfiguredError):
+        asyncio.run(llm_service.generate("chat", "oi"))
+
+
+def test_stream_yields_each_part_as_it_arrives(fake_model, monkeypatch):
+    monkeypatch.setattr(llm_service, "_models", {llm_service.MODELS["chat"]: FakeStreamingModel(["Olá", ", ", "mundo"])})
+
+    async def run():
+        return [part async for part in llm_service.stream("chat", "oi")]
+
+    assert asyncio.run(run()) == ["Olá", ", ", "mundo"]
+
+
+def test_stream_times_out_between_parts(fake_model, monkeypatch):
+    monkeypatch.setattr(llm_service, "_models", {llm_service.MODELS["chat"]: FakeStreamingModel(["a", "b"], delay=0.5)})
+
+    async def run():
+        return [part async for part in llm_service.stream("chat", "oi", timeout=0.05)]
+
+    with pytest.raises(llm_service.LLMTimeoutError):
+        asyncio.run(run())
+
+
+class FlakyModel:
+    """Falha com os erros informados e depois responde normalmente."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return types.SimpleNamespace(text="ok", usage_metadata=None)
+
+
+def test_generate_retries_temporary_errors(fake_model, monkeypatch):
+    model = FlakyModel([google_exceptions.TooManyRequests("cota"), google_exceptions.ServiceUnavailable("fora")])
+    monkeypatch.setattr(llm_service, "_models", {llm_service.MODELS["chat"]: model})
+
+    assert asyncio.run(llm_service.generate("chat", "oi")) == "ok"
+    assert model.calls == 3
+
+
+def test_generate_does_not_retry_client_errors(fake_model, monkeypatch):
+    model = FlakyModel([google_exceptions.InvalidArgument("prompt inválido")])
+    monkeypatch.setattr(llm_service, "_models", {llm_service.MODELS["chat"]: model})
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        asyncio.run(llm_service.generate("chat", "oi"))
+    assert model.calls == 1
+
+
+def test_open_circuit_falls_back_to_next_model(fake_model, monkeypatch):
+    primary = FlakyModel([google_exceptions.ServiceUnavailable("fora")] * 10)
+    fallback = FlakyModel([])
+    monkeypatch.setattr(llm_service, "FALLBACK_MODELS", {"chat": ["modelo-reserva"]})
+    monkeypatch.setattr(llm_service, "_models", {llm_service.MODELS["chat"]: primary, "modelo-reserva": fallback})
+    monkeypatch.setattr(llm_service, "BREAKER_MIN_CALLS", 2)
+
+    assert asyncio.run(llm_service.generate("chat", "oi")) == "ok"
+    # Duas falhas abrem o circuito; a retentativa seguinte já vai para o reserva
+    assert (primary.calls, fallback.calls) == (2, 1)
+    assert llm_service._breakers[llm_service.MODELS["chat"]].state == "open"
+    # Todos os eventos da métrica têm os mesmos labels
+    assert all(
+        {name for name, _ in labels} == {"model", "use", "event"}
+        for labels in llm_service.telemetry.LLM_EVENTS._values
+    )
+
+
+def test_models_have_no_rate_limit_unless_configured(monkeypatch):
+    monkeypatch.setattr(llm_service, "_buckets", {})
+    monkeypatch.setattr(llm_service, "DEFAULT_RPM", None)
+    monkeypatch.setenv("LLM_RPM_GEMINI_1_5_FLASH", "1000")
+
+    assert llm_service._get_bucket("gemini-2.5-pro") is None
+    assert llm_service._get_bucket("gemini-1.5-flash").rate == pytest.approx(1000 / 60)
+
+
+def test_token_bucket_queues_requests_over_the_limit():
+    bucket = llm_service.TokenBucket(requests_per_minute=60)
+    bucket.tokens = 1
+
+    assert bucket.reserve(max_wait=5) == 0
+    assert bucket.reserve(max_wait=5) == pytest.approx(1, abs=0.01)
+    assert bucket.reserve(max_wait=5) == pytest.approx(2, abs=0.01)
+    with pytest.raises(llm_service.LLMRateLimitError):
+        bucket.reserve(max_wait=0.5)
+
+
+class FakeGemini:
+    """Servidor gRPC falso do Gemini: responde RESOURCE_EXHAUSTED às primeiras requisições."""
+
+    def __init__(self, rate_limited):
+        self.rate_limited = rate_limited
+        self.requests = 0
+
+    async def generate_content(self, request, context):
+        self.requests += 1
+        if self.requests <= self.rate_limited:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Quota exceeded")
+        return protos.GenerateContentResponse(
+            candidates=[{"content": {"parts": [{"text": f"falso: {request.model}"}], "role": "model"}}]
+        )
+
+    async def start(self) -> str:
+        self.server = grpc.aio.server()
+        self.server.add_generic_rpc_handlers([grpc.method_handlers_generic_handler(
+            "google.ai.generativelanguage.v1beta.GenerativeService",
+            {"GenerateContent": grpc.unary_unary_rpc_method_handler(
+                self.generate_content,
+                request_deserializer=protos.GenerateContentRequest.deserialize,
+                response_serializer=protos.GenerateContentResponse.serialize,
+            )},
+        )])
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        await self.server.start()
+        return f"127.0.0.1:{port}"
+
+
+def test_generate_against_fake_gemini_server(fake_model, monkeypatch):
+    fake = FakeGemini(rate_limited=2)
+    # A configuração do SDK e o loop ficam presos ao servidor falso: ambos são restaurados no fim
+    monkeypatch.setattr(genai_client, "_client_manager", genai_client._ClientManager())
+    monkeypatch.setattr(llm_service, "_endpoint_loop", None)
+
+    async def run():
+        monkeypatch.setattr(llm_service, "GEMINI_API_ENDPOINT", await fake.start())
+        try:
+            return await llm_service.generate("chat", "oi")
+        finally:
+            await fake.server.stop(None)
+
+    assert asyncio.run(run()) == f"falso: models/{llm_service.MODELS['chat']}"
+    assert fake.requests == 3
+    assert genai_client._client_manager.client_config["transport"].__class__.__name__ == "GenerativeServiceGrpcAsyncIOTransport"
+
+
+def test_response_schema_inlines_refs_and_drops_unsupported_fields():
+    from pydantic import BaseModel, Field
+
+    class Item(BaseModel):
+        name: str
+        price: float = Field(ge=0)
+
+    class Order(BaseModel):
+        items: list[Item]
+        total: float = 0.0
+
+    assert llm_service.response_schema(Order) == {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"name": {"type": "string"}, "price": {"type": "number"}},
+                    "required": ["name", "price"],
+                },
+            },
+            "total": {"type": "number"},
+        },
+        "required": ["items"],
+    }
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from services import reference_cache
+from services.reference_cache import ReferenceCache
+
+
+class Row(BaseModel):
+    id: str
+
+
+@pytest.fixture(autouse=True)
+def invalidations_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(reference_cache, "INVALIDATIONS_DIR", tmp_path)
+    monkeypatch.setattr(reference_cache, "REFERENCE_CACHE_SYNC_SECONDS", 0)
+
+
+def _cache(**options):
+    calls = []
+
+    async def load_many(keys):
+        calls.append(sorted(keys))
+        await asyncio.sleep(0.01)
+        return {key: Row(id=key) for key in keys if not key.startswith("x")}
+
+    return ReferenceCache("test", load_many, **options), calls
+
+
+def test_concurrent_misses_share_one_fetch_and_batches_fetch_only_missing_keys():
+    cache, calls = _cache()
+
+    async def scenario():
+        first = await asyncio.gather(*(cache.get("c1") for _ in range(10)))
+        assert all(row == Row(id="c1") for row in first)
+        rows = await cache.get_many(["c1", "c2", "c3", "x9", "c2"])
+        assert sorted(rows) == ["c1", "c2", "c3"]
+        # Inexistentes também ficam em cache
+        assert await cache.get("x9") is None
+
+    asyncio.run(scenario())
+    assert calls == [["c1"], ["c2", "c3", "x9"]]
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_ttl_and_invalidation_force_a_new_fetch():
+    cache, calls = _cache(ttl=0.05)
+
+    async def scenario():
+        await cache.get("c1")
+        await cache.get("c1")
+        await asyncio.sleep(0.06)
+        await cache.get("c1")
+        await cache.invalidate("c1")
+        await cache.get("c1")
+
+    asyncio.run(scenario())
+    assert calls == [["c1"], ["c1"], ["c1"]]
+
+
+def test_fetch_running_during_an_invalidation_is_not_cached():
+    cache, calls = _cache()
+
+    async def scenario():
+        fetch = asyncio.ensure_future(cache.get("c1"))
+        await asyncio.sleep(0)
+        await cache.invalidate("c1")
+        assert await fetch == Row(id="c1")
+        await cache.get("c1")
+
+    asyncio.run(scenario())
+    assert calls == [["c1"], ["c1"]]
+
+def test_invalidation_reaches_other_processes():
+    # Duas instâncias com o mesmo nome fazem o papel de dois workers
+    worker, calls = _cache()
+    other_worker, _ = _cache()
+
+    async def scenario():
+        await worker.get("c1")
+        await worker.get("c2")
+        await other_worker.invalidate("c1")
+        await worker.get("c1")
+        await worker.get("c2")
+        await other_worker.invalidate()
+        await worker.get("c2")
+
+    asyncio.run(scenario())
+    assert calls == [["c1"], ["c2"], ["c1"], ["c2"]]
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+
+from services import render_service
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Um worker, sem fila e sem o aquecimento do WeasyPrint
+    monkeypatch.setattr(render_service, "RENDER_QUEUE_SIZE", 0)
+    monkeypatch.setattr(render_service, "RENDER_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(render_service, "_in_flight", 0)
+    render_service.start(workers=1, warm_up=False)
+    yield
+    render_service.shutdown()
+
+
+async def _wait_until(condition, seconds=10):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.05)
+
+
+def test_rejects_renders_when_queue_is_full(pool):
+    async def run():
+        first = asyncio.ensure_future(render_service._submit(time.sleep, 1, 10, "PDF"))
+        await asyncio.sleep(0)
+        with pytest.raises(render_service.RenderQueueFullError):
+            await render_service._submit(len, "abc", 10, "PDF")
+        await first
+        await _wait_until(lambda: render_service._in_flight == 0)
+        return await render_service._submit(len, "abc", 10, "PDF")
+
+    assert asyncio.run(run()) == 3
+    assert render_service._in_flight == 0
+
+
+def test_timeout_keeps_slot_until_stuck_worker_is_killed(pool):
+    async def run():
+        # Garante o worker já iniciado, para a tarefa lenta estar em execução no timeout
+        await render_service._submit(len, "", 10, "PDF")
+        stuck_pool = render_service._executor
+        processes = list(stuck_pool._processes.values())
+
+        with pytest.raises(render_service.RenderTimeoutError):
+            await render_service._submit(time.sleep, 30, 1, "PDF")
+        # O worker continua ocupado: a vaga não volta e a fila (capacidade 1) está cheia
+        assert render_service._in_flight == 1
+        assert render_service._executor is not stuck_pool
+
+        # Após RENDER_TIMEOUT_SECONDS o processo preso é morto e a vaga é liberada
+        await _wait_until(lambda: render_service._in_flight == 0)
+        await _wait_until(lambda: not any(process.is_alive() for process in processes))
+        assert stuck_pool not in render_service._retired
+
+        # Os próximos renders usam um pool novo
+        return await render_service._submit(len, "abc", 10, "PDF")
+
+    assert asyncio.run(run()) == 3
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base, ExternalBase
+from models.external_data import ExternalBudget, ExternalCategory, ExternalProduct, ExternalUser
+from models.sales_rollup import SalesRollupDay, SalesRollupItem, SalesRollupState, SalesRollupUser
+from services import analysis_service, sales_rollup_service
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+def _budget(budget_id, days_ago, total, status="Aceito", items=(("Cozinha", ["Armário", "Pia"]),), user_id="u1"):
+    budget = ExternalBudget(
+        id=budget_id, name=budget_id, status=status, userId=user_id, total=total,
+        createdAt=NOW - timedelta(days=days_ago), updatedAt=NOW - timedelta(days=days_ago)
+    )
+    budget.categories = [
+        ExternalCategory(id=f"{budget_id}-{name}", name=name, products=[
+            ExternalProduct(id=f"{budget_id}-{name}-{product}", name=product, price=1) for product in products
+        ])
+        for name, products in items
+    ]
+    return budget
+
+
+def test_rollups_match_external_queries_and_sync_incrementally(tmp_path):
+    external = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/external.db",
+        execution_options={"schema_translate_map": {"public": None}}
+    )
+    local = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/local.db")
+    external_sessions = async_sessionmaker(external, expire_on_commit=False)
+    local_sessions = async_sessionmaker(local, expire_on_commit=False)
+
+    async def scenario():
+        async with external.begin() as connection:
+            await connection.run_sync(ExternalBase.metadata.create_all, tables=[
+                ExternalUser.__table__, ExternalBudget.__table__, ExternalCategory.__table__, ExternalProduct.__table__
+            ])
+        async with local.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all, tables=[
+                SalesRollupDay.__table__, SalesRollupItem.__table__, SalesRollupUser.__table__, SalesRollupState.__table__
+            ])
+        async with external_sessions() as edb:
+            edb.add_all([
+                ExternalUser(id="u1", name="Ana"),
+                ExternalUser(id="u2", name="Bruno"),
+                _budget("b1", 0, 1000),
+                _budget("b2", 3, 500, items=(("Cozinha", ["Pia"]), ("Quarto", ["Cama"]))),
+                _budget("b3", 3, 800, status="Negado"),
+                _budget("b4", 40, 300),
+                _budget("b5", 1, 50, user_id="u2"),
+            ])
+            await edb.commit()
+        async with local_sessions() as db:
+            db.add(SalesRollupState(id=1))
+            await db.commit()
+
+        async with local_sessions() as db, external_sessions() as edb:
+            assert await sales_rollup_service.sync(db, edb) == {"full": True, "users": 2, "days": 4}
+            expected = await analysis_service.get_sales_trends_data(edb, "u1", days_to_analyze=30)
+            actual = await sales_rollup_service.get_sales_trends_data(db, "u1", days_to_analyze=30)
+            assert actual == expected
+            assert actual["summary"]["approved_budgets_count"] == 2
+            assert actual["top_products"][0] == {"name": "Pia", "count": 2}
+            first_fingerprint = await sales_rollup_service.get_sales_trends_fingerprint(db, "u2")
+
+            # Só o orçamento alterado é buscado; os dias dele são recalculados por inteiro
+            await edb.execute(
+                update(ExternalBudget).where(ExternalBudget.id == "b2").values(status="Negado", updatedAt=NOW + timedelta(seconds=1))
+            )
+            new_budget = _budget("b6", 0, 200)
+            new_budget.updatedAt = NOW + timedelta(seconds=2)
+            edb.add(new_budget)
+            await edb.commit()
+
+            assert await sales_rollup_service.sync(db, edb) == {"full": False, "users": 1, "days": 2}
+            actual = await sales_rollup_service.get_sales_trends_data(db, "u1", days_to_analyze=30, include_daily_series=True)
+            assert actual["summary"] == {"approved_budgets_count": 2, "total_sales_value": 1200, "average_budget_value": 600}
+            assert actual["top_categories"] == [{"name": "Cozinha", "count": 2}]
+            assert [point["approved_budgets_count"] for point in actual["daily_series"]] == [2]
+            assert (await sales_rollup_service.get_sales_trends_data(db, "u1", days_to_analyze=1))["summary"]["approved_budgets_count"] == 2
+            assert await sales_rollup_service.get_sales_trends_fingerprint(db, "u2") == first_fingerprint
+
+            # Gravado depois do sync, mas com updatedAt anterior ao watermark (transação lenta)
+            late_budget = _budget("b7", 10, 100)
+            late_budget.updatedAt = NOW + timedelta(seconds=1)
+            edb.add(late_budget)
+            await edb.commit()
+
+            assert (await sales_rollup_service.sync(db, edb))["days"] == 3
+            actual = await sales_rollup_service.get_sales_trends_data(db, "u1", days_to_analyze=30)
+            assert actual["summary"]["approved_budgets_count"] == 3
+
+        await external.dispose()
+        await local.dispose()
+
+    asyncio.run(scenario())
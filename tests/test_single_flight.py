@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight, SingleFlightTimeoutError
+
+
+def test_concurrent_calls_share_one_execution_and_its_errors():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.02)
+        if value == "erro":
+            raise ValueError("falhou")
+        return value
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("a", lambda: compute("a")) for _ in range(5)))
+        assert results == ["a"] * 5
+        errors = await asyncio.gather(*(flight.do("b", lambda: compute("erro")) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(error, ValueError) for error in errors)
+        # A chave é liberada ao terminar: uma nova chamada executa de novo
+        assert await flight.do("a", lambda: compute("a")) == "a"
+
+    asyncio.run(scenario())
+    assert calls == ["a", "erro", "a"]
+    assert flight.stats() == {"in_flight": 0, "executions": 3, "shared": 6}
+
+
+def test_waiter_timeout_keeps_the_execution_until_nobody_waits():
+    flight = SingleFlight("test")
+    finished = []
+
+    async def compute():
+        try:
+            await asyncio.sleep(0.05)
+            finished.append(True)
+            return "ok"
+        except asyncio.CancelledError:
+            finished.append(False)
+            raise
+
+    async def scenario():
+        impatient = flight.do("k", compute, timeout=0.01)
+        patient = flight.do("k", compute)
+        results = await asyncio.gather(impatient, patient, return_exceptions=True)
+        assert isinstance(results[0], SingleFlightTimeoutError)
+        assert results[1] == "ok"
+
+        with pytest.raises(SingleFlightTimeoutError):
+            await flight.do("k", compute, timeout=0.01)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert finished == [True, False]
@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import telemetry
+
+
+def test_middleware_reports_phases_tokens_and_metrics(capsys):
+    app = FastAPI()
+    app.add_middleware(telemetry.TimingMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        with telemetry.span("db"):
+            pass
+        usage = SimpleNamespace(prompt_token_count=1000, candidates_token_count=200)
+        telemetry.record_llm_call("budget", "gemini-1.5-pro-002", usage, 0.5)
+        return {"id": item_id}
+
+    response = TestClient(app).get("/items/42")
+
+    timing = response.headers["server-timing"]
+    assert 'db;dur=' in timing and 'desc="1x"' in timing and "total;dur=" in timing
+
+    log = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert log["route"] == "/items/{item_id}" and log["status"] == 200
+    assert log["llm_input_tokens"] == 1000 and log["llm_output_tokens"] == 200
+    assert log["llm_cost_usd"] == round((1000 * 1.25 + 200 * 5.0) / 1_000_000, 6)
+
+    metrics = telemetry.render_metrics()
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"} 1' in metrics
+    assert 'llm_tokens_total{kind="input",model="gemini-1.5-pro-002",use="budget"} 1000' in metrics
+
+
+def test_span_outside_a_request_is_ignored():
+    with telemetry.span("render"):
+        pass
+    assert telemetry._current_trace.get() is None
+
+
+def test_instrumented_engine_times_failed_and_successful_queries():
+    engine = create_engine("sqlite://")
+    telemetry.instrument_engine(engine)
+    trace = telemetry.RequestTrace()
+    token = telemetry._current_trace.set(trace)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(exc.OperationalError):
+                conn.execute(text("SELECT * FROM inexistente"))
+            conn.execute(text("SELECT 1"))
+    finally:
+        telemetry._current_trace.reset(token)
+
+    assert trace.phases["db"][1] == 2
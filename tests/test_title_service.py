@@ -0,0 +1,14 @@
+from services import title_service
+
+
+def test_heuristic_title_uses_first_sentence_and_word_cap():
+    assert title_service.heuristic_title("  quanto custa uma cozinha em L? Tenho 3 metros de parede") == "Quanto custa uma cozinha em L"
+    assert title_service.heuristic_title("um dois três quatro cinco seis sete oito nove dez") == "Um dois três quatro cinco seis sete oito"
+    assert title_service.heuristic_title("   ") == "Nova conversa"
+
+
+def test_clean_title_strips_decorations_and_caps_length():
+    assert title_service.clean_title('**Título: "Orçamento de cozinha planejada".**\nOutra linha') == "Orçamento de cozinha planejada"
+    long_title = title_service.clean_title("palavra " * 20)
+    assert len(long_title) <= title_service.TITLE_MAX_CHARS + 3
+    assert long_title.endswith("...")